@@ -3,10 +3,15 @@ import pandas as pd
 import plotly.express as px
 import os
 from dotenv import load_dotenv
-from gold_tracker.data_fetcher import get_global_gold_price, get_usd_vnd_rate, get_sjc_gold_price, fetch_gold_news
-from gold_tracker.calculator import calculate_converted_global_price, calculate_gap
-from gold_tracker.llm_analyzer import get_gold_market_analysis
-from gold_tracker.storage import save_snapshot, get_history, init_db
+from gold_tracker.orchestrator import fetch_all_sources, format_source_status, is_fresh
+from gold_tracker.data_fetcher import NEWS_LIMIT, fetch_gold_news, format_headlines
+from gold_tracker.collector import PRICE_SOURCES, build_snapshot, get_stale_after
+from gold_tracker.llm_analyzer import ReportGenerationError, stream_gold_market_analysis, select_news
+from gold_tracker.storage import get_history, get_latest_snapshot, get_news, init_db, get_gap_stats
+from gold_tracker.write_behind import save_snapshot_async, save_report_async
+from gold_tracker.shared_cache import get_shared_cache
+from gold_tracker import metrics
+from gold_tracker.downsample import CHART_POINTS, downsample_frame
 
 # Load env
 load_dotenv()
@@ -16,48 +21,100 @@ st.set_page_config(page_title="Vietnam Gold Tracker AI", page_icon="img/logo.png
 # Initialize DB
 init_db()
 
+# Cache dùng chung giữa các replica (file SQLite trên volume chung, xem SHARED_CACHE_FILE)
+shared_cache = get_shared_cache()
+LIVE_DATA_TTL = 300
+NEWS_TTL = 300
+NO_NEWS_TEXT = "Không có tin tức vàng/kinh tế mới nhất được lấy."
+
 st.title("Vietnam Gold Price Tracker & AI Forecaster")
 st.markdown("Theo dõi giá vàng theo thời gian thực, quy đổi và phân tích thị trường bằng trí tuệ nhân tạo.")
 
 # Main Logic
 if st.button("🔄 Cập nhật dữ liệu ngay"):
     st.cache_data.clear()
+    shared_cache.invalidate("live_data")
+    shared_cache.invalidate("news")
     st.rerun()
 
-st.caption("Tự động cập nhật mỗi 5 phút.")
-@st.cache_data(ttl=300)  # Cache data for 5 minutes
-def fetch_data():
-    global_price = get_global_gold_price()
-    exchange_rate = get_usd_vnd_rate()
-    sjc_data = get_sjc_gold_price()
+@st.cache_data(ttl=60)
+def load_latest_snapshot():
+    return get_latest_snapshot()
+
+@st.cache_data(ttl=60)
+def load_stale_after():
+    # Theo chu kỳ collector đã ghi vào database, không theo biến môi trường của dashboard
+    return get_stale_after()
+
+def _fetch_news():
     news = fetch_gold_news()
-    
-    # Mock fallbacks if fetch fails
-    if global_price is None: global_price = 2600.0
-    if exchange_rate is None: exchange_rate = 25400.0
-    if sjc_data is None: sjc_data = {'buy': 83000000, 'sell': 85000000}
-    
-    return global_price, exchange_rate, sjc_data, news
-
-# Fetch Data
-global_price, exchange_rate, sjc_data, news = fetch_data()
-
-# Calculate
-converted_price = calculate_converted_global_price(global_price, exchange_rate)
-gap = calculate_gap(sjc_data['sell'], converted_price)
-
-# Tự động lưu snapshot khi dữ liệu thay đổi đáng kể hoặc mỗi 5 phút
-if 'last_save' not in st.session_state or (pd.Timestamp.now() - st.session_state.last_save).seconds > 300:
-    save_snapshot({
-        "global_price": global_price,
-        "exchange_rate": exchange_rate,
-        "sjc_sell": sjc_data['sell'],
-        "sjc_buy": sjc_data['buy'],
-        "converted_price": converted_price,
-        "gap": gap,
-        "ai_report": "" # No report for auto-saves
-    })
-    st.session_state.last_save = pd.Timestamp.now()
+    if news is None: news = NO_NEWS_TEXT
+    return news
+
+def fetch_news():
+    # Chỉ dùng khi collector không chạy. Một replica lấy tin mỗi 5 phút; các replica khác đọc lại từ cache dùng chung
+    return shared_cache.get_or_compute("news", NEWS_TTL, _fetch_news)
+
+@st.cache_data(ttl=60)
+def load_stored_news():
+    # Tiêu đề do collector lưu vào bảng news
+    return format_headlines(get_news(limit=NEWS_LIMIT)) or NO_NEWS_TEXT
+
+def _fetch_live_data():
+    # Chỉ dùng khi collector không chạy; dữ liệu này không được lưu vào lịch sử.
+    result = fetch_all_sources(sources=PRICE_SOURCES)
+    market = result['values']['market'] or {}
+    global_price = market.get('global_price')
+    exchange_rate = market.get('exchange_rate')
+    sjc_data = result['values']['sjc_data']
+
+    # Nguồn lỗi trả về giá trị thật gần nhất (status 'stale'); không có thì không hiển thị.
+    if global_price is None or exchange_rate is None or sjc_data is None:
+        return None, result
+    return build_snapshot(global_price, exchange_rate, sjc_data), result
+
+def fetch_live_data():
+    return shared_cache.get_or_compute("live_data", LIVE_DATA_TTL, _fetch_live_data)
+
+# Khoảng thời gian của biểu đồ xu hướng (số ngày, None = toàn bộ lịch sử)
+TREND_RANGES = {"1 ngày": 1, "7 ngày": 7, "30 ngày": 30, "1 năm": 365, "Tất cả": None}
+
+@st.cache_data(ttl=60)
+def load_trend(days):
+    # Đọc toàn bộ khoảng thời gian rồi giảm còn CHART_POINTS điểm mỗi đường trước khi gửi tới trình duyệt.
+    start = pd.Timestamp.now() - pd.Timedelta(days=days) if days is not None else None
+    history_df = get_history(limit=None, start=start, columns=['sjc_sell_price', 'converted_price'], expand_runs=True)
+    if history_df.empty:
+        return history_df, 0
+    history_df['sjc_sell_million'] = history_df['sjc_sell_price'] / 1_000_000
+    trend_df = downsample_frame(history_df, 'timestamp', ['sjc_sell_million', 'converted_price'], CHART_POINTS)
+    return trend_df, len(history_df)
+
+# Dashboard chỉ đọc dữ liệu do collector (`python main.py collect`) ghi vào database.
+snapshot = load_latest_snapshot()
+# Giá không đổi giữa các lần thu thập chỉ kéo dài dòng cũ, nên độ mới tính theo valid_until.
+if snapshot and (pd.Timestamp.now() - snapshot['valid_until']).total_seconds() <= load_stale_after():
+    snapshot_ts = snapshot['timestamp']
+    st.caption(f"Dữ liệu cập nhật lúc {snapshot['valid_until']:%H:%M:%S %d/%m/%Y} bởi collector.")
+else:
+    snapshot_ts = None
+    snapshot, fetch_result = fetch_live_data()
+    st.warning("Collector không chạy hoặc dữ liệu đã cũ — đang hiển thị dữ liệu lấy trực tiếp. "
+               "Chạy `python main.py collect` để cập nhật lịch sử.")
+    st.caption(f"Nguồn dữ liệu: {format_source_status(fetch_result)}")
+    if snapshot is None:
+        st.error("Không lấy được dữ liệu giá và chưa có dữ liệu lịch sử nào để hiển thị.")
+        st.stop()
+    for name, info in fetch_result['sources'].items():
+        if info['status'] == 'stale':
+            st.warning(f"Nguồn {name} đang lỗi — hiển thị giá gần nhất lúc {info['as_of']:%H:%M %d/%m/%Y}.")
+
+global_price = snapshot['global_price']
+exchange_rate = snapshot['exchange_rate']
+sjc_data = {'sell': snapshot['sjc_sell'], 'buy': snapshot['sjc_buy']}
+converted_price = snapshot['converted_price']
+gap = snapshot['gap']
+news = load_stored_news() if snapshot_ts is not None else fetch_news()
 
 # Display Metrics
 # Row 1
@@ -79,6 +136,16 @@ with col5:
 with col6:
     st.metric("Chênh lệnh", f"{gap:.2f} Triệu VND", delta_color="inverse", border=True)
 
+# Thống kê chênh lệch lịch sử (đã được tính sẵn khi lưu snapshot)
+gap_stats = get_gap_stats().get('gap')
+if gap_stats and gap_stats['count']:
+    zscore = f"{gap_stats['zscore']:+.2f}" if gap_stats['zscore'] is not None else "—"
+    st.caption(
+        f"Chênh lệch lịch sử ({gap_stats['count']} snapshot): TB 1 ngày {gap_stats['ewma']:.2f} Triệu VND · "
+        f"P10–P90 {gap_stats['p10']:.2f}–{gap_stats['p90']:.2f} · "
+        f"Thấp/Cao {gap_stats['min']:.2f}/{gap_stats['max']:.2f} · Z-score {zscore}"
+    )
+
 st.divider()
 
 # Charts & Analysis
@@ -86,40 +153,45 @@ row1 = st.columns(1)[0]
 with row1:
     st.subheader("🧠 AI Market Analysis")
     if st.button("Phân tích thị trường hiện tại"):
-        with st.spinner("AI đang phân tích thị trường..."):
-            data_context = {
-                "global_price": global_price,
-                "exchange_rate": exchange_rate,
-                "converted_price": converted_price,
-                "sjc_price": sjc_data['sell'],
-                "gap": gap,
-                "news": news
-            }
-            
-            report = get_gold_market_analysis(data_context)
-            st.markdown(report)
-            
-            # Save snapshot with report
-            save_snapshot({
-                "global_price": global_price,
-                "exchange_rate": exchange_rate,
-                "sjc_sell": sjc_data['sell'],
-                "sjc_buy": sjc_data['buy'],
-                "converted_price": converted_price,
-                "gap": gap,
-                "ai_report": report
-            })
-            st.success("Báo cáo đã được tạo và lưu trữ trong lịch sử!")
+        # Tiêu đề do collector lưu; khi collector không chạy, bảng news có thể đã cũ nên dùng tin vừa lấy.
+        prompt_news, news_rowid = select_news(fallback=news) if snapshot_ts is not None else (news, None)
+        data_context = {
+            "global_price": global_price,
+            "exchange_rate": exchange_rate,
+            "converted_price": converted_price,
+            "sjc_price": sjc_data['sell'],
+            "gap": gap,
+            "news": prompt_news,
+            "news_rowid": news_rowid,
+            "gap_stats": get_gap_stats()
+        }
+
+        # Hiển thị báo cáo ngay khi model sinh ra từng đoạn
+        try:
+            report = st.write_stream(stream_gold_market_analysis(data_context))
+        except ReportGenerationError as e:
+            # Báo cáo lỗi hoặc dở dang không được lưu; snapshot vẫn chờ backfill-reports.
+            st.error(f"Không tạo được báo cáo AI: {e}")
+        else:
+            # Gắn báo cáo vào snapshot của collector, hoặc lưu snapshot mới nếu dữ liệu trực tiếp còn mới.
+            # Dữ liệu cũ (nguồn lỗi) không bao giờ được lưu như một snapshot mới.
+            if snapshot_ts is not None:
+                save_report_async(snapshot_ts, report, news_rowid)
+                st.success("Báo cáo đã được tạo và lưu trữ trong lịch sử!")
+            elif is_fresh(fetch_result):
+                save_snapshot_async(dict(snapshot, ai_report=report, news_rowid=news_rowid))
+                st.success("Báo cáo đã được tạo và lưu trữ trong lịch sử!")
+            else:
+                st.info("Báo cáo không được lưu vì một số nguồn giá đang dùng dữ liệu cũ.")
 
 row2 = st.columns(1)[0]
 with row2:
     st.subheader("📈 Xu hướng thị trường")
-    history_df = get_history(limit=50)
-    if not history_df.empty:
-        history_df['sjc_sell_million'] = history_df['sjc_sell_price'] / 1_000_000
-        
+    trend_range = st.radio("Khoảng thời gian", list(TREND_RANGES), index=1, horizontal=True)
+    trend_df, total_points = load_trend(TREND_RANGES[trend_range])
+    if not trend_df.empty:
         # Plotly Chart
-        fig = px.line(history_df, x='timestamp', y=['sjc_sell_million', 'converted_price'], 
+        fig = px.line(trend_df, x='timestamp', y='value', color='variable',
                       labels={'value': 'Giá (Triệu VND/Lượng)', 'timestamp': 'Thời gian', 'variable': 'Loại giá'},
                       title="Giá vàng SJC vs Giá vàng thế giới (Quy đổi sang VND)")
         
@@ -128,6 +200,8 @@ with row2:
         fig.for_each_trace(lambda t: t.update(name = new_names.get(t.name, t.name)))
         
         st.plotly_chart(fig, use_container_width=True)
+        if total_points > CHART_POINTS:
+            st.caption(f"Hiển thị {CHART_POINTS} trên {total_points:,} điểm mỗi đường (giảm mẫu LTTB, giữ nguyên đỉnh/đáy).")
     else:
         st.info("Chưa có dữ liệu lịch sử. Dữ liệu sẽ được xây dựng khi bạn sử dụng ứng dụng.")
 
@@ -136,6 +210,24 @@ with row3:
     st.subheader("📰 Tin tức thị trường")
     st.markdown(news)
     
+with st.expander("🔧 Chẩn đoán hiệu năng"):
+    if not metrics.is_enabled():
+        st.caption("Metrics đang tắt. Đặt GOLD_METRICS=1 để ghi thời gian fetch, parse, cache, LLM và SQLite.")
+    else:
+        diagnostics = metrics.snapshot()
+        if diagnostics['histograms']:
+            st.dataframe(pd.DataFrame([
+                {'metric': h['name'], 'labels': ", ".join(f"{k}={v}" for k, v in h['labels'].items()),
+                 'count': h['count'], 'mean ms': round(h['mean_ms'], 2), 'max ms': round(h['max_ms'], 2)}
+                for h in diagnostics['histograms']
+            ]), hide_index=True, use_container_width=True)
+        if diagnostics['counters']:
+            st.dataframe(pd.DataFrame([
+                {'metric': c['name'], 'labels': ", ".join(f"{k}={v}" for k, v in c['labels'].items()), 'value': c['value']}
+                for c in diagnostics['counters']
+            ]), hide_index=True, use_container_width=True)
+        st.download_button("Tải metrics (Prometheus)", metrics.render_prometheus(), file_name="gold_metrics.prom")
+
 # Footer
 st.markdown("---")
 st.caption("Dữ liệu nguồn: yfinance, Web scraping (SJC). Phân tích bởi OpenRouter LLMs. Đây chỉ là tin tức không phải là lời khuyên tài chính. ^^!")
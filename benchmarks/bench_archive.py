@@ -0,0 +1,86 @@
+"""
+Benchmark archive dạng cột cho lịch sử snapshot.
+
+Ghi N snapshot 5 phút vào SQLite, đo đọc toàn bộ lịch sử, lịch sử gộp theo giờ và
+`limit` dòng mới nhất; sau đó chuyển mọi ngày trừ ngày cuối sang archive (Arrow, đọc
+bằng memory map) và đo lại. Kiểm tra kết quả trước/sau trùng khớp và in dung lượng
+database so với archive.
+
+Chạy: python -m benchmarks.bench_archive [--rows 100000] [--reads 5]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_storage import _snapshots
+from gold_tracker.storage import StorageEngine
+
+COLUMNS = ['sjc_sell_price', 'converted_price', 'gap']
+
+
+def _db_bytes(db_file):
+    return sum(os.path.getsize(path) for path in (db_file, f"{db_file}-wal") if os.path.exists(path))
+
+
+def _best_ms(read, reads):
+    best, result = float("inf"), None
+    for _ in range(reads):
+        start = time.perf_counter()
+        result = read()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, result
+
+
+def _queries(engine):
+    return {
+        "full history": lambda: engine.get_history(limit=None, columns=COLUMNS),
+        "hourly buckets": lambda: engine.get_history(limit=None, bucket='1h', columns=COLUMNS),
+        "latest 500": lambda: engine.get_history(limit=500, columns=COLUMNS),
+    }
+
+
+def _same(left, right):
+    if len(left) != len(right):
+        return False
+    numeric = [c for c in left.columns if c != 'timestamp']
+    return (left['timestamp'].reset_index(drop=True).equals(right['timestamp'].reset_index(drop=True))
+            and np.allclose(left[numeric].to_numpy(float), right[numeric].to_numpy(float), equal_nan=True))
+
+
+def run(rows, reads):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench.db")
+        engine = StorageEngine(db_file, archive_dir=os.path.join(tmp, "archive"))
+        engine.save_many(_snapshots(rows))
+        engine.connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        db_before = _db_bytes(db_file)
+
+        before = {name: _best_ms(read, reads) for name, read in _queries(engine).items()}
+
+        start = time.perf_counter()
+        moved = engine.archive_snapshots(older_than_days=0)
+        archive_s = time.perf_counter() - start
+        db_after = _db_bytes(db_file)
+        archive_bytes = engine.archive.size_bytes()
+
+        after = {name: _best_ms(read, reads) for name, read in _queries(engine).items()}
+        engine.close()
+
+    print(f"{rows:,} snapshots, {moved:,} archived in {archive_s:.2f}s")
+    print(f"{'query':16}{'sqlite ms':>11}{'archive ms':>12}{'same':>6}")
+    for name in before:
+        (sqlite_ms, expected), (archive_ms, actual) = before[name], after[name]
+        print(f"{name:16}{sqlite_ms:>11.1f}{archive_ms:>12.1f}{'yes' if _same(expected, actual) else 'NO':>6}")
+    print(f"{'database KiB':16}{db_before / 1024:>11,.0f}{db_after / 1024:>12,.0f}")
+    print(f"{'archive KiB':16}{'':>11}{archive_bytes / 1024:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar archive benchmark")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--reads", type=int, default=5)
+    args = parser.parse_args()
+    run(args.rows, args.reads)
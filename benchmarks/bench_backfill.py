@@ -0,0 +1,77 @@
+"""
+Benchmark backfill báo cáo AI hàng loạt.
+
+Dùng model giả có độ trễ cố định (không gọi mạng) trên database tạm chứa N snapshot
+chưa có báo cáo, so sánh thông lượng (báo cáo/phút) khi chạy tuần tự với khi chạy
+đồng thời, có và không có giới hạn tốc độ. Một phần request được cho lỗi ở lần gọi
+đầu để kiểm tra cơ chế thử lại.
+
+Chạy: python -m benchmarks.bench_backfill [--snapshots 60] [--latency-ms 200] [--fail-every 7]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from benchmarks.bench_storage import _snapshots
+from gold_tracker import llm_analyzer
+from gold_tracker.backfill import abackfill_reports
+from gold_tracker.storage import StorageEngine
+
+FAKE_REPORT = "## Báo cáo thị trường vàng\n\nNeutral."
+
+
+class _SlowFakeChat(FakeListChatModel):
+    # Model giả: chờ `latency` giây rồi trả lời; lần gọi thứ fail_every, 2*fail_every, ... bị lỗi.
+    latency: float = 0.2
+    fail_every: int = 0
+    calls: int = 0
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.latency)
+        if self.fail_every and call % self.fail_every == 0:
+            raise ConnectionError("injected failure")
+        return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+# Tên kịch bản -> (số request đồng thời, request/giây hoặc None nếu không giới hạn)
+SCENARIOS = {
+    "sequential": (1, None),
+    "concurrent x4": (4, None),
+    "concurrent x16": (16, None),
+    "concurrent x16, 10 req/s": (16, 10.0),
+}
+
+
+def run(snapshots, latency_ms, fail_every):
+    print(f"{snapshots} snapshots, fake LLM latency {latency_ms:g} ms, every {fail_every or '-'}th call fails once")
+    print(f"{'scenario':28}{'saved':>7}{'failed':>8}{'calls':>7}{'seconds':>9}{'reports/min':>13}")
+    for name, (concurrency, rate) in SCENARIOS.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = StorageEngine(os.path.join(tmp, "bench.db"), archive_dir=os.path.join(tmp, "archive"))
+            engine.save_many(_snapshots(snapshots))
+            llm = _SlowFakeChat(
+                responses=[FAKE_REPORT], latency=latency_ms / 1000, fail_every=fail_every,
+                rate_limiter=llm_analyzer.make_rate_limiter(rate, burst=1) if rate else None,
+            )
+            chain = llm_analyzer.build_batch_chain(llm, retries=2)
+            stats = asyncio.run(abackfill_reports(concurrency=concurrency, chain=chain, engine=engine))
+            remaining = len(engine.get_snapshots_without_report())
+            engine.close()
+        print(f"{name:28}{stats['saved']:>7}{stats['failed']:>8}{llm.calls:>7}{stats['seconds']:>9.2f}"
+              f"{stats['reports_per_minute']:>13,.0f}")
+        if remaining != snapshots - stats['saved']:
+            print(f"FAIL {name}: {remaining} snapshots still without a report")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI report backfill benchmark")
+    parser.add_argument("--snapshots", type=int, default=60)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--fail-every", type=int, default=7)
+    args = parser.parse_args()
+    run(args.snapshots, args.latency_ms, args.fail_every)
@@ -0,0 +1,99 @@
+"""
+Benchmark backtest chiến lược theo gap.
+
+So sánh bản vector hóa (gold_tracker.backtest) với vòng lặp Python duyệt từng dòng
+DataFrame làm tham chiếu (kiểm tra kết quả trùng khớp), rồi đo thông lượng
+(chiến lược/giây) của lưới mặc định với 1 process và với process pool.
+
+Chạy: python -m benchmarks.bench_backtest [--days 365] [--workers 1 4] [--reference 20]
+"""
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from gold_tracker import backtest
+
+
+def _synthetic_history(days, seed=0):
+    # Snapshot 5 phút; gap dao động quanh mức trung bình (Ornstein–Uhlenbeck) để có tín hiệu.
+    rng = np.random.default_rng(seed)
+    n = days * 288
+    world = 90 * np.exp(rng.normal(0, 0.0008, n).cumsum())
+    gap = np.empty(n)
+    gap[0] = 5.0
+    noise = rng.normal(0, 0.08, n)
+    for i in range(1, n):
+        gap[i] = gap[i - 1] + 0.002 * (5.0 - gap[i - 1]) + noise[i]
+    sell = (world + gap) * 1_000_000
+    return pd.DataFrame({
+        'timestamp': pd.date_range("2024-01-01", periods=n, freq="5min"),
+        'sjc_sell_price': sell,
+        'sjc_buy_price': sell - 2_000_000,
+        'gap': gap,
+    })
+
+
+def _reference(df, strategy, lag=1):
+    # Cách làm cũ: duyệt từng dòng, tự tính z-score bằng rolling của pandas.
+    if strategy.kind == 'zscore':
+        rolling = df['gap'].rolling(strategy.window)
+        indicator = ((df['gap'] - rolling.mean()) / rolling.std()).tolist()
+    else:
+        indicator = df['gap'].tolist()
+    held, state = [], 0
+    for value in indicator:
+        if value <= strategy.entry:
+            state = 1
+        elif value >= strategy.exit:
+            state = 0
+        held.append(state)
+
+    equity, entry_price, trades = 1.0, None, 0
+    pending = [0] * lag + held
+    for i, row in enumerate(df.itertuples(index=False)):
+        want = pending[i]
+        if want and entry_price is None:
+            entry_price, trades = row.sjc_sell_price, trades + 1
+        elif not want and entry_price is not None:
+            equity *= row.sjc_buy_price / entry_price
+            entry_price = None
+    if entry_price is not None:
+        equity *= df['sjc_buy_price'].iloc[-1] / entry_price
+    return equity - 1.0, trades
+
+
+def run(days, workers_list, reference_count):
+    df = _synthetic_history(days)
+    market = backtest.load_market(df)
+    strategies = backtest.default_grid(market)
+    print(f"{len(market['ask']):,} snapshots, {len(strategies)} strategies")
+
+    sample = strategies[::max(1, len(strategies) // reference_count)][:reference_count]
+    start = time.perf_counter()
+    expected = [_reference(df, s) for s in sample]
+    reference_rate = len(sample) / (time.perf_counter() - start)
+    actual = [backtest.run_strategy(market, s) for s in sample]
+    same = all(
+        math.isclose(r['total_return'], ret, rel_tol=1e-9, abs_tol=1e-12) and r['trades'] == trades
+        for r, (ret, trades) in zip(actual, expected)
+    )
+
+    print(f"{'engine':24}{'strategies/s':>14}{'speedup':>10}")
+    print(f"{'python loop':24}{reference_rate:>14,.1f}{1:>10.1f}  (same results: {'yes' if same else 'NO'})")
+    for workers in workers_list:
+        _, rate = backtest.run_grid(market, strategies, workers=workers)
+        print(f"{f'vectorized, {workers} proc':24}{rate:>14,.1f}{rate / reference_rate:>10.1f}")
+    return same
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gap strategy backtest benchmark")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--reference", type=int, default=20, help="Strategies checked against the Python loop")
+    args = parser.parse_args()
+    raise SystemExit(0 if run(args.days, args.workers, args.reference) else 1)
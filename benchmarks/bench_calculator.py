@@ -0,0 +1,90 @@
+"""
+Benchmark tính lại converted_price/gap trên lịch sử tổng hợp.
+
+So sánh vòng lặp dùng hàm scalar với hàm vector hóa, và đo thời gian
+StorageEngine.recompute_derived() trên một database tạm.
+
+Chạy: python -m benchmarks.bench_calculator [--rows 1000000] [--skip-db]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from gold_tracker.calculator import (
+    calculate_converted_global_price,
+    calculate_gap,
+    recompute_derived,
+)
+from gold_tracker.storage import StorageEngine
+
+
+def _synthetic_history(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'global_price_usd': 3900 + rng.normal(0, 40, rows).cumsum() / 100,
+        'exchange_rate': 25400 + rng.normal(0, 5, rows),
+        'sjc_sell_price': np.round(120_000_000 + rng.normal(0, 500_000, rows), -5),
+    })
+    # Một ít dữ liệu thiếu để kiểm tra NaN được lan truyền.
+    df.loc[rng.random(rows) < 0.001, 'exchange_rate'] = np.nan
+    return df
+
+
+def _scalar_loop(df):
+    converted = []
+    gaps = []
+    for price, rate, sjc in zip(df['global_price_usd'], df['exchange_rate'], df['sjc_sell_price']):
+        rate = None if rate != rate else rate
+        value = calculate_converted_global_price(price, rate)
+        converted.append(value)
+        gaps.append(calculate_gap(sjc, value))
+    return converted, gaps
+
+
+def run(rows, skip_db):
+    df = _synthetic_history(rows)
+
+    start = time.perf_counter()
+    _scalar_loop(df)
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = recompute_derived(df)
+    vector_s = time.perf_counter() - start
+
+    print(f"rows: {rows:,}")
+    print(f"scalar loop:      {scalar_s * 1000:>10.1f} ms")
+    print(f"vectorized:       {vector_s * 1000:>10.1f} ms  ({scalar_s / vector_s:,.0f}x)")
+    print(f"NaN gaps:         {int(result['gap'].isna().sum()):>10,}")
+
+    if skip_db:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = StorageEngine(os.path.join(tmp, "bench.db"))
+        timestamps = pd.date_range("2015-01-01", periods=rows, freq="5min")
+        engine.save_many(
+            {
+                'timestamp': ts.to_pydatetime(),
+                'global_price': price,
+                'exchange_rate': rate,
+                'sjc_sell': sjc,
+            }
+            for ts, price, rate, sjc in zip(timestamps, df['global_price_usd'], df['exchange_rate'], df['sjc_sell_price'])
+        )
+        start = time.perf_counter()
+        updated = engine.recompute_derived()
+        db_s = time.perf_counter() - start
+        engine.close()
+    print(f"recompute + rewrite in SQLite: {db_s * 1000:>10.1f} ms  ({updated / db_s:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vectorized calculator benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--skip-db", action="store_true", help="Chỉ đo phần tính toán")
+    args = parser.parse_args()
+    run(args.rows, args.skip_db)
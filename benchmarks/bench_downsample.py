@@ -0,0 +1,94 @@
+"""
+Benchmark giảm số điểm LTTB cho biểu đồ xu hướng.
+
+So sánh lttb_indices (NumPy) với bản LTTB thuần Python làm tham chiếu trên chuỗi
+snapshot 5 phút tổng hợp: thời gian, kết quả có trùng khớp không, đỉnh nhọn có được
+giữ lại không, sai lệch của giá trị cao/thấp nhất (% biên độ), và kích thước JSON gửi
+tới trình duyệt trước/sau khi giảm.
+
+Chạy: python -m benchmarks.bench_downsample [--points 10000 100000 1000000] [--out 800]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from gold_tracker.downsample import lttb_indices, downsample_frame
+
+
+def _reference_lttb(x, y, n_out):
+    # LTTB gốc (Steinarsson, 2013) viết bằng vòng lặp Python, dùng để kiểm tra kết quả.
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return list(range(n))
+    x = [v - x[0] for v in x]
+    edges = [int(v) for v in np.linspace(1, n - 1, n_out - 1)]
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            nlo, nhi = edges[i + 1], edges[i + 2]
+            cx = sum(x[nlo:nhi]) / (nhi - nlo)
+            cy = sum(y[nlo:nhi]) / (nhi - nlo)
+        else:
+            cx, cy = x[-1], y[-1]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def _synthetic_history(points, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range("2024-01-01", periods=points, freq="5min")
+    sjc = 120 + rng.normal(0, 0.05, points).cumsum()
+    # Một đỉnh nhọn ngắn hạn để kiểm tra LTTB không làm mất nó.
+    sjc[points // 3] += 8
+    converted = 100 + rng.normal(0, 0.05, points).cumsum()
+    return pd.DataFrame({'timestamp': timestamps, 'sjc_sell_million': sjc, 'converted_price': converted})
+
+
+def run(points_list, n_out, reference_limit):
+    print(f"{'points':>10}{'numpy ms':>11}{'python ms':>11}{'same':>6}{'spike':>7}{'ext err %':>11}{'json KiB':>10}{'-> KiB':>9}")
+    for points in points_list:
+        df = _synthetic_history(points)
+        x = df['timestamp'].to_numpy()
+        y = df['sjc_sell_million'].to_numpy()
+
+        start = time.perf_counter()
+        keep = lttb_indices(x, y, n_out)
+        numpy_ms = (time.perf_counter() - start) * 1000
+
+        if points <= reference_limit:
+            x_ref = x.astype('datetime64[ns]').astype(np.int64).astype(float).tolist()
+            start = time.perf_counter()
+            expected = _reference_lttb(x_ref, y.tolist(), n_out)
+            python_ms = f"{(time.perf_counter() - start) * 1000:.1f}"
+            same = "yes" if list(keep) == expected else "NO"
+        else:
+            python_ms, same = "-", "-"
+
+        spike = "yes" if points // 3 in set(keep.tolist()) else "no"
+        kept = y[keep]
+        extreme_err = max(y.max() - kept.max(), kept.min() - y.min()) / (y.max() - y.min()) * 100
+        columns = ['sjc_sell_million', 'converted_price']
+        full_kib = len(df.to_json(orient='records', date_format='iso')) / 1024
+        reduced_kib = len(downsample_frame(df, 'timestamp', columns, n_out).to_json(orient='records', date_format='iso')) / 1024
+        print(f"{points:>10,}{numpy_ms:>11.2f}{python_ms:>11}{same:>6}{spike:>7}{extreme_err:>11.3f}{full_kib:>10,.0f}{reduced_kib:>9,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LTTB downsampling benchmark")
+    parser.add_argument("--points", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--out", type=int, default=800)
+    parser.add_argument("--reference-limit", type=int, default=100_000,
+                        help="Skip the pure-Python reference above this many points")
+    args = parser.parse_args()
+    run(args.points, args.out, args.reference_limit)
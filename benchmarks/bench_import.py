@@ -0,0 +1,108 @@
+"""
+Benchmark thời gian khởi động (import) của CLI bằng `python -X importtime`.
+
+Mỗi kịch bản chạy trong một tiến trình Python mới. Thời gian import được tính bằng tổng
+thời gian import ở cấp cao nhất, trừ đi phần của trình thông dịch (`-c pass`).
+Benchmark thất bại (exit 1) nếu đường khởi động nhanh import một thư viện nặng
+(yfinance, pandas, LangChain, ...) hoặc vượt ngân sách thời gian.
+
+Chạy: python -m benchmarks.bench_import [--repeat 5] [--budget-ms 150]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Các thư viện chỉ được import khi bước tương ứng thực sự chạy.
+HEAVY_MODULES = ("yfinance", "pandas", "numpy", "langchain_core", "langchain_openai", "openai", "bs4", "lxml", "requests")
+
+# Tên kịch bản -> (đối số cho python, có kiểm tra thư viện nặng hay không)
+SCENARIOS = {
+    "interpreter": (["-c", "pass"], False),
+    "import main": (["-c", "import main"], True),
+    "import gold_tracker.storage": (["-c", "import gold_tracker.storage"], True),
+    "main.py --mock --no-ai": (["main.py", "--mock", "--no-ai"], True),
+    "import gold_tracker.llm_analyzer": (["-c", "import gold_tracker.llm_analyzer"], True),
+}
+
+# Ngân sách mặc định (ms) cho phần import của dự án, không tính trình thông dịch.
+DEFAULT_BUDGET_MS = 150.0
+
+
+def parse_importtime(stderr):
+    """
+    Đọc output của -X importtime.
+
+    Returns:
+        tuple: (tổng thời gian import cấp cao nhất tính bằng ms, tập tên module đã import)
+    """
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.add(name.strip())
+        # Module cấp cao nhất được thụt lề đúng một khoảng trắng.
+        if name.startswith(" ") and not name.startswith("  "):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def run_scenario(args, env):
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} exited with {completed.returncode}:\n{completed.stderr[-2000:]}")
+    import_ms, modules = parse_importtime(completed.stderr)
+    return import_ms, wall_ms, modules
+
+
+def run(repeat, budget_ms):
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, GOLD_DB_FILE=os.path.join(tmp, "bench.db"), GOLD_METRICS="0")
+        results = {}
+        for name, (args, guarded) in SCENARIOS.items():
+            samples = [run_scenario(args, env) for _ in range(repeat)]
+            import_ms = min(s[0] for s in samples)
+            wall_ms = min(s[1] for s in samples)
+            heavy = sorted(m for m in samples[0][2] if m.split(".")[0] in HEAVY_MODULES and "." not in m)
+            results[name] = (import_ms, wall_ms, heavy if guarded else [])
+
+    base_import, base_wall, _ = results["interpreter"]
+    print(f"{'scenario':36}{'import ms':>11}{'+ms':>9}{'wall ms':>10}  heavy modules")
+    for name, (import_ms, wall_ms, heavy) in results.items():
+        extra = import_ms - base_import
+        print(f"{name:36}{import_ms:>11.1f}{extra:>9.1f}{wall_ms:>10.1f}  {', '.join(heavy) or '-'}")
+        if name in ("interpreter", "import gold_tracker.llm_analyzer"):
+            continue
+        if heavy:
+            failures.append(f"{name} imports {', '.join(heavy)}")
+        if extra > budget_ms:
+            failures.append(f"{name} import time {extra:.1f} ms > budget {budget_ms:.1f} ms")
+    # llm_analyzer chỉ được phép tải LangChain khi tạo báo cáo, không phải khi import.
+    _, _, heavy = results["import gold_tracker.llm_analyzer"]
+    if any(m.startswith("langchain") or m == "openai" for m in heavy):
+        failures.append(f"import gold_tracker.llm_analyzer loads {', '.join(heavy)}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CLI import-time benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Max project import time on top of the bare interpreter")
+    args = parser.parse_args()
+    sys.exit(1 if run(args.repeat, args.budget_ms) else 0)
@@ -0,0 +1,83 @@
+"""
+Benchmark và kiểm tra độ đúng của các parser SJC/tin tức trên HTML lưu sẵn.
+
+Các file trong benchmarks/fixtures/ mô phỏng cấu trúc trang webgia.com/gia-vang/sjc/
+và vnexpress.net/kinh-doanh/hang-hoa; expected.json chứa kết quả đúng.
+Có thể thêm trang thật bằng --record (cần mạng) để so sánh tốc độ trên dữ liệu thực.
+
+Chạy: python -m benchmarks.bench_parsers [--repeat 50] [--record]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from gold_tracker import data_fetcher
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# File fixture -> (URL gốc, các parser cần so sánh)
+CASES = {
+    "webgia_sjc.html": (data_fetcher.SJC_URL, {
+        "html.parser": data_fetcher._parse_sjc_html_soup,
+        "lxml": data_fetcher._parse_sjc_html_lxml,
+    }),
+    "vnexpress_hang_hoa.html": (data_fetcher.NEWS_URL, {
+        "html.parser": data_fetcher._parse_news_html_soup,
+        "lxml": data_fetcher._parse_news_html_lxml,
+    }),
+}
+
+
+def _normalize(result):
+    # Tin tức (các cặp title, url) được lưu trong expected.json dưới dạng danh sách dòng cho dễ đọc.
+    if isinstance(result, list):
+        return data_fetcher.format_headlines(result).split("\n")
+    return result
+
+
+def record():
+    """Tải lại các trang thật và ghi đè fixture (không cập nhật expected.json)."""
+    for filename, (url, _) in CASES.items():
+        response = data_fetcher._get_session().get(url, timeout=10)
+        response.raise_for_status()
+        with open(os.path.join(FIXTURES_DIR, filename), "wb") as f:
+            f.write(response.content)
+        print(f"recorded {url} -> {filename} ({len(response.content):,} bytes)")
+
+
+def run(repeat):
+    with open(os.path.join(FIXTURES_DIR, "expected.json"), encoding="utf-8") as f:
+        expected = json.load(f)
+
+    failures = 0
+    print(f"{'fixture':26}{'parser':14}{'mean ms':>10}{'p50 ms':>10}{'min ms':>10}  ok")
+    for filename, (_, parsers) in CASES.items():
+        with open(os.path.join(FIXTURES_DIR, filename), "rb") as f:
+            content = f.read()
+        for name, parse in parsers.items():
+            if name == "lxml" and data_fetcher._lxml_html() is None:
+                print(f"{filename:26}{name:14}{'(lxml not installed)':>30}")
+                continue
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = parse(content)
+                timings.append((time.perf_counter() - start) * 1000)
+            ok = _normalize(result) == expected.get(filename)
+            failures += not ok
+            print(f"{filename:26}{name:14}{statistics.mean(timings):>10.2f}"
+                  f"{statistics.median(timings):>10.2f}{min(timings):>10.2f}  {'yes' if ok else 'NO'}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTML parser benchmark")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--record", action="store_true", help="Re-download the live pages into fixtures/ first")
+    args = parser.parse_args()
+    if args.record:
+        record()
+    sys.exit(1 if run(args.repeat) else 0)
@@ -0,0 +1,279 @@
+"""
+Benchmark toàn bộ pipeline `main.py` không cần mạng.
+
+Các nguồn được thay bằng dữ liệu ghi sẵn:
+- HTML webgia/VnExpress trong benchmarks/fixtures/ (phát lại qua một session giả),
+- giá đóng cửa yfinance trong fixtures/yfinance_close_5d.csv,
+- một chat model giả của langchain_core thay cho OpenRouter.
+
+Phần còn lại là code thật: orchestrator, parser, calculator, chain LangChain và
+StorageEngine (trên một database tạm). Kết quả là phân phối độ trễ theo từng giai
+đoạn và bộ nhớ đỉnh (tracemalloc) của một lần chạy main().
+
+Chạy:
+    python -m benchmarks.bench_pipeline [--runs 30] [--stream] [--llm-latency-ms 0]
+    python -m benchmarks.bench_pipeline --save-baseline     # ghi baseline
+    python -m benchmarks.bench_pipeline --check             # so sánh, exit 1 nếu chậm hơn
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+import pandas as pd
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "pipeline.json")
+
+# Ngưỡng hồi quy: chậm hơn baseline quá TOLERANCE (tương đối) và quá ABS_SLACK_MS (tuyệt đối).
+TOLERANCE = 0.5
+ABS_SLACK_MS = 2.0
+
+FAKE_REPORT = (
+    "## Today's Snapshot\n\n| Chỉ số | Giá trị |\n|---|---|\n| SJC | 150.60 |\n\n"
+    "## Market Divergence\nChênh lệch vẫn cao so với lịch sử.\n\n"
+    "## Expert Prediction\n**Neutral**\n\n## Disclaimer\nKhông phải lời khuyên tài chính.\n"
+)
+
+
+class _ReplayResponse:
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+        self.headers = {}
+
+
+class _ReplaySession:
+    """Thay requests.Session: trả về HTML ghi sẵn theo URL (không có ETag nên luôn parse lại)."""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get(self, url, headers=None, timeout=None):
+        return _ReplayResponse(self.pages[url])
+
+
+def _load_canned_frame():
+    """DataFrame cột MultiIndex ('Close', ticker) giống kết quả của yf.download."""
+    closes = pd.read_csv(os.path.join(FIXTURES_DIR, "yfinance_close_5d.csv"), index_col="Date", parse_dates=True)
+    closes.columns = pd.MultiIndex.from_product([["Close"], closes.columns], names=["Price", "Ticker"])
+    return closes
+
+
+class StageTimer:
+    """Gom thời gian (ms) của từng giai đoạn trong một lần chạy."""
+
+    def __init__(self):
+        self.current = defaultdict(float)
+
+    def add(self, stage, elapsed_ms):
+        self.current[stage] += elapsed_ms
+
+    def wrap(self, stage, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, (time.perf_counter() - start) * 1000)
+        return timed
+
+    def wrap_stream(self, stage, func):
+        # Thời gian của generator tính đến khi đoạn cuối cùng được tiêu thụ.
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                yield from func(*args, **kwargs)
+            finally:
+                self.add(stage, (time.perf_counter() - start) * 1000)
+        return timed
+
+    def take(self):
+        stages, self.current = dict(self.current), defaultdict(float)
+        return stages
+
+
+def install_stubs(db_file, timer, llm_latency_ms, use_report_cache):
+    """Thay mạng/LLM bằng dữ liệu ghi sẵn và gắn bộ đếm thời gian vào pipeline thật."""
+    import yfinance as yf
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.output_parsers import StrOutputParser
+
+    import main
+    from gold_tracker import data_fetcher, llm_analyzer, orchestrator, storage
+
+    os.environ["OPENROUTER_API_KEY"] = "offline-benchmark"
+
+    pages = {}
+    for filename, url in (("webgia_sjc.html", data_fetcher.SJC_URL), ("vnexpress_hang_hoa.html", data_fetcher.NEWS_URL)):
+        with open(os.path.join(FIXTURES_DIR, filename), "rb") as f:
+            pages[url] = f.read()
+    data_fetcher._session = _ReplaySession(pages)
+    data_fetcher._conditional_cache.clear()
+    # Đọc fixture một lần để thời gian fetch.market không tính việc đọc CSV.
+    canned = _load_canned_frame()
+    yf.download = lambda *args, **kwargs: canned.copy()
+
+    data_fetcher._parse_sjc_html = timer.wrap("parse.sjc", data_fetcher._parse_sjc_html)
+    data_fetcher._parse_news_html = timer.wrap("parse.news", data_fetcher._parse_news_html)
+
+    storage._engine = storage.StorageEngine(db_file)
+    storage._engine.init_schema()
+
+    # Chain thật (prompt | model | parser) nhưng model trả về báo cáo cố định.
+    fake_llm = FakeListChatModel(responses=[FAKE_REPORT], sleep=llm_latency_ms / 1000 or None)
+    chain = llm_analyzer.get_prompt() | fake_llm | StrOutputParser()
+    llm_analyzer.get_chain = lambda api_key, model_name: chain
+
+    def fetch_all_sources(*args, **kwargs):
+        result = orchestrator.fetch_all_sources(*args, **kwargs)
+        for name, info in result['sources'].items():
+            timer.add(f"fetch.{name}", info['elapsed_ms'])
+        return result
+
+    # main.py import các hàm này khi chạy bước AI, nên thay trực tiếp trong llm_analyzer.
+    get_analysis = llm_analyzer.get_gold_market_analysis
+    stream_analysis_gen = llm_analyzer.stream_gold_market_analysis
+
+    def analysis(data_context):
+        return get_analysis(data_context, use_cache=use_report_cache)
+
+    def stream_analysis(data_context):
+        return stream_analysis_gen(data_context, use_cache=use_report_cache)
+
+    main.fetch_all_sources = timer.wrap("fetch", fetch_all_sources)
+    main.calculate_converted_global_price = timer.wrap("calculate", main.calculate_converted_global_price)
+    main.calculate_gap = timer.wrap("calculate", main.calculate_gap)
+    llm_analyzer.get_gold_market_analysis = timer.wrap("llm", analysis)
+    llm_analyzer.stream_gold_market_analysis = timer.wrap_stream("llm", stream_analysis)
+    main.get_gap_stats = timer.wrap("storage.read", main.get_gap_stats)
+    main.save_snapshot = timer.wrap("storage.write", main.save_snapshot)
+    return main
+
+
+def run_main(main_module, timer, argv):
+    sys.argv = ["main.py"] + argv
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        main_module.main()
+        timer.add("total", (time.perf_counter() - start) * 1000)
+    return timer.take()
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+
+def summarize(samples):
+    """{stage: [ms, ...]} -> {stage: {'mean', 'p50', 'p95', 'max'}}."""
+    return {
+        stage: {
+            'mean': statistics.mean(values),
+            'p50': _percentile(values, 0.5),
+            'p95': _percentile(values, 0.95),
+            'max': max(values),
+        }
+        for stage, values in samples.items()
+    }
+
+
+def benchmark(runs, warmup, memory_runs, argv, llm_latency_ms, use_report_cache):
+    logging.disable(logging.INFO)
+    timer = StageTimer()
+    with tempfile.TemporaryDirectory() as tmp:
+        main_module = install_stubs(os.path.join(tmp, "bench.db"), timer, llm_latency_ms, use_report_cache)
+
+        for _ in range(warmup):
+            run_main(main_module, timer, argv)
+
+        samples = defaultdict(list)
+        for _ in range(runs):
+            for stage, elapsed_ms in run_main(main_module, timer, argv).items():
+                samples[stage].append(elapsed_ms)
+
+        # Đo bộ nhớ ở các lần chạy riêng vì tracemalloc làm chậm đáng kể.
+        peaks = []
+        tracemalloc.start()
+        for _ in range(memory_runs):
+            tracemalloc.reset_peak()
+            run_main(main_module, timer, argv)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+
+    return {
+        'runs': runs,
+        'argv': argv,
+        'stages': summarize(samples),
+        'peak_kib': max(peaks) if peaks else None,
+    }
+
+
+def print_report(result):
+    print(f"{'stage':18}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for stage, stats in sorted(result['stages'].items(), key=lambda item: item[0] != 'total'):
+        print(f"{stage:18}{stats['mean']:>10.2f}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['max']:>10.2f}")
+    if result['peak_kib'] is not None:
+        print(f"peak memory per run: {result['peak_kib']:,.0f} KiB")
+
+
+def check_regressions(result, baseline, tolerance=TOLERANCE):
+    """So sánh p50 của từng giai đoạn và bộ nhớ đỉnh với baseline. Trả về danh sách mô tả hồi quy."""
+    regressions = []
+    for stage, base in baseline['stages'].items():
+        current = result['stages'].get(stage)
+        if current is None:
+            continue
+        limit = max(base['p50'] * (1 + tolerance), base['p50'] + ABS_SLACK_MS)
+        if current['p50'] > limit:
+            regressions.append(f"{stage}: p50 {current['p50']:.2f} ms > {limit:.2f} ms (baseline {base['p50']:.2f})")
+    if baseline.get('peak_kib') and result['peak_kib']:
+        limit = baseline['peak_kib'] * (1 + tolerance)
+        if result['peak_kib'] > limit:
+            regressions.append(f"peak memory {result['peak_kib']:,.0f} KiB > {limit:,.0f} KiB")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--memory-runs", type=int, default=3, help="Extra runs under tracemalloc (0 to skip)")
+    parser.add_argument("--stream", action="store_true", help="Benchmark the streaming report path")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated model latency per response")
+    parser.add_argument("--report-cache", action="store_true", help="Allow LLM report cache hits after the first run")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+    parser.add_argument("--check", action="store_true", help="Compare with --baseline and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    result = benchmark(args.runs, args.warmup, args.memory_runs, ["--stream"] if args.stream else [],
+                       args.llm_latency_ms, args.report_cache)
+    print_report(result)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = check_regressions(result, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print("no regressions" if not regressions else f"{len(regressions)} regression(s)")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,122 @@
+"""
+Benchmark ghi/đọc SQLite: hàm cũ (mở kết nối mỗi lần gọi) so với StorageEngine.
+
+Thêm kịch bản rerun của Streamlit: mỗi lần đọc chạy trong một thread mới, so sánh
+StorageEngine không có pool (mỗi thread mở kết nối riêng) với pool kết nối.
+
+Chạy: python -m benchmarks.bench_storage [--rows 2000] [--reads 200]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from gold_tracker.storage import StorageEngine, SCHEMA, INSERT_SQL, _snapshot_row
+
+
+def _legacy_save(db_file, data):
+    # Bản sao hành vi cũ: CREATE TABLE + mở/đóng kết nối cho mỗi lần ghi.
+    conn = sqlite3.connect(db_file)
+    conn.execute(SCHEMA)
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(db_file)
+    conn.execute(INSERT_SQL, _snapshot_row(data))
+    conn.commit()
+    conn.close()
+
+
+def _legacy_history(db_file, limit):
+    conn = sqlite3.connect(db_file)
+    df = pd.read_sql_query(f"SELECT * FROM gold_prices ORDER BY timestamp DESC LIMIT {limit}", conn)
+    conn.close()
+    if not df.empty:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df = df.sort_values(by='timestamp', ascending=True)
+    return df
+
+
+def _snapshots(n):
+    start = datetime(2025, 1, 1)
+    for i in range(n):
+        yield {
+            "timestamp": start + timedelta(minutes=5 * i),
+            "global_price": 3200.0 + i % 50,
+            "exchange_rate": 25400.0,
+            "sjc_sell": 120_000_000.0,
+            "sjc_buy": 118_000_000.0,
+            "converted_price": 98.5,
+            "gap": 21.5,
+            "ai_report": "",
+        }
+
+
+def _measure_reads(read, reads):
+    timings = []
+    for _ in range(reads):
+        start = time.perf_counter()
+        read()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95) - 1]
+
+
+def _in_new_thread(read):
+    # Streamlit chạy mỗi lần rerun script trong một thread mới.
+    def rerun():
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+    return rerun
+
+
+def run(rows, reads):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, "legacy.db")
+        start = time.perf_counter()
+        for data in _snapshots(rows):
+            _legacy_save(legacy_db, data)
+        legacy_insert = rows / (time.perf_counter() - start)
+        legacy_read = _measure_reads(lambda: _legacy_history(legacy_db, 50), reads)
+
+        engine = StorageEngine(os.path.join(tmp, "engine.db"))
+        start = time.perf_counter()
+        for data in _snapshots(rows):
+            engine.save_snapshot(data)
+        engine_insert = rows / (time.perf_counter() - start)
+
+        batch = StorageEngine(os.path.join(tmp, "batch.db"))
+        start = time.perf_counter()
+        batch.save_many(_snapshots(rows))
+        batch_insert = rows / (time.perf_counter() - start)
+        engine_read = _measure_reads(lambda: engine.get_history(50), reads)
+
+        rerun = {}
+        for name, pool_size in (("no pool", 0), ("pool", 8)):
+            rerun_engine = StorageEngine(engine.db_file, pool_size=pool_size)
+            rerun[name] = (_measure_reads(_in_new_thread(lambda: rerun_engine.get_history(50)), reads),
+                           rerun_engine.connections_opened)
+            rerun_engine.close()
+
+    print(f"{'':28}{'inserts/s':>12}{'read p50 ms':>14}{'read p95 ms':>14}")
+    print(f"{'legacy functions':28}{legacy_insert:>12,.0f}{legacy_read[0]:>14.2f}{legacy_read[1]:>14.2f}")
+    print(f"{'StorageEngine.save_snapshot':28}{engine_insert:>12,.0f}{engine_read[0]:>14.2f}{engine_read[1]:>14.2f}")
+    print(f"{'StorageEngine.save_many':28}{batch_insert:>12,.0f}")
+
+    print(f"\n{reads} reads, each in a new thread (Streamlit reruns)")
+    print(f"{'':28}{'connections':>12}{'read p50 ms':>14}{'read p95 ms':>14}")
+    for name, ((p50, p95), opened) in rerun.items():
+        print(f"{'StorageEngine, ' + name:28}{opened:>12,}{p50:>14.2f}{p95:>14.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite storage benchmark")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+    run(args.rows, args.reads)
@@ -0,0 +1,136 @@
+"""
+Benchmark ghi snapshot: phát hiện giá không đổi (run-length) và hàng đợi write-behind.
+
+1. Mô phỏng một tuần collector chạy mỗi 5 phút: giá thế giới đứng yên khi thị trường
+   COMEX đóng cửa (cuối tuần và 1 giờ nghỉ mỗi ngày), tỷ giá đổi mỗi giờ, giá SJC đổi
+   vài lần mỗi ngày. So sánh ghi mọi snapshot với gộp snapshot không đổi: số dòng, số
+   trang WAL được ghi (write amplification thực tế của SQLite) và dung lượng database.
+2. Đo thời gian người gọi bị chặn: storage.save_snapshot (đồng bộ) so với đưa vào
+   WriteBehindQueue, và số transaction writer thực sự commit.
+
+Chạy: python -m benchmarks.bench_write_behind [--days 7] [--calls 200]
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from gold_tracker.storage import StorageEngine
+from gold_tracker.write_behind import WriteBehindQueue
+
+
+def _collector_week(days, seed=0):
+    # Snapshot 5 phút bắt đầu từ thứ Hai 00:00 (giờ Việt Nam).
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 6, 2)
+    world, rate, sell = 3300.0, 25_400.0, 118_000_000.0
+    for i in range(days * 288):
+        ts = start + timedelta(minutes=5 * i)
+        # COMEX (giờ VN): đóng từ 04:00 thứ Bảy tới 05:00 thứ Hai, nghỉ 04:00-05:00 các ngày khác.
+        closed = ts.weekday() == 5 and ts.hour >= 4 or ts.weekday() == 6 or ts.weekday() == 0 and ts.hour < 5 \
+            or ts.hour == 4
+        if not closed:
+            world = round(world + rng.normal(0, 1.5), 1)
+        if ts.minute == 0 and ts.weekday() < 5:
+            rate = round(rate + rng.normal(0, 5))
+        if ts.weekday() < 6 and ts.hour in (9, 11, 15) and ts.minute == 0:
+            sell += 200_000 * rng.choice([-1, 1])
+        converted = world * rate / 1_000_000
+        yield {
+            "timestamp": ts,
+            "global_price": world,
+            "exchange_rate": rate,
+            "sjc_sell": sell,
+            "sjc_buy": sell - 2_000_000,
+            "converted_price": converted,
+            "gap": sell / 1_000_000 - converted,
+        }
+
+
+def _wal_pages(engine, db_file):
+    # Số trang đã ghi vào WAL kể từ checkpoint trước (wal_autocheckpoint đã tắt):
+    # WAL gồm header 32 byte và các frame (header 24 byte + một trang).
+    conn = engine.connect()
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    wal = f"{db_file}-wal"
+    size = os.path.getsize(wal) if os.path.exists(wal) else 0
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return max(size - 32, 0) // (page_size + 24)
+
+
+def _db_bytes(db_file):
+    return sum(os.path.getsize(path) for path in (db_file, f"{db_file}-wal") if os.path.exists(path))
+
+
+def run_change_detection(days):
+    snapshots = list(_collector_week(days))
+    results = {}
+    for name, extend in (("every snapshot", False), ("run-length", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, "bench.db")
+            engine = StorageEngine(db_file, archive_dir=os.path.join(tmp, "archive"))
+            conn = engine.connect()
+            conn.execute("PRAGMA wal_autocheckpoint=0")
+            _wal_pages(engine, db_file)
+            base = _db_bytes(db_file)
+            pages = 0
+            for data in snapshots:
+                # Collector ghi từng snapshot trong transaction riêng.
+                engine.save_snapshot(data, extend_unchanged=extend)
+                pages += _wal_pages(engine, db_file)
+            rows = conn.execute("SELECT COUNT(*) FROM gold_prices").fetchone()[0]
+            growth = _db_bytes(db_file) - base
+            engine.close()
+        results[name] = (rows, pages, growth)
+
+    print(f"{len(snapshots):,} collector polls over {days} days")
+    print(f"{'mode':16}{'rows':>8}{'WAL pages':>11}{'pages/poll':>12}{'DB growth KiB':>15}")
+    for name, (rows, pages, growth) in results.items():
+        print(f"{name:16}{rows:>8,}{pages:>11,}{pages / len(snapshots):>12.2f}{growth / 1024:>15,.0f}")
+    (rows0, pages0, growth0), (rows1, pages1, growth1) = results.values()
+    print(f"saved: {1 - rows1 / rows0:.0%} of rows, {1 - pages1 / pages0:.0%} of page writes, "
+          f"{1 - growth1 / growth0:.0%} of database growth")
+
+
+def run_write_behind(calls):
+    snapshots = list(_collector_week(1))[:calls]
+    for data in snapshots:
+        data['ai_report'] = "## Báo cáo\n\nNeutral."
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_engine = StorageEngine(os.path.join(tmp, "sync.db"), archive_dir=os.path.join(tmp, "a1"))
+        sync_ms = []
+        for data in snapshots:
+            start = time.perf_counter()
+            sync_engine.save_snapshot(data)
+            sync_ms.append((time.perf_counter() - start) * 1000)
+
+        async_engine = StorageEngine(os.path.join(tmp, "async.db"), archive_dir=os.path.join(tmp, "a2"))
+        writer = WriteBehindQueue(async_engine, delay=0.05)
+        async_ms = []
+        for data in snapshots:
+            start = time.perf_counter()
+            writer.put_snapshot(data)
+            async_ms.append((time.perf_counter() - start) * 1000)
+        writer.close()
+        counts = [e.connect().execute("SELECT COUNT(*) FROM ai_reports").fetchone()[0]
+                  for e in (sync_engine, async_engine)]
+
+    print(f"\n{calls} saves with a report (what the dashboard does)")
+    print(f"{'caller':22}{'p50 ms':>9}{'p95 ms':>9}{'transactions':>14}")
+    for name, timings, transactions in (("save_snapshot", sync_ms, calls),
+                                        ("write-behind enqueue", async_ms, writer.batches)):
+        print(f"{name:22}{np.percentile(timings, 50):>9.3f}{np.percentile(timings, 95):>9.3f}{transactions:>14}")
+    if counts[0] != counts[1]:
+        print(f"FAIL write-behind saved {counts[1]} reports, expected {counts[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot write path benchmark")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    run_change_detection(args.days)
+    run_write_behind(args.calls)
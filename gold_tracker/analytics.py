@@ -0,0 +1,275 @@
+import json
+import math
+
+# Thống kê được cập nhật mỗi khi có snapshot mới, mỗi lần O(1).
+# Mỗi chỉ số: tên -> hàm lấy giá trị (Million VND) từ dict snapshot đã lưu.
+METRICS = {
+    'gap': lambda row: row.get('gap'),
+    'sjc_spread': lambda row: (
+        (row['sjc_sell'] - row['sjc_buy']) / 1000000
+        if row.get('sjc_sell') is not None and row.get('sjc_buy') is not None else None
+    ),
+}
+
+# Trung bình trượt theo thời gian: trọng số giảm một nửa sau mỗi EWMA_HALFLIFE giây.
+EWMA_HALFLIFE = 24 * 3600
+
+QUANTILES = (0.1, 0.5, 0.9)
+
+STATS_SCHEMA = '''CREATE TABLE IF NOT EXISTS gap_stats
+                   (metric TEXT PRIMARY KEY,
+                    count INTEGER,
+                    last REAL,
+                    mean REAL,
+                    std REAL,
+                    ewma REAL,
+                    ewm_std REAL,
+                    zscore REAL,
+                    min REAL,
+                    max REAL,
+                    p10 REAL,
+                    p50 REAL,
+                    p90 REAL,
+                    updated_epoch INTEGER,
+                    state TEXT)'''
+
+UPSERT_STATS_SQL = '''INSERT OR REPLACE INTO gap_stats
+                      (metric, count, last, mean, std, ewma, ewm_std, zscore, min, max, p10, p50, p90, updated_epoch, state)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+class P2Quantile:
+    """
+    Ước lượng phân vị theo luồng bằng thuật toán P² (Jain & Chlamtac, 1985).
+
+    Chỉ giữ 5 điểm đánh dấu nên bộ nhớ và thời gian cập nhật là O(1).
+    """
+
+    def __init__(self, p, heights=None, positions=None, desired=None):
+        self.p = p
+        self.heights = heights or []
+        self.positions = positions or [1, 2, 3, 4, 5]
+        self.desired = desired or [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x):
+        if len(self.heights) < 5:
+            self.heights.append(x)
+            self.heights.sort()
+            return
+
+        q, n = self.heights, self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = self._parabolic(i, d)
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = candidate
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            # Chưa đủ 5 điểm: lấy phân vị trực tiếp trên các giá trị đã thấy.
+            index = min(len(self.heights) - 1, int(round(self.p * (len(self.heights) - 1))))
+            return self.heights[index]
+        return self.heights[2]
+
+    def to_dict(self):
+        return {'p': self.p, 'heights': self.heights, 'positions': self.positions, 'desired': self.desired}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['p'], data['heights'], data['positions'], data['desired'])
+
+
+class RollingStats:
+    """Thống kê tăng dần cho một chỉ số: trung bình/độ lệch chuẩn, EWMA, min/max và phân vị."""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.count = state.get('count', 0)
+        self.last = state.get('last')
+        self.mean = state.get('mean', 0.0)
+        self.m2 = state.get('m2', 0.0)
+        self.ewma = state.get('ewma')
+        self.ewm_var = state.get('ewm_var', 0.0)
+        self.min = state.get('min')
+        self.max = state.get('max')
+        self.last_epoch = state.get('last_epoch')
+        self.zscore = state.get('zscore')
+        self.quantiles = [
+            P2Quantile.from_dict(q) for q in state['quantiles']
+        ] if 'quantiles' in state else [P2Quantile(p) for p in QUANTILES]
+
+    def update(self, x, epoch):
+        """Thêm một giá trị mới quan sát tại thời điểm `epoch` (giây)."""
+        if x is None or (isinstance(x, float) and math.isnan(x)):
+            return
+        self.count += 1
+        self.last = x
+
+        # Welford cho trung bình/phương sai toàn bộ lịch sử.
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+        # Z-score của giá trị mới so với phân phối EWMA trước khi cập nhật.
+        previous_std = math.sqrt(self.ewm_var) if self.ewma is not None else 0.0
+        self.zscore = (x - self.ewma) / previous_std if previous_std > 0 else None
+
+        # EWMA theo thời gian thực, không phụ thuộc tần suất lưu snapshot.
+        if self.ewma is None:
+            self.ewma = x
+            self.ewm_var = 0.0
+        else:
+            dt = max(0, epoch - self.last_epoch) if self.last_epoch is not None else 0
+            alpha = 1 - 0.5 ** (dt / EWMA_HALFLIFE)
+            diff = x - self.ewma
+            increment = alpha * diff
+            self.ewma += increment
+            self.ewm_var = (1 - alpha) * (self.ewm_var + diff * increment)
+        self.last_epoch = epoch
+
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        for quantile in self.quantiles:
+            quantile.update(x)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def ewm_std(self):
+        return math.sqrt(self.ewm_var)
+
+    def to_state(self):
+        return {
+            'count': self.count, 'last': self.last, 'mean': self.mean, 'm2': self.m2,
+            'ewma': self.ewma, 'ewm_var': self.ewm_var, 'min': self.min, 'max': self.max,
+            'last_epoch': self.last_epoch, 'zscore': self.zscore, 'quantiles': [q.to_dict() for q in self.quantiles],
+        }
+
+    def to_row(self, metric):
+        p10, p50, p90 = (q.value() for q in self.quantiles)
+        return (metric, self.count, self.last, self.mean, self.std, self.ewma, self.ewm_std, self.zscore,
+                self.min, self.max, p10, p50, p90, self.last_epoch, json.dumps(self.to_state()))
+
+
+def load_stats(conn):
+    """Đọc trạng thái thống kê đã lưu. Trả về {metric: RollingStats}."""
+    stored = dict(conn.execute("SELECT metric, state FROM gap_stats").fetchall())
+    return {metric: RollingStats(json.loads(stored[metric]) if metric in stored else None) for metric in METRICS}
+
+
+def update_stats(conn, snapshots):
+    """
+    Cập nhật thống kê với các snapshot mới và ghi lại vào gap_stats.
+
+    Phải được gọi trong cùng transaction với lệnh INSERT snapshot để các tiến trình
+    ghi song song không ghi đè trạng thái của nhau.
+
+    Args:
+        conn (sqlite3.Connection): Kết nối đang mở transaction.
+        snapshots (list): Các cặp (epoch, dict snapshot) theo thứ tự thời gian.
+    """
+    stats = load_stats(conn)
+    for epoch, data in snapshots:
+        for metric, extract in METRICS.items():
+            stats[metric].update(extract(data), epoch)
+    conn.executemany(UPSERT_STATS_SQL, [s.to_row(metric) for metric, s in stats.items()])
+
+
+def run_epochs(ts_epoch, valid_until_epoch, run_samples):
+    """
+    Các thời điểm thu thập mà một dòng gold_prices đại diện.
+
+    Dòng của chuỗi giá không đổi gộp `run_samples` lần thu thập, coi như cách đều nhau từ
+    ts_epoch tới valid_until_epoch (collector chạy theo chu kỳ cố định). Cùng công thức
+    với phần mở rộng chuỗi trong SQL của storage.
+    """
+    n = run_samples or 1
+    if n <= 1 or valid_until_epoch is None:
+        return [ts_epoch]
+    span = valid_until_epoch - ts_epoch
+    return [ts_epoch + k * span // (n - 1) for k in range(n)]
+
+
+def rebuild_stats(conn, archived=()):
+    """
+    Tính lại toàn bộ thống kê từ lịch sử gold_prices (chỉ dùng khi khởi tạo/nâng cấp).
+
+    Mỗi lần thu thập trong một chuỗi giá không đổi được tính như một snapshot, giống khi
+    update_stats chạy lúc ghi.
+
+    Args:
+        conn (sqlite3.Connection): Kết nối đang mở transaction.
+        archived (iterable): Các dòng (epoch, gap, sjc_sell, sjc_buy) đã chuyển sang archive,
+            mỗi lần thu thập một dòng.
+    """
+    rows = [
+        (epoch, gap, sell, buy)
+        for ts_epoch, until, samples, gap, sell, buy in conn.execute(
+            """SELECT ts_epoch, valid_until_epoch, run_samples, gap, sjc_sell_price, sjc_buy_price
+               FROM gold_prices ORDER BY ts_epoch, timestamp"""
+        )
+        for epoch in run_epochs(ts_epoch, until, samples)
+    ]
+    if archived:
+        rows = sorted(list(archived) + rows, key=lambda row: row[0])
+    conn.execute("DELETE FROM gap_stats")
+    update_stats(conn, [
+        (epoch, {'gap': gap, 'sjc_sell': sell, 'sjc_buy': buy}) for epoch, gap, sell, buy in rows
+    ])
+
+
+def format_gap_norms(stats):
+    """
+    Mô tả ngắn về mức chênh lệch lịch sử để đưa vào prompt LLM.
+
+    Args:
+        stats (dict): Kết quả của get_gap_stats().
+
+    Returns:
+        str: Chuỗi mô tả, hoặc None nếu chưa đủ dữ liệu.
+    """
+    gap = (stats or {}).get('gap')
+    if not gap or not gap.get('count'):
+        return None
+    text = (
+        f"historical gap over {gap['count']} snapshots: mean {gap['mean']:.2f}, "
+        f"1-day EWMA {gap['ewma']:.2f} (std {gap['ewm_std']:.2f}), "
+        f"P10/P50/P90 {gap['p10']:.2f}/{gap['p50']:.2f}/{gap['p90']:.2f}, "
+        f"range {gap['min']:.2f}–{gap['max']:.2f} Million VND"
+    )
+    if gap.get('zscore') is not None:
+        text += f"; current z-score {gap['zscore']:+.2f}"
+    spread = stats.get('sjc_spread')
+    if spread and spread.get('count'):
+        text += f". SJC buy/sell spread: now {spread['last']:.2f}, median {spread['p50']:.2f} Million VND"
+    return text
@@ -0,0 +1,188 @@
+import os
+import logging
+from datetime import date, datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Thư mục lưu các snapshot cũ đã chuyển khỏi SQLite; đặt cạnh database khi dùng volume chung.
+ARCHIVE_DIR = os.getenv("GOLD_ARCHIVE_DIR", "gold_archive")
+
+# Snapshot cũ hơn số ngày này được chuyển sang archive.
+ARCHIVE_AFTER_DAYS = int(os.getenv("GOLD_ARCHIVE_AFTER_DAYS", "30"))
+
+DAY_SECONDS = 86400
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Cột số liệu trong archive, cùng tên với cột của gold_prices.
+VALUE_COLUMNS = ('global_price_usd', 'exchange_rate', 'sjc_sell_price', 'sjc_buy_price', 'converted_price', 'gap')
+
+# Cột mô tả chuỗi giá không đổi (xem storage.save_many); NULL với dòng chỉ là một snapshot
+# và với file archive ghi trước khi có các cột này.
+RUN_COLUMNS = ('valid_until_epoch', 'run_samples')
+
+# Thứ tự cột của mỗi dòng truyền vào write().
+ROW_COLUMNS = ('timestamp',) + VALUE_COLUMNS + ('ts_epoch',) + RUN_COLUMNS
+
+_TS_INDEX = ROW_COLUMNS.index('ts_epoch')
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.ipc  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("The snapshot archive requires pyarrow (pip install pyarrow)") from e
+    return pa, pc
+
+
+def _schema(pa):
+    return pa.schema(
+        [('timestamp', pa.string()), ('ts_epoch', pa.int64())] + [(col, pa.float64()) for col in VALUE_COLUMNS]
+        + [(col, pa.int64()) for col in RUN_COLUMNS]
+    )
+
+
+def _with_columns(pa, table, names):
+    """Chọn các cột `names`; cột chưa có trong file cũ (RUN_COLUMNS) được thêm với giá trị NULL."""
+    for name in names:
+        if name not in table.column_names:
+            table = table.append_column(name, pa.nulls(table.num_rows, pa.int64()))
+    return table.select(list(names))
+
+
+class SnapshotArchive:
+    """
+    Lịch sử snapshot dạng cột, chia partition theo ngày: `<root>/date=YYYY-MM-DD/part-<first>-<last>.arrow`.
+
+    Mỗi file là Arrow IPC không nén nên được đọc bằng memory map (zero-copy), chỉ các cột
+    cần thiết được chuyển sang pandas. Ngày của partition tính từ ts_epoch (giờ địa phương
+    lưu như UTC, giống storage.to_epoch). File chỉ được thêm, không sửa, trừ khi rewrite().
+    """
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+
+    def partitions(self, start_epoch=None, end_epoch=None):
+        """Danh sách (epoch đầu ngày, thư mục) tăng dần, chỉ gồm các ngày giao với [start, end)."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        result = []
+        for name in names:
+            if not name.startswith("date="):
+                continue
+            day_epoch = (date.fromisoformat(name[5:]).toordinal() - _EPOCH_ORDINAL) * DAY_SECONDS
+            if start_epoch is not None and day_epoch + DAY_SECONDS <= start_epoch:
+                continue
+            if end_epoch is not None and day_epoch >= end_epoch:
+                continue
+            result.append((day_epoch, os.path.join(self.root, name)))
+        return sorted(result)
+
+    def overlaps(self, start_epoch, end_epoch):
+        """True nếu archive có dữ liệu trong khoảng [start, end). Không cần pyarrow."""
+        return bool(self.partitions(start_epoch, end_epoch))
+
+    def write(self, rows):
+        """
+        Ghi các dòng snapshot (tuple theo ROW_COLUMNS) vào partition theo ngày.
+
+        Tên file suy ra từ epoch đầu/cuối nên ghi lại cùng một lô (ví dụ sau khi bị ngắt
+        giữa chừng) chỉ ghi đè file cũ. Mỗi file được ghi ra file tạm rồi đổi tên.
+
+        Returns:
+            int: Số dòng đã ghi.
+        """
+        pa, _ = _pyarrow()
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(row[_TS_INDEX] // DAY_SECONDS, []).append(row)
+
+        schema = _schema(pa)
+        for day, day_rows in by_day.items():
+            day_rows.sort(key=lambda row: row[_TS_INDEX])
+            columns = dict(zip(ROW_COLUMNS, zip(*day_rows)))
+            table = pa.table({name: pa.array(columns[name], type=schema.field(name).type) for name in schema.names},
+                             schema=schema)
+            directory = os.path.join(self.root, f"date={datetime.fromtimestamp(day * DAY_SECONDS, timezone.utc):%Y-%m-%d}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{day_rows[0][_TS_INDEX]}-{day_rows[-1][_TS_INDEX]}.arrow")
+            self._write_table(pa, table, path)
+        return sum(len(day_rows) for day_rows in by_day.values())
+
+    @staticmethod
+    def _write_table(pa, table, path):
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _files(directory):
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".arrow"))
+
+    def read(self, start_epoch, end_epoch, columns=VALUE_COLUMNS, limit=None):
+        """
+        Đọc snapshot trong [start, end) từ archive.
+
+        Args:
+            start_epoch, end_epoch (int): Khoảng thời gian (giây epoch).
+            columns (iterable): Các cột trong VALUE_COLUMNS (hoặc RUN_COLUMNS) cần đọc.
+            limit (int): Chỉ lấy `limit` dòng mới nhất (đọc partition từ mới đến cũ và dừng sớm).
+
+        Returns:
+            pandas.DataFrame: Cột 'timestamp' (ISO string), 'ts_epoch' và `columns`, tăng dần theo thời gian.
+        """
+        pa, pc = _pyarrow()
+        import pandas as pd
+
+        selected = ['timestamp', 'ts_epoch'] + list(columns)
+        tables = []
+        total = 0
+        for day_epoch, directory in reversed(self.partitions(start_epoch, end_epoch)):
+            for path in reversed(self._files(directory)):
+                table = _with_columns(pa, pa.ipc.open_file(pa.memory_map(path)).read_all(), selected)
+                if day_epoch < start_epoch or day_epoch + DAY_SECONDS > end_epoch:
+                    epochs = table['ts_epoch']
+                    table = table.filter(pc.and_(pc.greater_equal(epochs, start_epoch), pc.less(epochs, end_epoch)))
+                tables.append(table)
+                total += table.num_rows
+            if limit is not None and total >= limit:
+                break
+        if not tables:
+            return pd.DataFrame(columns=selected)
+        df = pa.concat_tables(tables).to_pandas()
+        df = df.sort_values('ts_epoch', kind='stable').drop_duplicates('timestamp', keep='last')
+        if limit is not None:
+            df = df.tail(limit)
+        return df.reset_index(drop=True)
+
+    def rewrite(self, transform):
+        """
+        Áp dụng `transform(pandas.DataFrame) -> pandas.DataFrame` cho từng file và ghi đè.
+
+        Dùng khi tính lại cột dẫn xuất (converted_price, gap) cho toàn bộ lịch sử.
+
+        Returns:
+            int: Số dòng đã ghi lại.
+        """
+        pa, _ = _pyarrow()
+        schema = _schema(pa)
+        count = 0
+        for _, directory in self.partitions():
+            for path in self._files(directory):
+                table = _with_columns(pa, pa.ipc.open_file(pa.memory_map(path)).read_all(), schema.names)
+                df = transform(table.to_pandas())
+                self._write_table(pa, pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False), path)
+                count += len(df)
+        return count
+
+    def size_bytes(self):
+        """Tổng dung lượng các file trong archive."""
+        return sum(
+            os.path.getsize(path) for _, directory in self.partitions() for path in self._files(directory)
+        )
@@ -0,0 +1,173 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+
+from gold_tracker import llm_analyzer
+from gold_tracker.data_fetcher import NEWS_LIMIT, format_headlines
+from gold_tracker.storage import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Số báo cáo ghi trong mỗi transaction khi backfill.
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "20"))
+
+# Backfill giá thị trường chỉ lấp các khoảng trống giữa hai snapshot đã lưu dài tối đa chừng này giây.
+BACKFILL_MAX_GAP = int(os.getenv("BACKFILL_MAX_GAP", "21600"))
+
+
+def build_context(snapshot, gap_stats, news_items):
+    """data_context cho một snapshot đã lưu, với tin tức đã biết tại thời điểm đó."""
+    return {
+        "global_price": snapshot['global_price'],
+        "exchange_rate": snapshot['exchange_rate'],
+        "converted_price": snapshot['converted_price'],
+        "sjc_price": snapshot['sjc_sell'],
+        "gap": snapshot['gap'],
+        "news": format_headlines(news_items, links=False) or llm_analyzer.NO_NEWS,
+        "gap_stats": gap_stats,
+    }
+
+
+async def abackfill_reports(limit=None, concurrency=llm_analyzer.BACKFILL_CONCURRENCY, chain=None,
+                            batch_size=BACKFILL_BATCH_SIZE, engine=None):
+    """
+    Tạo báo cáo AI cho các snapshot chưa có báo cáo, chạy đồng thời và ghi theo lô.
+
+    Thống kê chênh lệch dùng giá trị hiện tại cho mọi snapshot (gap_stats chỉ lưu trạng thái mới nhất).
+
+    Args:
+        limit (int): Số snapshot tối đa (mới nhất trước), None để xử lý tất cả.
+        concurrency (int): Số request LLM chạy cùng lúc.
+        chain: Chain dùng để tạo báo cáo; mặc định llm_analyzer.get_batch_chain.
+        batch_size (int): Số báo cáo mỗi transaction ghi.
+        engine (StorageEngine): Mặc định engine dùng chung.
+
+    Returns:
+        dict: 'selected', 'saved', 'failed', 'seconds', 'reports_per_minute'.
+    """
+    engine = engine or get_engine()
+    snapshots = engine.get_snapshots_without_report(limit)
+    stats = {'selected': len(snapshots), 'saved': 0, 'failed': 0, 'seconds': 0.0, 'reports_per_minute': 0.0}
+    if not snapshots:
+        return stats
+
+    if chain is None:
+        api_key = os.getenv("OPENROUTER_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENROUTER_API_KEY not found in .env file.")
+        chain = llm_analyzer.get_batch_chain(api_key, llm_analyzer._get_model_name())
+
+    gap_stats = engine.get_gap_stats()
+    contexts = [
+        build_context(s, gap_stats, engine.get_news(until=s['timestamp'], limit=NEWS_LIMIT)) for s in snapshots
+    ]
+
+    start = time.perf_counter()
+    pending = []
+    async for index, result in llm_analyzer.agenerate_reports(contexts, chain, concurrency):
+        if isinstance(result, Exception):
+            stats['failed'] += 1
+            logger.error(f"Report for {snapshots[index]['timestamp']:%Y-%m-%d %H:%M} failed: {result}")
+            continue
+        pending.append((snapshots[index]['timestamp'], result))
+        if len(pending) >= batch_size:
+            stats['saved'] += engine.save_reports(pending)
+            pending = []
+    if pending:
+        stats['saved'] += engine.save_reports(pending)
+
+    stats['seconds'] = time.perf_counter() - start
+    if stats['seconds'] > 0:
+        stats['reports_per_minute'] = stats['saved'] * 60 / stats['seconds']
+    return stats
+
+
+def backfill_reports(**kwargs):
+    """Bản đồng bộ của abackfill_reports (dùng cho CLI)."""
+    return asyncio.run(abackfill_reports(**kwargs))
+
+
+def backfill_market(period="5d", interval="5m", max_gap=BACKFILL_MAX_GAP, series=None, engine=None):
+    """
+    Ghi chuỗi giá intraday (data_fetcher.get_market_series) vào các khoảng trống của lịch sử,
+    ví dụ khi collector ngừng chạy.
+
+    Không có nguồn lịch sử giá SJC, nên chỉ lấp khoảng trống nằm giữa hai snapshot đã lưu cách
+    nhau tối đa max_gap giây và có cùng giá mua/bán SJC; các nến dùng giá SJC đó. Nến đã có
+    snapshot trong khoảng của nó được bỏ qua, nên chạy lại không ghi thêm gì. Snapshot backfill
+    không kèm báo cáo AI (xem backfill_reports).
+
+    Args:
+        period, interval (str): Cú pháp yfinance, ví dụ "5d" và "5m" (chỉ nến intraday).
+        max_gap (int): Độ dài tối đa (giây) của khoảng trống được lấp.
+        series (pandas.DataFrame): Chuỗi đã tải sẵn (cùng dạng với get_market_series).
+        engine (StorageEngine): Mặc định engine dùng chung.
+
+    Returns:
+        dict: 'bars', 'covered' (đã có snapshot), 'skipped' (ngoài khoảng trống lấp được), 'saved'.
+    """
+    import numpy as np
+    import pandas as pd
+    from gold_tracker.calculator import calculate_converted_global_prices, calculate_gaps
+
+    engine = engine or get_engine()
+    if series is None:
+        from gold_tracker.data_fetcher import get_market_series
+
+        series = get_market_series(period=period, interval=interval)
+    stats = {'bars': len(series), 'covered': 0, 'skipped': 0, 'saved': 0}
+    if series.empty:
+        return stats
+
+    # Timestamp trong database là giờ địa phương không kèm múi giờ.
+    index = pd.DatetimeIndex(series.index)
+    if index.tz is not None:
+        index = index.tz_convert(datetime.now().astimezone().tzinfo).tz_localize(None)
+    bar_epochs = ((index - pd.Timestamp(1970, 1, 1)) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+    bar_seconds = int(pd.Timedelta(interval).total_seconds())
+
+    # Mỗi lần thu thập đã lưu (kể cả trong chuỗi giá không đổi và archive) là một dòng.
+    polls = engine.get_history(limit=None, start=int(bar_epochs[0]) - max_gap, end=int(bar_epochs[-1]) + max_gap,
+                               columns=('sjc_sell_price', 'sjc_buy_price'))
+    polls = polls.dropna(subset=['sjc_sell_price', 'sjc_buy_price'])
+    poll_epochs = polls['ts_epoch'].to_numpy(dtype=np.int64)
+    sjc = polls[['sjc_sell_price', 'sjc_buy_price']].to_numpy(dtype=float)
+
+    # Snapshot đầu tiên tại/sau mỗi nến và snapshot cuối cùng trước nó.
+    after = np.searchsorted(poll_epochs, bar_epochs, side='left')
+    before = after - 1
+    inside = (before >= 0) & (after < len(poll_epochs))
+    covered = np.zeros(len(bar_epochs), dtype=bool)
+    has_next = after < len(poll_epochs)
+    covered[has_next] = poll_epochs[after[has_next]] < bar_epochs[has_next] + bar_seconds
+    fillable = inside & ~covered
+    fillable[fillable] = (
+        (poll_epochs[after[fillable]] - poll_epochs[before[fillable]] <= max_gap)
+        & (sjc[after[fillable]] == sjc[before[fillable]]).all(axis=1)
+    )
+    stats['covered'] = int(covered.sum())
+    stats['skipped'] = int((~covered & ~fillable).sum())
+    if not fillable.any():
+        return stats
+
+    global_price = series['global_price'].to_numpy(dtype=float)[fillable]
+    exchange_rate = series['exchange_rate'].to_numpy(dtype=float)[fillable]
+    sjc_sell, sjc_buy = sjc[before[fillable]].T
+    converted = calculate_converted_global_prices(global_price, exchange_rate)
+    gaps = calculate_gaps(sjc_sell, converted)
+    stats['saved'] = engine.save_backfill(
+        {
+            "timestamp": ts,
+            "global_price": float(g),
+            "exchange_rate": float(r),
+            "sjc_sell": float(sell),
+            "sjc_buy": float(buy),
+            "converted_price": float(c),
+            "gap": float(gap),
+        }
+        for ts, g, r, sell, buy, c, gap in zip(index[fillable].to_pydatetime(), global_price, exchange_rate,
+                                               sjc_sell, sjc_buy, converted, gaps)
+    )
+    return stats
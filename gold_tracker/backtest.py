@@ -0,0 +1,222 @@
+import os
+import time
+import logging
+import itertools
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# kind: 'threshold' (entry/exit là mức gap, Million VND) hoặc 'zscore' (entry/exit là z-score,
+# window là số snapshot dùng để tính trung bình/độ lệch chuẩn trượt; 0 với 'threshold').
+Strategy = namedtuple('Strategy', ['kind', 'entry', 'exit', 'window'])
+
+# Số chiến lược mỗi tác vụ gửi sang process pool: đủ lớn để chi phí pickle không đáng kể.
+CHUNK_SIZE = 64
+
+HISTORY_COLUMNS = ['sjc_sell_price', 'sjc_buy_price', 'gap']
+
+
+def load_market(df):
+    """
+    Lấy các mảng cần cho backtest từ DataFrame của storage.get_history.
+
+    DataFrame phải có mỗi lần thu thập một dòng (get_history với expand_runs=True) để `lag`
+    và window của z-score tính theo số lần thu thập, không theo số dòng đã lưu.
+    Bỏ các snapshot thiếu giá mua/bán SJC hoặc gap.
+
+    Returns:
+        dict: 'ask' (giá SJC bán ra, giá nhà đầu tư mua vào), 'bid' (giá SJC mua vào),
+        'gap' (Million VND) và 'timestamp', đều là numpy.ndarray cùng độ dài.
+    """
+    df = df.dropna(subset=HISTORY_COLUMNS)
+    return {
+        'timestamp': df['timestamp'].to_numpy(),
+        'ask': df['sjc_sell_price'].to_numpy(dtype=float),
+        'bid': df['sjc_buy_price'].to_numpy(dtype=float),
+        'gap': df['gap'].to_numpy(dtype=float),
+    }
+
+
+def rolling_zscore(values, window):
+    """
+    Z-score trượt của `values` so với `window` giá trị gần nhất (tính cả giá trị hiện tại).
+
+    Dùng tổng tích lũy nên chi phí O(n) cho mọi window; NaN cho `window - 1` vị trí đầu
+    và khi độ lệch chuẩn bằng 0.
+    """
+    n = len(values)
+    z = np.full(n, np.nan)
+    if window < 2 or n < window:
+        return z
+    # Trừ trung bình toàn chuỗi trước khi cộng dồn để bình phương không mất độ chính xác.
+    centered = values - values.mean()
+    s1 = np.concatenate(([0.0], np.cumsum(centered)))
+    s2 = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    sums = s1[window:] - s1[:-window]
+    mean = sums / window
+    var = (s2[window:] - s2[:-window] - sums * mean) / (window - 1)
+    std = np.sqrt(np.maximum(var, 0.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z[window - 1:] = np.where(std > 0, (centered[window - 1:] - mean) / std, np.nan)
+    return z
+
+
+def positions(indicator, entry, exit):
+    """
+    Trạng thái nắm giữ (0/1) với ngưỡng trễ: vào khi indicator <= entry, ra khi indicator >= exit.
+
+    Giữa hai ngưỡng thì giữ nguyên trạng thái trước; vector hóa bằng cách lan truyền chỉ số
+    của tín hiệu gần nhất (np.maximum.accumulate) thay cho vòng lặp.
+    """
+    signal = np.full(len(indicator), -1, dtype=np.int8)
+    signal[indicator >= exit] = 0
+    signal[indicator <= entry] = 1
+    idx = np.where(signal >= 0, np.arange(len(signal)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    held = signal[idx]
+    # Trước tín hiệu đầu tiên (signal[0] == -1) là chưa nắm giữ.
+    return (held == 1).astype(np.int8)
+
+
+def evaluate(market, held, lag=1):
+    """
+    Đánh giá một chuỗi trạng thái nắm giữ trên giá SJC, tính cả chênh lệch mua/bán.
+
+    Lệnh quyết định ở snapshot t được khớp ở snapshot t + lag: mua ở giá bán ra (ask),
+    bán ở giá mua vào (bid). Vị thế còn mở ở cuối được định giá theo bid cuối cùng.
+
+    Returns:
+        dict: total_return, trades, win_rate, exposure, max_drawdown.
+    """
+    ask, bid = market['ask'], market['bid']
+    n = len(ask)
+    pos = np.zeros(n, dtype=np.int8)
+    if n > lag:
+        pos[lag:] = held[:n - lag]
+    change = np.diff(pos, prepend=0)
+    entered, exited = change == 1, change == -1
+    entries = np.flatnonzero(entered)
+    exits = np.flatnonzero(exited)
+    if len(entries) == 0:
+        return {'total_return': 0.0, 'trades': 0, 'win_rate': None, 'exposure': 0.0, 'max_drawdown': 0.0}
+    # Vị thế cuối chưa đóng: định giá ở snapshot cuối.
+    closes = np.append(exits, n - 1) if len(exits) < len(entries) else exits
+    multipliers = bid[closes] / ask[entries]
+
+    # Giá trị danh mục theo thời gian: tích các giao dịch đã đóng × lãi/lỗ của vị thế đang mở.
+    completed = np.concatenate(([1.0], np.cumprod(multipliers)))
+    equity = completed[np.cumsum(exited)]
+    open_ = pos == 1
+    current = np.cumsum(entered)[open_] - 1
+    equity[open_] *= bid[open_] / ask[entries[current]]
+    drawdown = 1.0 - equity / np.maximum.accumulate(equity)
+
+    return {
+        'total_return': float(completed[-1] - 1.0),
+        'trades': int(len(entries)),
+        'win_rate': float((multipliers > 1.0).mean()),
+        'exposure': float(pos.mean()),
+        'max_drawdown': float(drawdown.max()),
+    }
+
+
+def buy_and_hold(market):
+    """Lợi nhuận khi mua ở snapshot đầu và bán ở snapshot cuối (mốc so sánh)."""
+    return float(market['bid'][-1] / market['ask'][0] - 1.0)
+
+
+def run_strategy(market, strategy, lag=1, _zscores=None):
+    """Chạy một chiến lược; `_zscores` là cache z-score theo window dùng chung giữa các lần gọi."""
+    if strategy.kind == 'threshold':
+        indicator = market['gap']
+    elif strategy.kind == 'zscore':
+        if _zscores is None:
+            _zscores = {}
+        if strategy.window not in _zscores:
+            _zscores[strategy.window] = rolling_zscore(market['gap'], strategy.window)
+        indicator = _zscores[strategy.window]
+    else:
+        raise ValueError(f"Unknown strategy kind: {strategy.kind!r}")
+    result = evaluate(market, positions(indicator, strategy.entry, strategy.exit), lag)
+    result['strategy'] = strategy
+    return result
+
+
+def threshold_grid(entries, exits):
+    """Các chiến lược ngưỡng gap, chỉ giữ cặp có entry < exit."""
+    return [Strategy('threshold', float(e), float(x), 0) for e, x in itertools.product(entries, exits) if e < x]
+
+
+def zscore_grid(windows, entries, exits):
+    """Các chiến lược z-score, ví dụ entries=[-2, -1.5], exits=[0, 1]; chỉ giữ cặp có entry < exit."""
+    return [
+        Strategy('zscore', float(e), float(x), int(w))
+        for w, e, x in itertools.product(windows, entries, exits) if e < x
+    ]
+
+
+def default_grid(market):
+    """
+    Lưới mặc định: ngưỡng gap theo các phân vị 5..95 của lịch sử, và z-score với window
+    1 giờ, 4 giờ, 1 ngày, 1 tuần (theo chu kỳ thu thập 5 phút).
+    """
+    levels = np.unique(np.round(np.percentile(market['gap'], np.arange(5, 100, 5)), 2))
+    z_levels = np.arange(-3.0, 2.01, 0.25)
+    return threshold_grid(levels, levels) + zscore_grid([12, 48, 288, 2016], z_levels[z_levels < 0], z_levels)
+
+
+# Dữ liệu thị trường của mỗi worker, nạp một lần qua initializer thay vì gửi kèm từng tác vụ.
+_worker_market = None
+_worker_zscores = {}
+
+
+def _init_worker(market):
+    global _worker_market, _worker_zscores
+    _worker_market = market
+    _worker_zscores = {}
+
+
+def _run_chunk(strategies, lag):
+    return [run_strategy(_worker_market, s, lag, _worker_zscores) for s in strategies]
+
+
+def run_grid(market, strategies, workers=None, lag=1, chunk_size=CHUNK_SIZE):
+    """
+    Chạy nhiều chiến lược, chia theo lô cho một process pool.
+
+    Chiến lược được sắp theo (kind, window) trước khi chia lô để mỗi worker tính z-score
+    của một window càng ít lần càng tốt.
+
+    Args:
+        market (dict): Kết quả của load_market.
+        strategies (list[Strategy]): Lưới tham số.
+        workers (int): Số process; 1 để chạy ngay trong process hiện tại, None = số CPU.
+        lag (int): Số snapshot giữa tín hiệu và lúc khớp lệnh.
+
+    Returns:
+        tuple: (danh sách kết quả theo thứ tự của `strategies`, số chiến lược mỗi giây)
+    """
+    workers = workers or os.cpu_count() or 1
+    order = sorted(range(len(strategies)), key=lambda i: (strategies[i].kind, strategies[i].window))
+    ordered = [strategies[i] for i in order]
+    chunks = [ordered[i:i + chunk_size] for i in range(0, len(ordered), chunk_size)]
+
+    start = time.perf_counter()
+    if workers == 1 or len(chunks) <= 1:
+        zscores = {}
+        results = [run_strategy(market, s, lag, zscores) for s in ordered]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(market,)) as pool:
+            results = [r for chunk in pool.map(_run_chunk, chunks, itertools.repeat(lag)) for r in chunk]
+    elapsed = time.perf_counter() - start
+
+    by_index = [None] * len(strategies)
+    for i, result in zip(order, results):
+        by_index[i] = result
+    rate = len(strategies) / elapsed if elapsed > 0 else float('inf')
+    logger.info(f"Backtested {len(strategies)} strategies on {len(market['ask'])} snapshots "
+                f"with {workers} worker(s): {rate:,.0f} strategies/s")
+    return by_index, rate
@@ -1,3 +1,5 @@
+# numpy/pandas chỉ cần cho các hàm vector hóa nên được import bên trong các hàm đó.
+
 def calculate_converted_global_price(global_price_usd, exchange_rate):
     """
     Chuyển đổi giá vàng toàn cầu ($/oz) thành giá vàng địa phương (Million VND/lượng).
@@ -35,3 +37,53 @@ def calculate_gap(sjc_price_vnd, converted_global_price_million_vnd):
     
     gap = sjc_million - converted_global_price_million_vnd
     return gap
+
+def _as_float_array(values):
+    """Chuyển Series/list/array thành dữ liệu float; None trở thành NaN."""
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(values, pd.Series):
+        return values.astype(float)
+    return np.asarray(values, dtype=float)
+
+def calculate_converted_global_prices(global_price_usd, exchange_rate):
+    """
+    Phiên bản vector hóa của calculate_converted_global_price.
+
+    Args:
+        global_price_usd (array-like | pandas.Series): Giá vàng toàn cầu.
+        exchange_rate (array-like | pandas.Series): Tỷ giá USD/VND.
+
+    Returns:
+        numpy.ndarray | pandas.Series: Giá quy đổi (Million VND/lượng); NaN khi thiếu dữ liệu.
+    """
+    return _as_float_array(global_price_usd) * _as_float_array(exchange_rate) / 1000000
+
+def calculate_gaps(sjc_price_vnd, converted_global_price_million_vnd):
+    """
+    Phiên bản vector hóa của calculate_gap.
+
+    Args:
+        sjc_price_vnd (array-like | pandas.Series): Giá SJC trong VND.
+        converted_global_price_million_vnd (array-like | pandas.Series): Giá quy đổi trong Million VND.
+
+    Returns:
+        numpy.ndarray | pandas.Series: Khoảng cách trong Million VND; NaN khi thiếu dữ liệu.
+    """
+    return _as_float_array(sjc_price_vnd) / 1000000 - _as_float_array(converted_global_price_million_vnd)
+
+def recompute_derived(df):
+    """
+    Tính lại converted_price và gap cho toàn bộ DataFrame lịch sử trong một lượt.
+
+    Args:
+        df (pandas.DataFrame): Có các cột global_price_usd, exchange_rate, sjc_sell_price.
+
+    Returns:
+        pandas.DataFrame: Bản sao với converted_price và gap đã được tính lại.
+    """
+    df = df.copy()
+    df['converted_price'] = calculate_converted_global_prices(df['global_price_usd'], df['exchange_rate'])
+    df['gap'] = calculate_gaps(df['sjc_sell_price'], df['converted_price'])
+    return df
@@ -0,0 +1,142 @@
+import os
+import time
+import logging
+
+from gold_tracker import metrics
+from gold_tracker.orchestrator import SOURCES, fetch_all_sources, format_source_status, is_fresh
+from gold_tracker.calculator import calculate_converted_global_price, calculate_gap
+from gold_tracker.storage import save_snapshot, archive_snapshots, ingest_news, get_engine
+
+logger = logging.getLogger(__name__)
+
+# Chu kỳ thu thập mặc định (giây).
+COLLECT_INTERVAL = int(os.getenv("COLLECT_INTERVAL", "300"))
+
+# Dashboard coi dữ liệu của collector là cũ sau chừng này chu kỳ thu thập (xem get_stale_after).
+STALE_INTERVALS = 3
+STALE_AFTER = STALE_INTERVALS * COLLECT_INTERVAL
+
+# Khóa trong bảng meta lưu chu kỳ của collector đang ghi database.
+INTERVAL_META_KEY = "collect_interval"
+
+# File metric dạng Prometheus được ghi lại sau mỗi lần thu thập (textfile collector của node_exporter).
+METRICS_FILE = os.getenv("GOLD_METRICS_FILE")
+
+# Khoảng thời gian giữa hai lần chuyển snapshot cũ sang archive khi chạy với archive=True.
+ARCHIVE_INTERVAL = 24 * 3600
+
+# Các nguồn quyết định có lưu snapshot hay không. Collector lấy thêm tin tức để lưu tiêu đề mới
+# vào bảng news, nhờ đó dashboard chỉ cần đọc (xem llm_analyzer.select_news).
+PRICE_SOURCES = {name: func for name, func in SOURCES.items() if name != 'news'}
+
+
+def build_snapshot(global_price, exchange_rate, sjc_data):
+    """Tính giá quy đổi và chênh lệch, trả về dict snapshot cho save_snapshot."""
+    converted_price = calculate_converted_global_price(global_price, exchange_rate)
+    return {
+        "global_price": global_price,
+        "exchange_rate": exchange_rate,
+        "sjc_sell": sjc_data['sell'],
+        "sjc_buy": sjc_data['buy'],
+        "converted_price": converted_price,
+        "gap": calculate_gap(sjc_data['sell'], converted_price),
+    }
+
+
+def collect_once():
+    """
+    Lấy dữ liệu giá và tin tức một lần và lưu vào database.
+
+    Tiêu đề tin tức mới luôn được lưu. Snapshot giá không được lưu nếu bất kỳ nguồn giá nào
+    thiếu hoặc chỉ có dữ liệu cũ, để lịch sử chỉ chứa dữ liệu thật.
+
+    Returns:
+        dict: Snapshot đã lưu, hoặc None nếu thiếu dữ liệu.
+    """
+    result = fetch_all_sources()
+    logger.info(format_source_status(result))
+
+    headlines = result['values']['news']
+    if headlines:
+        fresh = ingest_news(headlines)
+        if fresh:
+            logger.info(f"Stored {len(fresh)} new headlines")
+
+    if not is_fresh(result, PRICE_SOURCES):
+        logger.warning("Incomplete or stale market data, snapshot skipped")
+        return None
+
+    market = result['values']['market']
+    global_price = market['global_price']
+    exchange_rate = market['exchange_rate']
+    sjc_data = result['values']['sjc_data']
+
+    snapshot = build_snapshot(global_price, exchange_rate, sjc_data)
+    save_snapshot(snapshot)
+    logger.info(f"Saved snapshot: SJC {sjc_data['sell']:,.0f} VND, gap {snapshot['gap']:.2f} Million VND")
+    return snapshot
+
+
+def get_stale_after():
+    """
+    Số giây sau đó dữ liệu của collector được coi là cũ.
+
+    Tính theo chu kỳ mà collector ghi vào database khi khởi động (`collect --interval`), vì
+    dashboard chạy trong tiến trình khác; STALE_AFTER nếu chưa có collector nào ghi.
+    """
+    try:
+        interval = get_engine().get_meta(INTERVAL_META_KEY)
+    except Exception as e:
+        logger.error(f"Could not read the collector interval: {e}")
+        interval = None
+    return STALE_INTERVALS * float(interval) if interval else STALE_AFTER
+
+
+def run_collector(interval=COLLECT_INTERVAL, iterations=None, metrics_file=METRICS_FILE, archive=False):
+    """
+    Thu thập dữ liệu theo chu kỳ cho đến khi bị dừng (Ctrl+C).
+
+    Chỉ nên chạy một collector cho mỗi database; dashboard chỉ đọc dữ liệu mà nó ghi.
+
+    Args:
+        interval (float): Số giây giữa hai lần thu thập.
+            Được ghi vào database để dashboard tính độ mới của dữ liệu (xem get_stale_after).
+        iterations (int): Số lần thu thập tối đa, None để chạy mãi.
+        metrics_file (str): Nếu có, bật metrics và ghi bản dump Prometheus vào file này sau mỗi lần thu thập.
+        archive (bool): Mỗi ARCHIVE_INTERVAL giây chuyển snapshot cũ sang archive (xem storage.archive_snapshots).
+    """
+    if metrics_file:
+        metrics.enable()
+    logger.info(f"Collector started, interval {interval}s")
+    try:
+        get_engine().set_meta(INTERVAL_META_KEY, interval)
+    except Exception as e:
+        logger.error(f"Could not record the collector interval: {e}")
+    count = 0
+    last_archive = None
+    try:
+        while iterations is None or count < iterations:
+            started = time.monotonic()
+            try:
+                collect_once()
+            except Exception as e:
+                logger.error(f"Collection failed: {e}")
+            if archive and (last_archive is None or started - last_archive >= ARCHIVE_INTERVAL):
+                last_archive = started
+                try:
+                    moved = archive_snapshots()
+                    if moved:
+                        logger.info(f"Archived {moved} old snapshots")
+                except Exception as e:
+                    logger.error(f"Archiving failed: {e}")
+            if metrics_file:
+                try:
+                    metrics.write_textfile(metrics_file)
+                except OSError as e:
+                    logger.error(f"Could not write metrics to {metrics_file}: {e}")
+            count += 1
+            if iterations is not None and count >= iterations:
+                break
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        logger.info("Collector stopped")
@@ -0,0 +1,71 @@
+import queue
+import sqlite3
+import threading
+
+
+class _Lease:
+    """Kết nối mà một thread đang mượn; trả về pool khi thread kết thúc (thread-local bị xóa)."""
+
+    def __init__(self, pool, conn):
+        self.pool = pool
+        self.conn = conn
+
+    def __del__(self):
+        if self.conn is not None:
+            self.pool._release(self.conn)
+
+
+class ConnectionPool:
+    """
+    Pool kết nối SQLite nhỏ, mỗi thread mượn một kết nối.
+
+    Mỗi thread mượn một kết nối từ pool và giữ nó suốt vòng đời của thread; khi thread
+    kết thúc, kết nối quay lại pool (tối đa `size` kết nối rảnh) thay vì bị đóng.
+    Streamlit chạy mỗi lần rerun trong một thread mới, nhờ vậy các lần rerun dùng lại
+    kết nối đã mở thay vì mở kết nối mới. `open_connection` phải tạo kết nối với
+    check_same_thread=False; tại mỗi thời điểm chỉ một thread dùng một kết nối.
+    """
+
+    def __init__(self, open_connection, size):
+        self._open_connection = open_connection
+        self._local = threading.local()
+        self._idle = queue.LifoQueue(maxsize=size)
+        self.opened = 0
+
+    def _release(self, conn):
+        # Gọi khi thread đã kết thúc: bỏ transaction dở dang (nếu có) rồi trả kết nối về pool.
+        # size=0 tắt pool: kết nối bị đóng cùng thread.
+        try:
+            if self._idle.maxsize <= 0:
+                raise queue.Full
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (sqlite3.Error, queue.Full):
+            conn.close()
+
+    def connection(self):
+        """Trả về kết nối của thread hiện tại, mượn từ pool hoặc mở mới nếu pool rỗng."""
+        lease = getattr(self._local, 'lease', None)
+        if lease is None:
+            try:
+                # LIFO: kết nối vừa trả về còn cache trang "nóng" nhất.
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open_connection()
+                self.opened += 1
+            lease = self._local.lease = _Lease(self, conn)
+        return lease.conn
+
+    def close(self):
+        """Đóng kết nối của thread hiện tại và các kết nối rảnh trong pool."""
+        lease = getattr(self._local, 'lease', None)
+        if lease is not None:
+            conn, lease.conn = lease.conn, None
+            conn.close()
+            self._local.lease = None
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
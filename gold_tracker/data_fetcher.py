@@ -1,161 +1,380 @@
-import requests
-from bs4 import BeautifulSoup
-import yfinance as yf
 import logging
+import threading
+
+from gold_tracker import metrics
+
+# requests, bs4, lxml, yfinance và pandas được import khi cần để CLI khởi động nhanh
+# (các lệnh không lấy dữ liệu như `--mock` không phải trả chi phí import của chúng).
 
 logger = logging.getLogger(__name__)
 
-def get_global_gold_price():
+SJC_URL = "https://webgia.com/gia-vang/sjc/"
+NEWS_URL = "https://vnexpress.net/kinh-doanh/hang-hoa"
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+
+# Số tiêu đề tin tức tối đa lấy từ VnExpress.
+NEWS_LIMIT = 10
+
+# Module lxml.html và parser của nó (cả webgia và VnExpress đều dùng UTF-8), nạp ở lần dùng đầu tiên.
+# False nghĩa là chưa thử import.
+_lxml_html_module = False
+_LXML_PARSER = None
+
+# Số kết nối keep-alive tối đa cho mỗi host trong pool.
+HTTP_POOL_SIZE = 10
+
+_session = None
+_session_lock = threading.Lock()
+
+# url -> {'etag': str, 'last_modified': str, 'result': kết quả parse}
+_conditional_cache = {}
+
+GOLD_TICKER = "GC=F"
+USD_VND_TICKER = "VND=X"
+# Hệ số quy đổi giá vàng từ ounce sang lượng.
+RATE_OZ_TO_LUONG = 1.20565
+
+def _lxml_html():
+    """Trả về module lxml.html, hoặc None nếu lxml chưa được cài."""
+    global _lxml_html_module, _LXML_PARSER
+    if _lxml_html_module is False:
+        try:
+            import lxml.html
+            _LXML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+            _lxml_html_module = lxml.html
+        except ImportError:  # lxml là tùy chọn; BeautifulSoup + html.parser được dùng khi thiếu
+            _lxml_html_module = None
+    return _lxml_html_module
+
+def _download_closes(period, interval):
+    """Tải giá đóng cửa của GC=F và VND=X trong một lần gọi yfinance."""
+    import yfinance as yf
+
+    data = yf.download(
+        [GOLD_TICKER, USD_VND_TICKER],
+        period=period,
+        interval=interval,
+        progress=False,
+        auto_adjust=False,
+        threads=True,
+    )
+    if data is None or data.empty:
+        return None
+    closes = data['Close'].rename(columns={GOLD_TICKER: 'global_price', USD_VND_TICKER: 'exchange_rate'})
+    closes.columns.name = None
+    # Vàng (USD/oz) -> USD/lượng, áp dụng vector hóa cho cả chuỗi.
+    closes['global_price'] = closes['global_price'] * RATE_OZ_TO_LUONG
+    return closes[['global_price', 'exchange_rate']]
+
+def get_market_quotes():
     """
-    Lấy giá vàng quốc tế (XAU/USD) sử dụng yfinance.
+    Lấy giá vàng quốc tế và tỷ giá USD/VND mới nhất trong một lần gọi yfinance.
     Returns:
-        float: Giá vàng trong đô la США mỗi ounce.
+        dict: {'global_price': float|None (USD/lượng), 'exchange_rate': float|None}, hoặc None nếu không có dữ liệu.
     """
     try:
-        # GC=F là Futures của vàng, đây là một proxy tốt cho giá spot.
-        # Hoặc có thể tìm ticker tốt hơn nếu cần.
-        ticker = yf.Ticker("GC=F")
-        rateOzToVN = 1.20565
-        # Lấy giá mới nhất
-        data = ticker.history(period="1d")
-        if not data.empty:
-            price = data['Close'].iloc[-1]
-            return price * rateOzToVN
-        else:
-            logger.error("Không có dữ liệu cho GC=F")
+        closes = _download_closes(period="5d", interval="1d")
+        if closes is None:
+            logger.error(f"Không có dữ liệu cho {GOLD_TICKER}/{USD_VND_TICKER}")
             return None
+        quotes = {}
+        for column in ('global_price', 'exchange_rate'):
+            # Hai thị trường có giờ giao dịch khác nhau nên lấy giá trị hợp lệ cuối cùng của từng cột.
+            series = closes[column].dropna()
+            quotes[column] = float(series.iloc[-1]) if not series.empty else None
+        return quotes
     except Exception as e:
         logger.error(f"Error: {e}")
         return None
 
-def get_usd_vnd_rate():
+def get_market_series(period="5d", interval="5m"):
     """
-    Lấy tỷ giá USD/VND sử dụng yfinance.
+    Lấy chuỗi giá intraday của vàng quốc tế và tỷ giá USD/VND trong một lần gọi.
+
+    Args:
+        period (str): Khoảng thời gian theo cú pháp yfinance, ví dụ "1d", "5d", "1mo".
+        interval (str): Độ phân giải nến, ví dụ "5m", "15m", "1h".
+
     Returns:
-        float: Tỷ giá (VND mỗi USD).
+        pandas.DataFrame: Index thời gian, cột 'global_price' (USD/lượng) và 'exchange_rate',
+        đã được forward-fill để hai chuỗi khớp nhau. DataFrame rỗng nếu lỗi.
     """
+    import pandas as pd
+
     try:
-        ticker = yf.Ticker("VND=X")
-        data = ticker.history(period="1d")
-        if not data.empty:
-            rate = data['Close'].iloc[-1]
-            return rate
-        else:
-            logger.error("Không có dữ liệu cho VND=X")
-            return None
+        closes = _download_closes(period=period, interval=interval)
+        if closes is None:
+            logger.error(f"Không có dữ liệu intraday cho {GOLD_TICKER}/{USD_VND_TICKER}")
+            return pd.DataFrame(columns=['global_price', 'exchange_rate'])
+        return closes.sort_index().ffill().dropna()
     except Exception as e:
         logger.error(f"Error: {e}")
+        return pd.DataFrame(columns=['global_price', 'exchange_rate'])
+
+def _get_session():
+    """Trả về requests.Session dùng chung (keep-alive, connection pool)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update(HEADERS)
+                _session = session
+    return _session
+
+def fetch_parsed(url, parse, timeout=10):
+    """
+    GET có điều kiện (ETag/If-Modified-Since) với kết quả parse được cache theo validator.
+
+    Nếu server trả về 304, kết quả parse lần trước được dùng lại, bỏ qua cả việc
+    tải trang lẫn việc parse BeautifulSoup.
+
+    Args:
+        url (str): Địa chỉ trang cần lấy.
+        parse (callable): Hàm nhận `bytes` nội dung trang, trả về kết quả hoặc None.
+        timeout (float): Timeout của request (giây).
+
+    Returns:
+        Kết quả của `parse`, hoặc None nếu request thất bại.
+    """
+    entry = _conditional_cache.get(url)
+    headers = {}
+    if entry:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    response = _get_session().get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and entry:
+        metrics.inc("cache_requests_total", cache="http_conditional", result="hit")
+        return entry['result']
+    metrics.inc("cache_requests_total", cache="http_conditional", result="miss")
+    if response.status_code != 200:
         return None
 
+    with metrics.span("parse_seconds", parser=parse.__name__.strip('_')):
+        result = parse(response.content)
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if result is not None and (etag or last_modified):
+        _conditional_cache[url] = {'etag': etag, 'last_modified': last_modified, 'result': result}
+    else:
+        _conditional_cache.pop(url, None)
+    return result
+
+def _normalize_sjc_prices(buy_text, sell_text):
+    """
+    Chuyển chuỗi giá mua/bán trên webgia thành VND/lượng.
+
+    Raises:
+        ValueError: Nếu chuỗi không phải là số.
+    """
+    buy_text = buy_text.strip().replace('.', '').replace(',', '.')
+    sell_text = sell_text.strip().replace('.', '').replace(',', '.')
+
+    # Convert to float
+    buy_price = float(buy_text)
+    sell_price = float(sell_text)
+
+    # Webgia thường hiển thị giá vàng trong '000 VND hoặc Million.
+    # Chúng ta sẽ kiểm tra mức độ. Nếu gần 70-90, nó là million.
+    # Nếu gần 70000, nó là thousand.
+    # Giá vàng hiện tại thường là 80-90 million VND / lượng.
+
+    # Nếu giá trị được phân tích lớn hơn 1,000,000, nó có thể là VND thô.
+    # Nếu gần 80,000, nó có thể là '000 VND.
+    # Nếu gần 80, nó có thể là million.
+
+    # Chúng ta sẽ chuẩn hóa tất cả về VND (full units).
+    # Nhưng webgia có thể hiển thị "80,000" có nghĩa là 80,000,000? Không, thường "80,000" có nghĩa là 80,000,000 nếu đơn vị là '000.
+    # Chúng ta sẽ giả sử trang web sử dụng đơn vị '000.
+    # Ví dụ: 80,000 -> 80,000,000.
+
+    # Nếu phân tích không chắc chắn, chúng ta có thể cần xác nhận thủ công.
+    # Nhưng thường webgia hiển thị giá vàng trong '000 VND hoặc Million.
+    # Chúng ta sẽ giả sử nó là '000 VND.
+    # Ví dụ: 80,000 -> 80,000,000.
+
+    if buy_price < 1000: # Million (e.g. 80.5)
+        buy_price *= 1000000
+        sell_price *= 1000000
+    elif buy_price < 1000000: # Thousand (e.g. 80500)
+        buy_price *= 1000
+        sell_price *= 1000
+
+    # Heuristic check for unit (Chỉ vs Lượng/lượng)
+    # Nếu giá trị nằm trong khoảng 5M - 40M, và năm hiện tại > 2024, có thể là per Chỉ (3.75g)
+    # Giá vàng > 70M/lượng kể từ năm 2024.
+    # Vì vậy, nếu thấy giá ~17M, có thể là per Chỉ.
+    # Chúng ta muốn VND/lượng.
+    if 5000000 < sell_price < 50000000:
+        buy_price *= 10
+        sell_price *= 10
+
+    return {'buy': buy_price, 'sell': sell_price}
+
+def _parse_sjc_html_soup(content):
+    """Trích xuất giá mua/bán SJC từ HTML của webgia.com bằng BeautifulSoup (chậm, dự phòng)."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'html.parser')
+    # Tìm bảng chứa "SJC"
+    # Cấu trúc trang web thường có bảng với các thành phố.
+    # Chúng ta muốn giá vàng tiêu chuẩn tại SJC (thường là hàng đầu hoặc HCM).
+
+    # Phương pháp đơn giản: Tìm tất cả các bảng, tìm bảng có "Mua vào"
+    tables = soup.find_all('table')
+    for table in tables:
+        if "Mua" in table.text and "Bán" in table.text:
+            rows = table.find_all('tr')
+            for row in rows:
+                cols = row.find_all('td')
+                # Tìm hàng chứa giá vàng tiêu chuẩn tại SJC, thường là hàng đầu tiên hoặc HCM
+                # Dòng này có thể có dạng "SJC 1L - 10L" hoặc chỉ "SJC"
+                # Để đơn giản, chúng ta lấy hàng đầu tiên có giá trị hợp lệ sau tiêu đề
+                if len(cols) >= 3:
+                    # Dòng có dạng: Loại | Mua | Bán
+                    try:
+                        return _normalize_sjc_prices(cols[1].text, cols[2].text)
+                    except ValueError:
+                        continue
+    return None
+
+def _parse_sjc_html_lxml(content):
+    """Giống _parse_sjc_html_soup nhưng dùng lxml và dừng ngay ở hàng giá hợp lệ đầu tiên."""
+    doc = _lxml_html().document_fromstring(content, parser=_LXML_PARSER)
+    for table in doc.iter('table'):
+        text = table.text_content()
+        if "Mua" not in text or "Bán" not in text:
+            continue
+        for row in table.iter('tr'):
+            cols = row.xpath('.//td')
+            if len(cols) >= 3:
+                try:
+                    return _normalize_sjc_prices(cols[1].text_content(), cols[2].text_content())
+                except ValueError:
+                    continue
+    return None
+
+def _parse_sjc_html(content):
+    """Trích xuất giá mua/bán SJC từ HTML của webgia.com (lxml nếu có, BeautifulSoup dự phòng)."""
+    if _lxml_html() is not None:
+        try:
+            result = _parse_sjc_html_lxml(content)
+            if result is not None:
+                return result
+        except Exception as e:
+            logger.warning(f"lxml SJC parser failed, falling back to html.parser: {e}")
+    return _parse_sjc_html_soup(content)
+
 def get_sjc_gold_price():
     """
     Lấy giá vàng tại SJC từ webgia.com.
     Returns:
         dict: {'buy': float, 'sell': float} trong VND/lượng (thường là triệu VND, nhưng chúng ta sẽ chuẩn hóa).
     """
-    url = "https://webgia.com/gia-vang/sjc/"
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-    
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            # Tìm bảng chứa "SJC"
-            # Cấu trúc trang web thường có bảng với các thành phố.
-            # Chúng ta muốn giá vàng tiêu chuẩn tại SJC (thường là hàng đầu hoặc HCM).
-            
-            # Phương pháp đơn giản: Tìm tất cả các bảng, tìm bảng có "Mua vào"
-            tables = soup.find_all('table')
-            for table in tables:
-                if "Mua" in table.text and "Bán" in table.text:
-                    rows = table.find_all('tr')
-                    for row in rows:
-                        cols = row.find_all('td')
-                        # Tìm hàng chứa giá vàng tiêu chuẩn tại SJC, thường là hàng đầu tiên hoặc HCM
-                        # Dòng này có thể có dạng "SJC 1L - 10L" hoặc chỉ "SJC"
-                        # Để đơn giản, chúng ta lấy hàng đầu tiên có giá trị hợp lệ sau tiêu đề
-                        if len(cols) >= 3:
-                            # Dòng có dạng: Loại | Mua | Bán
-                            try:
-                                buy_text = cols[1].text.strip().replace('.', '').replace(',', '.')
-                                sell_text = cols[2].text.strip().replace('.', '').replace(',', '.')
-                                
-                                # Convert to float
-                                buy_price = float(buy_text)
-                                sell_price = float(sell_text)
-                                
-                                # Webgia thường hiển thị giá vàng trong '000 VND hoặc Million. 
-                                # Chúng ta sẽ kiểm tra mức độ. Nếu gần 70-90, nó là million. 
-                                # Nếu gần 70000, nó là thousand.
-                                # Giá vàng hiện tại thường là 80-90 million VND / lượng.
-                                
-                                # Nếu giá trị được phân tích lớn hơn 1,000,000, nó có thể là VND thô.
-                                # Nếu gần 80,000, nó có thể là '000 VND.
-                                # Nếu gần 80, nó có thể là million.
-                                
-                                # Chúng ta sẽ chuẩn hóa tất cả về VND (full units).
-                                # Nhưng webgia có thể hiển thị "80,000" có nghĩa là 80,000,000? Không, thường "80,000" có nghĩa là 80,000,000 nếu đơn vị là '000.
-                                # Chúng ta sẽ giả sử trang web sử dụng đơn vị '000.
-                                # Ví dụ: 80,000 -> 80,000,000.
-                                
-                                # Nếu phân tích không chắc chắn, chúng ta có thể cần xác nhận thủ công.
-                                # Nhưng thường webgia hiển thị giá vàng trong '000 VND hoặc Million. 
-                                # Chúng ta sẽ giả sử nó là '000 VND.
-                                # Ví dụ: 80,000 -> 80,000,000.
-                                
-                                if buy_price < 1000: # Million (e.g. 80.5)
-                                    buy_price *= 1000000
-                                    sell_price *= 1000000
-                                elif buy_price < 1000000: # Thousand (e.g. 80500)
-                                    buy_price *= 1000
-                                    sell_price *= 1000
-                                
-                                # Heuristic check for unit (Chỉ vs Lượng/lượng)
-                                # Nếu giá trị nằm trong khoảng 5M - 40M, và năm hiện tại > 2024, có thể là per Chỉ (3.75g)
-                                # Giá vàng > 70M/lượng kể từ năm 2024.
-                                # Vì vậy, nếu thấy giá ~17M, có thể là per Chỉ.
-                                # Chúng ta muốn VND/lượng.
-                                if 5000000 < sell_price < 50000000:
-                                    buy_price *= 10
-                                    sell_price *= 10
-                                
-                                return {'buy': buy_price, 'sell': sell_price}
-                            except ValueError:
-                                continue
+        return fetch_parsed(SJC_URL, _parse_sjc_html)
     except Exception as e:
         logger.error(f"Error scraping SJC price: {e}")
     
     return None
 
-def fetch_gold_news():
+def _absolute_url(link):
+    # Đảm bảo link luôn có domain đầy đủ
+    if link and link.startswith('/'):
+        link = "https://vnexpress.net" + link
+    return link
+
+def format_headlines(items, links=True):
     """
-    Lấy tin tức vàng/kinh tế mới nhất từ VnExpress hoặc nguồn tương tự.
+    Ghép các tiêu đề thành danh sách Markdown, mỗi dòng một tin.
+
+    Args:
+        items (iterable): Các cặp (title, url) hoặc dict có khóa 'title', 'url' (từ storage.get_news).
+        links (bool): Kèm URL sau tiêu đề; bỏ đi để prompt gửi cho LLM ngắn hơn.
+
     Returns:
-        str: Một chuỗi chứa các điểm tin tức vàng/kinh tế.
+        str: Chuỗi tin tức, hoặc None nếu không có tin nào.
+    """
+    lines = []
+    for item in items:
+        title, url = (item['title'], item['url']) if isinstance(item, dict) else item
+        lines.append(f"- {title} ({url})" if links else f"- {title}")
+    return "\n".join(lines) or None
+
+def _parse_news_html_soup(content):
+    """Trích xuất top 10 tiêu đề (title, url) từ HTML của VnExpress bằng BeautifulSoup (chậm, dự phòng)."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'html.parser')
+    # Find news titles. VnExpress usually uses h3.title-news a
+    articles = soup.find_all('h2', class_='title-news')
+    headlines = []
+    for article in articles[:NEWS_LIMIT]: # Top 10 news
+        a_tag = article.find('a')
+        if a_tag:
+            title = a_tag.get('title') or a_tag.text.strip()
+            headlines.append((title, _absolute_url(a_tag.get('href'))))
+
+    return headlines or None
+
+def _parse_news_html_lxml(content):
+    """Giống _parse_news_html_soup nhưng dùng lxml và chỉ duyệt các thẻ h2.title-news."""
+    doc = _lxml_html().document_fromstring(content, parser=_LXML_PARSER)
+    articles = doc.xpath(
+        f"(//h2[contains(concat(' ', normalize-space(@class), ' '), ' title-news ')])[position() <= {NEWS_LIMIT}]"
+    )
+    headlines = []
+    for article in articles:
+        a_tag = article.find('.//a')
+        if a_tag is not None:
+            title = a_tag.get('title') or a_tag.text_content().strip()
+            headlines.append((title, _absolute_url(a_tag.get('href'))))
+
+    return headlines or None
+
+def _parse_news_html(content):
+    """Trích xuất top 10 tiêu đề tin tức từ HTML của VnExpress (lxml nếu có, BeautifulSoup dự phòng)."""
+    if _lxml_html() is not None:
+        try:
+            result = _parse_news_html_lxml(content)
+            if result is not None:
+                return result
+        except Exception as e:
+            logger.warning(f"lxml news parser failed, falling back to html.parser: {e}")
+    return _parse_news_html_soup(content)
+
+def get_news_headlines():
+    """
+    Lấy các tiêu đề tin tức vàng/kinh tế mới nhất từ VnExpress.
+
+    Không ghi gì vào database; collector lưu các tiêu đề này (xem storage.ingest_news).
+
+    Returns:
+        list: Các cặp (title, url) theo thứ tự trên trang, hoặc None nếu lỗi.
     """
-    url = "https://vnexpress.net/kinh-doanh/hang-hoa"
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-    
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            # Find news titles. VnExpress usually uses h3.title-news a
-            articles = soup.find_all('h2', class_='title-news')
-            headlines = []
-            for article in articles[:10]: # Top 10 news
-                a_tag = article.find('a')
-                if a_tag:
-                    title = a_tag.get('title') or a_tag.text.strip()
-                    link = a_tag.get('href')
-                    # Đảm bảo link luôn có domain đầy đủ
-                    if link and link.startswith('/'):
-                        link = "https://vnexpress.net" + link
-                    headlines.append(f"- {title} ({link})")
-            
-            if headlines:
-                return "\n".join(headlines)
+        return fetch_parsed(NEWS_URL, _parse_news_html)
     except Exception as e:
         logger.error(f"Error fetching news: {e}")
-        
+        return None
+
+def fetch_gold_news():
+    """
+    Lấy tin tức vàng/kinh tế mới nhất từ VnExpress hoặc nguồn tương tự.
+
+    Returns:
+        str: Một chuỗi chứa các điểm tin tức vàng/kinh tế.
+    """
+    headlines = get_news_headlines()
+    if headlines:
+        return format_headlines(headlines)
     return "Không có tin tức vàng/kinh tế mới nhất được lấy. Vui lòng kiểm tra tin tức thị trường thủ công."
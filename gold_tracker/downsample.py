@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+# Số điểm tối đa cho mỗi đường trên biểu đồ: đủ cho độ rộng màn hình thông thường.
+CHART_POINTS = 800
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Chọn `n_out` điểm đại diện của chuỗi (x, y) bằng Largest-Triangle-Three-Buckets.
+
+    Điểm đầu và cuối luôn được giữ; mỗi bucket ở giữa giữ điểm tạo tam giác lớn nhất với
+    điểm đã chọn ở bucket trước và trung bình của bucket sau, nên các đỉnh/đáy được bảo toàn.
+    Ranh giới bucket và trung bình được tính vector hóa; vòng lặp chỉ chạy `n_out` lần
+    (mỗi bucket phụ thuộc điểm đã chọn ở bucket trước), phần diện tích tính bằng NumPy.
+
+    Args:
+        x (array-like): Trục hoành tăng dần (số, hoặc datetime64).
+        y (array-like): Giá trị, không chứa NaN.
+        n_out (int): Số điểm cần giữ.
+
+    Returns:
+        numpy.ndarray: Chỉ số (tăng dần) của các điểm được giữ.
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64)
+    x = x.astype(float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # Dời gốc để tích chéo không mất độ chính xác với epoch nano giây.
+    x = x - x[0]
+
+    # n_out - 2 bucket cho các điểm 1..n-2; bucket i là [edges[i], edges[i + 1]).
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    # reduceat trên x[:-1] để bucket cuối dừng trước điểm cuối cùng.
+    avg_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    # "Bucket sau" của bucket cuối cùng là điểm cuối.
+    next_x = np.append(avg_x[1:], x[-1]).tolist()
+    next_y = np.append(avg_y[1:], y[-1]).tolist()
+
+    bounds = edges.tolist()
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        ax, ay = x[a], y[a]
+        # Hai lần diện tích tam giác (a, điểm j trong bucket, trung bình c của bucket sau),
+        # viết dưới dạng tuyến tính theo (x_j, y_j): |(ax - cx) * y_j + (cy - ay) * x_j - const|.
+        dx, dy = ax - next_x[i], next_y[i] - ay
+        area = np.abs(dx * y[lo:hi] + dy * x[lo:hi] - (dx * ay + dy * ax))
+        a = lo + int(area.argmax())
+        selected.append(a)
+    selected.append(n - 1)
+    return np.array(selected, dtype=np.int64)
+
+
+def downsample_frame(df, x, columns, n_out=CHART_POINTS):
+    """
+    Giảm số điểm của nhiều chuỗi dùng chung trục `x`, mỗi chuỗi chọn điểm riêng bằng LTTB.
+
+    Args:
+        df (pandas.DataFrame): Dữ liệu đã sắp xếp theo `x`.
+        x (str): Tên cột trục hoành (thường là 'timestamp').
+        columns (iterable): Các cột cần vẽ.
+        n_out (int): Số điểm tối đa cho mỗi chuỗi.
+
+    Returns:
+        pandas.DataFrame: Dạng dài với các cột `x`, 'variable', 'value' (dùng với px.line(color='variable')).
+    """
+    parts = []
+    for column in columns:
+        series = df[[x, column]].dropna()
+        keep = lttb_indices(series[x].to_numpy(), series[column].to_numpy(), n_out)
+        part = series.iloc[keep].rename(columns={column: 'value'})
+        part['variable'] = column
+        parts.append(part)
+    if not parts:
+        return pd.DataFrame(columns=[x, 'variable', 'value'])
+    return pd.concat(parts, ignore_index=True)[[x, 'variable', 'value']]
@@ -1,88 +1,461 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 import os
+import time
+import hashlib
+import logging
+import threading
 from dotenv import load_dotenv
+from gold_tracker import metrics
+from gold_tracker.analytics import format_gap_norms
+from gold_tracker.storage import get_engine, compress_report, decompress_report, get_news_since_last_report
+from gold_tracker.data_fetcher import NEWS_LIMIT, format_headlines
 
 load_dotenv()
 
-def get_gold_market_analysis(data_context):
+# langchain/langchain_openai chỉ được import khi thực sự tạo báo cáo (xem get_chain),
+# nên import module này (ví dụ để đọc cache) không tốn vài giây khởi động.
+
+logger = logging.getLogger(__name__)
+
+# Dùng khi database chưa có đủ lịch sử để tính thống kê chênh lệch.
+DEFAULT_GAP_NORMS = "normally 2-5 million is acceptable, >10 is high"
+
+# Ngân sách token cho phần tin tức trong prompt; các dòng vượt ngân sách bị bỏ (tin đầu danh sách được giữ).
+NEWS_TOKEN_BUDGET = int(os.getenv("NEWS_TOKEN_BUDGET", "300"))
+
+# Ước lượng thô thay cho tokenizer: khoảng 4 byte UTF-8 mỗi token (chữ có dấu tốn 2-3 byte),
+# hơi dư so với tokenizer thật nên prompt không vượt ngân sách.
+BYTES_PER_TOKEN = 4
+
+NO_NEWS = "No specific news available at this moment."
+NO_NEW_HEADLINES = "No new headlines since the previous report."
+
+# Backfill hàng loạt: số request đồng thời, tốc độ tối đa (token bucket, request/giây),
+# số request được dồn khi bucket đầy, và số lần thử lại mỗi báo cáo.
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))
+BACKFILL_REQUESTS_PER_SECOND = float(os.getenv("BACKFILL_REQUESTS_PER_SECOND", "1"))
+BACKFILL_BURST = int(os.getenv("BACKFILL_BURST", "2"))
+BACKFILL_RETRIES = int(os.getenv("BACKFILL_RETRIES", "3"))
+
+# Thời gian sống (giây) và số báo cáo tối đa trong cache.
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", "1800"))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "200"))
+
+# Bước lượng tử hóa cho khóa cache: các trạng thái thị trường chênh nhau ít hơn
+# mức này được coi là như nhau và dùng chung một báo cáo.
+CACHE_QUANTIZATION = {
+    'global_price': 1.0,        # USD/lượng
+    'exchange_rate': 10.0,      # VND
+    'sjc_price': 100000.0,      # VND
+    'gap': 0.1,                 # Million VND
+}
+
+class ReportGenerationError(RuntimeError):
+    """Không tạo được báo cáo (thiếu API key hoặc model lỗi); nội dung lỗi không phải báo cáo và không được lưu."""
+
+
+REPORT_CACHE_SCHEMA = '''CREATE TABLE IF NOT EXISTS llm_report_cache
+                          (cache_key TEXT PRIMARY KEY,
+                           model TEXT,
+                           report BLOB NOT NULL,
+                           created_epoch REAL NOT NULL,
+                           accessed_epoch REAL NOT NULL)'''
+
+
+class ReportCache:
     """
-    Tạo báo cáo phân tích thị trường vàng sử dụng OpenRouter LLM.
-    
-    Args:
-        data_context (dict): Dictionary chứa giá vàng, khoảng cách, và tin tức.
-    
-    Returns:
-        str: Báo cáo phân tích thị trường vàng dưới dạng Markdown.
+    Cache báo cáo LLM lưu trong SQLite, có TTL và loại bỏ theo LRU.
+
+    Khóa gồm trạng thái thị trường đã lượng tử hóa, cửa sổ tin tức và tên model,
+    nên nhiều người dùng trong cùng một cửa sổ dữ liệu dùng chung một báo cáo.
     """
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        return "Error: OPENROUTER_API_KEY not found in .env file."
 
-    # Initialize ChatOpenAI with OpenRouter base URL
-    # Using a more stable model or allowing fallback
+    def __init__(self, engine=None, ttl=REPORT_CACHE_TTL, max_entries=REPORT_CACHE_MAX_ENTRIES):
+        self._engine = engine
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = (self._engine or get_engine()).connect()
+        if not self._schema_ready:
+            with conn:
+                conn.execute(REPORT_CACHE_SCHEMA)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_report_cache_accessed ON llm_report_cache(accessed_epoch)")
+            self._schema_ready = True
+        return conn
+
+    @staticmethod
+    def make_key(data_context, model_name):
+        """
+        Tạo khóa cache từ dữ liệu thị trường, tin tức và model.
+
+        Khi có 'news_rowid' (tin chọn bằng select_news), tin tức được xác định bằng mốc này thay vì
+        nội dung: sau khi báo cáo đầu tiên được lưu, người xem sau chỉ nhận "không có tin mới" cho
+        cùng cửa sổ tin tức, và vẫn phải dùng lại báo cáo đó.
+        """
+        parts = []
+        for field, step in CACHE_QUANTIZATION.items():
+            value = data_context.get(field)
+            parts.append("-" if value is None else str(round(value / step)))
+        if data_context.get('news_rowid') is not None:
+            parts.append(f"news_rowid:{data_context['news_rowid']}")
+        else:
+            news = (data_context.get('news') or "").strip()
+            parts.append(hashlib.sha256(news.encode('utf-8')).hexdigest()[:16])
+        parts.append(model_name)
+        return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Trả về báo cáo còn hạn, hoặc None."""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT report FROM llm_report_cache WHERE cache_key = ? AND created_epoch >= ?",
+            (key, now - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE llm_report_cache SET accessed_epoch = ? WHERE cache_key = ?", (now, key))
+        return decompress_report(row[0])
+
+    def put(self, key, model_name, report):
+        """Lưu báo cáo và loại bỏ các mục hết hạn hoặc ít dùng nhất."""
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_report_cache (cache_key, model, report, created_epoch, accessed_epoch) VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, compress_report(report), now, now),
+            )
+            conn.execute("DELETE FROM llm_report_cache WHERE created_epoch < ?", (now - self.ttl,))
+            conn.execute(
+                '''DELETE FROM llm_report_cache WHERE cache_key IN
+                   (SELECT cache_key FROM llm_report_cache ORDER BY accessed_epoch DESC LIMIT -1 OFFSET ?)''',
+                (self.max_entries,),
+            )
+
+
+report_cache = ReportCache()
+
+SYSTEM_PROMPT = """
+    You are a senior financial expert specializing in the Vietnam gold market. 
+    Your goal is to provide a professional, data-driven analysis of the daily gold prices.
+    You are analytical, objective, and insightful. You understand the correlation between global XAU/USD, the USD/VND exchange rate, and the local SJC gold price.
+    You always format your output in clean Markdown.
+"""
+
+HUMAN_PROMPT = """
+Please generate a daily gold market report based on the following data:
+
+**Data Snapshot:**
+- Global Gold Price (Spot): ${global_price:.2f}/lượng
+- USD/VND Exchange Rate: {exchange_rate:,.0f} VND
+- Converted Global Price: {converted_price:.2f} Million VND/lượng
+- SJC Gold Price (Sell): {sjc_price_million:.2f} Million VND/lượng
+- Gap (Domestic vs Global): {gap:.2f} Million VND/lượng
+
+**Latest Financial News:**
+{news}
+
+**Task:**
+Create a structured report including:
+1. **Today's Snapshot**: A clear table of the prices above.
+2. **Market Divergence**: Analyze the 'Gap'. Is it high or low compared to historical norms ({gap_norms})? What does this imply?
+3. **Expert Prediction**: Give a 'Bullish', 'Bearish', or 'Neutral' forecast for the next 24-48h.
+4. **Reasoning**: Explain why based on the DXY index (implied from news/context), Fed news, or local demand.
+5. **Disclaimer**: A professional financial disclaimer at the end.
+
+Write the report in Vietnamese (or English if requested, but default to Vietnamese for this task).
+"""
+
+_prompt = None
+_token_usage_handler = None
+
+
+def get_prompt():
+    """Trả về ChatPromptTemplate (system + human) dùng chung, tạo ở lần gọi đầu tiên."""
+    global _prompt
+    if _prompt is None:
+        from langchain_core.prompts import ChatPromptTemplate
+
+        _prompt = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            ("human", HUMAN_PROMPT)
+        ])
+    return _prompt
+
+
+def _record_token_usage(response):
+    """Ghi số token provider báo về (input/output) vào metrics."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+            if usage:
+                metrics.inc("llm_tokens_total", usage.get('input_tokens', 0), kind="input")
+                metrics.inc("llm_tokens_total", usage.get('output_tokens', 0), kind="output")
+                return
+    usage = (response.llm_output or {}).get('token_usage') or {}
+    if usage:
+        metrics.inc("llm_tokens_total", usage.get('prompt_tokens', 0), kind="input")
+        metrics.inc("llm_tokens_total", usage.get('completion_tokens', 0), kind="output")
+
+
+def _run_config():
+    # Chỉ gắn callback khi bật metrics để không tốn chi phí khi tắt.
+    global _token_usage_handler
+    if not metrics.is_enabled():
+        return None
+    if _token_usage_handler is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class TokenUsageHandler(BaseCallbackHandler):
+            def on_llm_end(self, response, **kwargs):
+                _record_token_usage(response)
+
+        _token_usage_handler = TokenUsageHandler()
+    return {"callbacks": [_token_usage_handler]}
+
+
+# Client và chain dùng chung giữa các lần gọi; chỉ tạo lại khi API key hoặc model thay đổi.
+_chain = None
+_chain_config = None
+_chain_lock = threading.Lock()
+
+
+def _get_model_name():
     # Common free/cheap models: google/gemini-2.0-flash-001, mistralai/mistral-7b-instruct:free
-    model_name = os.getenv("OPENROUTER_MODEL", "google/gemini-2.0-flash-001")
-    
-    llm = ChatOpenAI(
+    return os.getenv("OPENROUTER_MODEL", "google/gemini-2.0-flash-001")
+
+
+def _create_llm(api_key, model_name, **kwargs):
+    from langchain_openai import ChatOpenAI
+
+    # Initialize ChatOpenAI with OpenRouter base URL
+    return ChatOpenAI(
         model=model_name,
         openai_api_key=api_key,
         openai_api_base="https://openrouter.ai/api/v1",
-        temperature=0.7
+        temperature=0.7,
+        stream_usage=True,
+        **kwargs
+    )
+
+
+def get_chain(api_key, model_name):
+    """Trả về chain prompt | ChatOpenAI | StrOutputParser dùng chung cho tiến trình."""
+    global _chain, _chain_config
+    with _chain_lock:
+        if _chain is None or _chain_config != (api_key, model_name):
+            from langchain_core.output_parsers import StrOutputParser
+
+            _chain = get_prompt() | _create_llm(api_key, model_name) | StrOutputParser()
+            _chain_config = (api_key, model_name)
+        return _chain
+
+
+def make_rate_limiter(requests_per_second=BACKFILL_REQUESTS_PER_SECOND, burst=BACKFILL_BURST):
+    """Token bucket của LangChain: nạp `requests_per_second` token/giây, tối đa `burst` token."""
+    from langchain_core.rate_limiters import InMemoryRateLimiter
+
+    return InMemoryRateLimiter(
+        requests_per_second=requests_per_second,
+        check_every_n_seconds=min(0.1, 0.5 / requests_per_second),
+        max_bucket_size=max(1, burst),
     )
 
-    system_prompt = """
-        You are a senior financial expert specializing in the Vietnam gold market. 
-        Your goal is to provide a professional, data-driven analysis of the daily gold prices.
-        You are analytical, objective, and insightful. You understand the correlation between global XAU/USD, the USD/VND exchange rate, and the local SJC gold price.
-        You always format your output in clean Markdown.
+
+def build_batch_chain(llm, retries=BACKFILL_RETRIES):
     """
+    Chain cho tạo báo cáo hàng loạt: prompt | llm (thử lại với backoff) | StrOutputParser.
 
-    human_prompt = """
-    Please generate a daily gold market report based on the following data:
+    Mỗi lần thử lại đi qua rate limiter của `llm` nên không vượt tốc độ cho phép.
+    """
+    from langchain_core.output_parsers import StrOutputParser
 
-    **Data Snapshot:**
-    - Global Gold Price (Spot): ${global_price:.2f}/lượng
-    - USD/VND Exchange Rate: {exchange_rate:,.0f} VND
-    - Converted Global Price: {converted_price:.2f} Million VND/lượng
-    - SJC Gold Price (Sell): {sjc_price_million:.2f} Million VND/lượng
-    - Gap (Domestic vs Global): {gap:.2f} Million VND/lượng
-    
-    **Latest Financial News:**
-    {news}
-
-    **Task:**
-    Create a structured report including:
-    1. **Today's Snapshot**: A clear table of the prices above.
-    2. **Market Divergence**: Analyze the 'Gap'. Is it high or low compared to historical norms (normally 2-5 million is acceptable, >10 is high)? What does this imply?
-    3. **Expert Prediction**: Give a 'Bullish', 'Bearish', or 'Neutral' forecast for the next 24-48h.
-    4. **Reasoning**: Explain why based on the DXY index (implied from news/context), Fed news, or local demand.
-    5. **Disclaimer**: A professional financial disclaimer at the end.
-    
-    Write the report in Vietnamese (or English if requested, but default to Vietnamese for this task).
+    if retries > 0:
+        llm = llm.with_retry(stop_after_attempt=retries + 1, wait_exponential_jitter=True)
+    return get_prompt() | llm | StrOutputParser()
+
+
+def get_batch_chain(api_key, model_name, requests_per_second=BACKFILL_REQUESTS_PER_SECOND,
+                    burst=BACKFILL_BURST, retries=BACKFILL_RETRIES):
+    """Chain riêng cho backfill: ChatOpenAI có rate limiter, việc thử lại do build_batch_chain đảm nhận."""
+    llm = _create_llm(api_key, model_name, rate_limiter=make_rate_limiter(requests_per_second, burst), max_retries=0)
+    return build_batch_chain(llm, retries)
+
+
+async def agenerate_reports(data_contexts, chain, concurrency=BACKFILL_CONCURRENCY):
     """
+    Tạo báo cáo cho nhiều data_context bằng API batch bất đồng bộ của chain, không dùng cache.
+
+    Yields:
+        tuple: (chỉ số trong `data_contexts`, báo cáo hoặc Exception) theo thứ tự hoàn thành.
+    """
+    config = dict(_run_config() or {}, max_concurrency=concurrency)
+    inputs = [build_prompt_inputs(context) for context in data_contexts]
+    async for index, result in chain.abatch_as_completed(inputs, config=config, return_exceptions=True):
+        if isinstance(result, Exception):
+            metrics.inc("llm_errors_total")
+        yield index, result
+
+
+def estimate_tokens(text):
+    """Ước lượng số token của `text` (xem BYTES_PER_TOKEN)."""
+    return -(-len(text.encode('utf-8')) // BYTES_PER_TOKEN)
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", human_prompt)
-    ])
 
-    chain = prompt | llm | StrOutputParser()
+def fit_news_to_budget(news, budget=NEWS_TOKEN_BUDGET):
+    """
+    Giữ các dòng tin theo thứ tự, bỏ dòng trùng, cho tới khi hết ngân sách token.
+
+    Returns:
+        str: Phần tin tức vừa ngân sách (có thể rỗng).
+    """
+    kept, seen, used = [], set(), 0
+    for line in news.splitlines():
+        line = line.strip()
+        if not line or line in seen:
+            continue
+        cost = estimate_tokens(line) + 1  # + ký tự xuống dòng
+        if used + cost > budget:
+            break
+        seen.add(line)
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
 
-    # Prepare inputs
+
+def select_news(fallback=None, limit=NEWS_LIMIT):
+    """
+    Tin tức cho prompt: chỉ các tiêu đề chưa có trong prompt của báo cáo AI trước, không kèm URL.
+
+    Args:
+        fallback (str): Dùng khi bảng news trống (ví dụ dữ liệu mock, hoặc chưa lấy tin lần nào).
+        limit (int): Số tiêu đề tối đa.
+
+    Returns:
+        tuple: (chuỗi tin tức cho data_context['news'], news_rowid). news_rowid là mốc tin tức đã
+        xét, cần truyền cho save_report/save_snapshot ('news_rowid') khi lưu báo cáo tạo từ tin này;
+        None nếu bảng news trống hoặc không đọc được.
+    """
+    items, news_rowid = get_news_since_last_report(limit)
+    if items:
+        return format_headlines(items, links=False), news_rowid
+    # Đã có tin trong bảng nhưng không có gì mới: không gửi lại tiêu đề cũ.
+    return (NO_NEW_HEADLINES if news_rowid is not None else (fallback or NO_NEWS)), news_rowid
+
+
+def build_prompt_inputs(data_context):
+    """Chuyển data_context thành biến cho prompt (xem get_prompt)."""
     sjc_price = data_context.get('sjc_price', 0)
     sjc_price_million = sjc_price / 1000000 if sjc_price else 0
+    return {
+        "global_price": data_context.get('global_price', 0),
+        "exchange_rate": data_context.get('exchange_rate', 0),
+        "converted_price": data_context.get('converted_price', 0),
+        "sjc_price_million": sjc_price_million,
+        "gap": data_context.get('gap', 0),
+        "news": fit_news_to_budget(data_context.get('news') or NO_NEWS) or NO_NEWS,
+        "gap_norms": format_gap_norms(data_context.get('gap_stats')) or DEFAULT_GAP_NORMS
+    }
+
+
+def _cached_report(data_context, model_name):
+    """Trả về (cache_key, báo cáo đã cache hoặc None). cache_key là None nếu cache lỗi."""
+    try:
+        cache_key = report_cache.make_key(data_context, model_name)
+        cached = report_cache.get(cache_key)
+    except Exception as e:
+        logger.error(f"Report cache unavailable: {e}")
+        return None, None
+    metrics.inc("cache_requests_total", cache="llm_report", result="miss" if cached is None else "hit")
+    return cache_key, cached
+
+
+def _store_report(cache_key, model_name, report):
+    if cache_key is None:
+        return
+    try:
+        report_cache.put(cache_key, model_name, report)
+    except Exception as e:
+        logger.error(f"Could not cache report: {e}")
+
+
+def get_gold_market_analysis(data_context, use_cache=True):
+    """
+    Tạo báo cáo phân tích thị trường vàng sử dụng OpenRouter LLM.
+    
+    Args:
+        data_context (dict): Dictionary chứa giá vàng, khoảng cách, tin tức và (tùy chọn)
+            'gap_stats' từ storage.get_gap_stats().
+        use_cache (bool): Dùng lại báo cáo đã tạo cho cùng trạng thái thị trường (xem ReportCache).
     
+    Returns:
+        str: Báo cáo phân tích thị trường vàng dưới dạng Markdown.
+
+    Raises:
+        ReportGenerationError: Thiếu API key hoặc model lỗi.
+    """
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        raise ReportGenerationError("OPENROUTER_API_KEY not found in .env file.")
+
+    model_name = _get_model_name()
+    cache_key = None
+    if use_cache:
+        cache_key, cached = _cached_report(data_context, model_name)
+        if cached is not None:
+            return cached
+
     try:
-        result = chain.invoke({
-            "global_price": data_context.get('global_price', 0),
-            "exchange_rate": data_context.get('exchange_rate', 0),
-            "converted_price": data_context.get('converted_price', 0),
-            "sjc_price_million": sjc_price_million,
-            "gap": data_context.get('gap', 0),
-            "news": data_context.get('news', "No specific news available at this moment.")
-        })
-        return result
+        with metrics.span("llm_seconds", mode="invoke"):
+            result = get_chain(api_key, model_name).invoke(build_prompt_inputs(data_context), config=_run_config())
     except Exception as e:
-        return f"Error generating analysis: {e}"
+        metrics.inc("llm_errors_total")
+        raise ReportGenerationError(f"Error generating analysis: {e}") from e
+
+    _store_report(cache_key, model_name, result)
+    return result
+
+
+def stream_gold_market_analysis(data_context, use_cache=True):
+    """
+    Giống get_gold_market_analysis nhưng trả về từng đoạn văn bản ngay khi model sinh ra.
+
+    Dùng với `st.write_stream` hoặc in trực tiếp ra terminal. Báo cáo hoàn chỉnh được
+    lưu vào cache khi stream kết thúc thành công.
+
+    Yields:
+        str: Các đoạn Markdown của báo cáo.
+
+    Raises:
+        ReportGenerationError: Thiếu API key, hoặc model lỗi (kể cả giữa chừng, sau khi đã
+            trả về một phần báo cáo; phần đó không được cache và không nên được lưu).
+    """
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        raise ReportGenerationError("OPENROUTER_API_KEY not found in .env file.")
+
+    model_name = _get_model_name()
+    cache_key = None
+    if use_cache:
+        cache_key, cached = _cached_report(data_context, model_name)
+        if cached is not None:
+            yield cached
+            return
+
+    chunks = []
+    start = time.perf_counter()
+    try:
+        for chunk in get_chain(api_key, model_name).stream(build_prompt_inputs(data_context), config=_run_config()):
+            if not chunks:
+                metrics.observe("llm_first_chunk_seconds", time.perf_counter() - start)
+            chunks.append(chunk)
+            yield chunk
+    except Exception as e:
+        metrics.inc("llm_errors_total")
+        raise ReportGenerationError(f"Error generating analysis: {e}") from e
+    metrics.observe("llm_seconds", time.perf_counter() - start, mode="stream")
+
+    _store_report(cache_key, model_name, "".join(chunks))
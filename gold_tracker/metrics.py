@@ -0,0 +1,204 @@
+import os
+import time
+import bisect
+import functools
+import threading
+
+# Bật bằng GOLD_METRICS=1 (hoặc metrics.enable()). Khi tắt, mọi hàm ghi chỉ kiểm tra một cờ rồi trả về.
+_enabled = os.getenv("GOLD_METRICS", "0").lower() in ("1", "true", "yes")
+
+# Ngưỡng bucket (giây) cho histogram độ trễ.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIX = "gold_"
+
+# Mô tả cho dòng # HELP của các metric đã biết.
+HELP = {
+    "fetch_seconds": "Time spent fetching one data source.",
+    "fetch_total": "Data source fetches by final status.",
+    "parse_seconds": "Time spent parsing a fetched HTML page.",
+    "cache_requests_total": "Cache lookups by cache and result.",
+    "llm_seconds": "Time to generate one AI report.",
+    "llm_first_chunk_seconds": "Time until the first streamed chunk of an AI report.",
+    "llm_tokens_total": "Tokens reported by the LLM provider.",
+    "llm_errors_total": "AI report generations that failed.",
+    "db_seconds": "Time spent in SQLite reads and writes.",
+    "db_errors_total": "Storage calls that failed.",
+    "news_ingested_total": "News headlines seen for the first time.",
+    "snapshots_total": "Snapshots saved, as a new row or by extending an unchanged row.",
+    "write_behind_batches_total": "Transactions committed by the write-behind queue.",
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+def enable(flag=True):
+    """Bật/tắt thu thập metric cho tiến trình hiện tại."""
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled():
+    return _enabled
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Tăng counter `name` với các label cho trước."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """Ghi một giá trị (giây) vào histogram `name`."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {'buckets': [0] * len(DEFAULT_BUCKETS), 'count': 0, 'sum': 0.0, 'max': 0.0}
+        index = bisect.bisect_left(DEFAULT_BUCKETS, seconds)
+        if index < len(DEFAULT_BUCKETS):
+            hist['buckets'][index] += 1
+        hist['count'] += 1
+        hist['sum'] += seconds
+        hist['max'] = max(hist['max'], seconds)
+
+
+class _Span:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name, **labels):
+    """Context manager đo thời gian một đoạn code vào histogram `name`."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name, labels)
+
+
+def timed(name, **labels):
+    """Decorator đo thời gian mỗi lần gọi hàm vào histogram `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+def reset():
+    """Xóa toàn bộ giá trị đã ghi."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def snapshot():
+    """
+    Bản sao các giá trị hiện tại, dùng cho bảng chẩn đoán trên dashboard.
+
+    Returns:
+        dict: {'counters': [{'name', 'labels', 'value'}],
+               'histograms': [{'name', 'labels', 'count', 'mean_ms', 'max_ms'}]}
+    """
+    with _lock:
+        counters = [
+            {'name': name, 'labels': dict(labels), 'value': value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+        histograms = [
+            {'name': name, 'labels': dict(labels), 'count': hist['count'],
+             'mean_ms': hist['sum'] / hist['count'] * 1000 if hist['count'] else 0.0,
+             'max_ms': hist['max'] * 1000}
+            for (name, labels), hist in sorted(_histograms.items())
+        ]
+    return {'counters': counters, 'histograms': histograms}
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus():
+    """Xuất toàn bộ metric theo định dạng text của Prometheus."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, dict(hist, buckets=list(hist['buckets']))) for key, hist in _histograms.items())
+
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+        lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), hist in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+        cumulative = 0
+        for bound, count in zip(DEFAULT_BUCKETS, hist['buckets']):
+            cumulative += count
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+        lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {hist['count']}")
+        lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {hist['sum']}")
+        lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path):
+    """Ghi metric ra file (ghi tạm rồi đổi tên) cho textfile collector của node_exporter."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
@@ -0,0 +1,111 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from gold_tracker import metrics
+from gold_tracker.data_fetcher import get_market_quotes, get_sjc_gold_price, get_news_headlines
+from gold_tracker.resilience import StaleValue, resilient_market, resilient_sjc
+
+logger = logging.getLogger(__name__)
+
+# Tổng thời gian tối đa (giây) cho một lần làm mới, áp dụng chung cho mọi nguồn.
+DEFAULT_DEADLINE = 12.0
+
+# Tên nguồn -> hàm lấy dữ liệu. Thứ tự giữ nguyên để log dễ đọc.
+# Các nguồn giá được bọc circuit breaker: khi lỗi chúng trả về StaleValue của snapshot thật gần nhất.
+SOURCES = {
+    # Giá vàng quốc tế và tỷ giá được lấy chung trong một lần gọi yfinance.
+    "market": resilient_market(get_market_quotes),
+    "sjc_data": resilient_sjc(get_sjc_gold_price),
+    # Danh sách (title, url); người gọi lưu (storage.ingest_news) và định dạng (format_headlines).
+    "news": get_news_headlines,
+}
+
+# Pool dùng chung cho cả tiến trình. Không dùng `with` vì khi hết hạn
+# chúng ta không muốn chờ các request còn treo.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gold-fetch")
+
+
+def _timed_call(func):
+    start = time.perf_counter()
+    try:
+        value = func()
+        error = None
+    except Exception as e:
+        value = None
+        error = str(e)
+    return value, error, (time.perf_counter() - start) * 1000
+
+
+def fetch_all_sources(sources=None, deadline=DEFAULT_DEADLINE):
+    """
+    Lấy dữ liệu từ tất cả các nguồn song song với một deadline chung.
+
+    Args:
+        sources (dict): Tên nguồn -> hàm không tham số. Mặc định là SOURCES.
+        deadline (float): Thời gian tối đa (giây) cho toàn bộ lần lấy dữ liệu.
+
+    Returns:
+        dict: {
+            'values': {tên: giá trị hoặc None},
+            'sources': {tên: {'status': 'ok'|'stale'|'empty'|'error'|'timeout', 'elapsed_ms': float,
+                              'error': str|None, 'as_of': datetime|None}},
+            'elapsed_ms': float
+        }
+    """
+    sources = SOURCES if sources is None else sources
+    start = time.perf_counter()
+    futures = {name: _executor.submit(_timed_call, func) for name, func in sources.items()}
+    wait(futures.values(), timeout=deadline)
+
+    values = {}
+    statuses = {}
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            values[name] = None
+            statuses[name] = {'status': 'timeout', 'elapsed_ms': deadline * 1000, 'error': None, 'as_of': None}
+            metrics.inc("fetch_total", source=name, status='timeout')
+            logger.error(f"Source '{name}' exceeded the {deadline:.1f}s deadline")
+            continue
+
+        value, error, elapsed_ms = future.result()
+        as_of = None
+        if isinstance(value, StaleValue):
+            # Dữ liệu cũ từ lần lấy thành công trước: dùng được để hiển thị nhưng không được lưu lại.
+            status = 'stale'
+            error = value.reason
+            as_of = value.as_of
+            value = value.value
+        elif error is not None:
+            status = 'error'
+            logger.error(f"Source '{name}' failed: {error}")
+        elif value is None:
+            status = 'empty'
+        else:
+            status = 'ok'
+        values[name] = value
+        statuses[name] = {'status': status, 'elapsed_ms': elapsed_ms, 'error': error, 'as_of': as_of}
+        metrics.observe("fetch_seconds", elapsed_ms / 1000, source=name)
+        metrics.inc("fetch_total", source=name, status=status)
+
+    return {
+        'values': values,
+        'sources': statuses,
+        'elapsed_ms': (time.perf_counter() - start) * 1000,
+    }
+
+
+def is_fresh(result, names=None):
+    """True nếu mọi nguồn (hoặc các nguồn trong `names`) đều trả về dữ liệu mới."""
+    names = result['sources'].keys() if names is None else names
+    return all(result['sources'][name]['status'] == 'ok' for name in names)
+
+
+def format_source_status(result):
+    """Tạo một dòng tóm tắt trạng thái từng nguồn, ví dụ: 'sjc_data: ok (820 ms)'."""
+    parts = [
+        f"{name}: {info['status']} ({info['elapsed_ms']:.0f} ms)"
+        for name, info in result['sources'].items()
+    ]
+    return " | ".join(parts) + f" — tổng {result['elapsed_ms']:.0f} ms"
@@ -0,0 +1,153 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Số lần lỗi liên tiếp trước khi ngắt mạch, và thời gian (giây) chờ trước khi thử lại.
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 60.0
+
+# Giá trị cũ được trả về thay cho dữ liệu mới khi nguồn lỗi.
+# as_of: datetime của dữ liệu; reason: lý do ('circuit_open' hoặc 'error').
+StaleValue = namedtuple('StaleValue', ['value', 'as_of', 'reason'])
+
+# Pool riêng cho các lần làm mới nền khi mạch đang mở.
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gold-refresh")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker đơn giản: closed -> open sau `failure_threshold` lỗi liên tiếp,
+    open -> half-open sau `reset_timeout` giây, half-open -> closed khi thử lại thành công.
+    """
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def try_probe(self):
+        """Cho phép đúng một lần thử lại khi mạch ở trạng thái half-open."""
+        with self._lock:
+            if self.state != 'half_open' or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit '{self.name}' closed")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit '{self.name}' opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+class ResilientSource:
+    """
+    Bọc một hàm lấy dữ liệu bằng circuit breaker và stale-while-revalidate.
+
+    - Mạch đóng: gọi hàm; nếu lỗi hoặc trả về None thì trả về StaleValue của giá trị thật gần nhất.
+    - Mạch mở: trả về StaleValue ngay (~0 ms) và làm mới nền khi đến hạn thử lại.
+
+    Giá trị thật gần nhất lấy từ lần gọi thành công trước trong tiến trình, hoặc từ
+    snapshot mới nhất trong gold_prices (qua `from_snapshot`). Không bao giờ dùng hằng số.
+    """
+
+    def __init__(self, name, func, from_snapshot, breaker=None):
+        self.name = name
+        self.func = func
+        self.from_snapshot = from_snapshot
+        self.breaker = breaker or CircuitBreaker(name)
+        self._last_good = None
+        self._last_good_at = None
+
+    def _call_source(self):
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.error(f"Source '{self.name}' raised: {e}")
+            value = None
+        # Dữ liệu thiếu một phần (ví dụ có giá vàng nhưng không có tỷ giá) cũng tính là lỗi.
+        if value is None or (isinstance(value, dict) and None in value.values()):
+            self.breaker.record_failure()
+            return None
+        self.breaker.record_success()
+        self._last_good = value
+        self._last_good_at = datetime.now()
+        return value
+
+    def _stale(self, reason):
+        if self._last_good is not None:
+            return StaleValue(self._last_good, self._last_good_at, reason)
+        try:
+            from gold_tracker.storage import get_latest_snapshot
+            snapshot = get_latest_snapshot()
+        except Exception as e:
+            logger.error(f"Could not load last snapshot for '{self.name}': {e}")
+            snapshot = None
+        if snapshot is None:
+            return None
+        value = self.from_snapshot(snapshot)
+        if value is None:
+            return None
+        # Với chuỗi giá không đổi, timestamp là đầu chuỗi; valid_until là lần cuối giá được xác nhận.
+        return StaleValue(value, snapshot['valid_until'], reason)
+
+    def __call__(self):
+        if self.breaker.state != 'closed':
+            if self.breaker.try_probe():
+                _refresh_executor.submit(self._call_source)
+            return self._stale('circuit_open')
+
+        value = self._call_source()
+        if value is None:
+            return self._stale('error')
+        return value
+
+
+def _market_from_snapshot(snapshot):
+    if snapshot.get('global_price') is None or snapshot.get('exchange_rate') is None:
+        return None
+    return {'global_price': snapshot['global_price'], 'exchange_rate': snapshot['exchange_rate']}
+
+
+def _sjc_from_snapshot(snapshot):
+    if snapshot.get('sjc_sell') is None or snapshot.get('sjc_buy') is None:
+        return None
+    return {'buy': snapshot['sjc_buy'], 'sell': snapshot['sjc_sell']}
+
+
+def resilient_market(func):
+    """Bọc hàm lấy giá vàng quốc tế + tỷ giá."""
+    return ResilientSource("market", func, _market_from_snapshot)
+
+
+def resilient_sjc(func):
+    """Bọc hàm lấy giá SJC."""
+    return ResilientSource("sjc_data", func, _sjc_from_snapshot)
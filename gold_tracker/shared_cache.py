@@ -0,0 +1,189 @@
+import os
+import time
+import uuid
+import pickle
+import sqlite3
+import logging
+import threading
+
+from gold_tracker import metrics
+from gold_tracker.connection_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# File cache dùng chung giữa các tiến trình/replica; đặt trên volume chung khi scale out.
+SHARED_CACHE_FILE = os.getenv("SHARED_CACHE_FILE", "gold_cache.db")
+
+# Thời gian tối đa (giây) một tiến trình được giữ quyền làm mới một khóa.
+LEASE_TIMEOUT = 30.0
+
+# Khoảng thời gian chờ giữa các lần kiểm tra khi tiến trình khác đang làm mới.
+POLL_INTERVAL = 0.2
+
+# Số kết nối rảnh tối đa được giữ lại cho các thread sau (xem ConnectionPool).
+SHARED_CACHE_POOL_SIZE = int(os.getenv("SHARED_CACHE_POOL_SIZE", "8"))
+
+CACHE_SCHEMA = '''CREATE TABLE IF NOT EXISTS shared_cache
+                  (cache_key TEXT PRIMARY KEY,
+                   value BLOB,
+                   expires_epoch REAL,
+                   lease_owner TEXT,
+                   lease_expires_epoch REAL)'''
+
+
+class SharedCache:
+    """
+    Cache key-value dùng chung giữa nhiều tiến trình, lưu trong một file SQLite.
+
+    `get_or_compute` đảm bảo single-flight: trong mỗi TTL chỉ một lời gọi (trong mọi tiến
+    trình và thread) chạy `compute` cho một khóa; các lời gọi khác đọc giá trị cũ (nếu có)
+    hoặc chờ kết quả. Khóa liên tiến trình dựa trên `BEGIN IMMEDIATE` của SQLite.
+
+    Dùng chế độ journal mặc định (không phải WAL) để hoạt động được cả trên volume mạng.
+    """
+
+    def __init__(self, path=SHARED_CACHE_FILE, lease_timeout=LEASE_TIMEOUT, pool_size=SHARED_CACHE_POOL_SIZE):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._pool = ConnectionPool(self._open, pool_size)
+
+    def _open(self):
+        # isolation_level=None: tự quản lý transaction bằng BEGIN IMMEDIATE.
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute(CACHE_SCHEMA)
+        return conn
+
+    def _connect(self):
+        return self._pool.connection()
+
+    def get(self, key, allow_stale=False):
+        """
+        Đọc giá trị trong cache.
+
+        Returns:
+            tuple: (giá trị, còn hạn hay không), hoặc (None, False) nếu không có.
+            Giá trị hết hạn chỉ được trả về khi allow_stale=True.
+        """
+        row = self._connect().execute(
+            "SELECT value, expires_epoch FROM shared_cache WHERE cache_key = ? AND value IS NOT NULL", (key,)
+        ).fetchone()
+        if row is None:
+            return None, False
+        fresh = row[1] > time.time()
+        if not fresh and not allow_stale:
+            return None, False
+        return pickle.loads(row[0]), fresh
+
+    def set(self, key, value, ttl):
+        """Ghi giá trị với thời gian sống `ttl` giây và trả lại quyền làm mới."""
+        self._connect().execute(
+            '''INSERT INTO shared_cache (cache_key, value, expires_epoch, lease_owner, lease_expires_epoch)
+               VALUES (?, ?, ?, NULL, NULL)
+               ON CONFLICT(cache_key) DO UPDATE SET value = excluded.value, expires_epoch = excluded.expires_epoch,
+                                                    lease_owner = NULL, lease_expires_epoch = NULL''',
+            (key, pickle.dumps(value), time.time() + ttl),
+        )
+
+    def invalidate(self, key):
+        """Đánh dấu khóa hết hạn (giá trị cũ vẫn được giữ để phục vụ trong lúc làm mới)."""
+        self._connect().execute("UPDATE shared_cache SET expires_epoch = 0 WHERE cache_key = ?", (key,))
+
+    def _try_acquire(self, key):
+        """
+        Giành quyền làm mới khóa.
+
+        Returns:
+            str: Mã lease nếu lời gọi này được phép gọi compute, None nếu không. Mỗi lần giành
+            có mã riêng, nên các thread trong cùng tiến trình cũng loại trừ nhau.
+        """
+        conn = self._connect()
+        now = time.time()
+        token = f"{self.owner}-{uuid.uuid4().hex[:8]}"
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT expires_epoch, lease_owner, lease_expires_epoch FROM shared_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                expires, owner, lease_expires = row
+                if expires is not None and expires > now:
+                    conn.execute("COMMIT")
+                    return None  # Vừa được lời gọi khác làm mới.
+                if owner is not None and lease_expires > now:
+                    conn.execute("COMMIT")
+                    return None  # Lời gọi khác đang làm mới.
+            conn.execute(
+                '''INSERT INTO shared_cache (cache_key, value, expires_epoch, lease_owner, lease_expires_epoch)
+                   VALUES (?, NULL, 0, ?, ?)
+                   ON CONFLICT(cache_key) DO UPDATE SET lease_owner = excluded.lease_owner,
+                                                        lease_expires_epoch = excluded.lease_expires_epoch''',
+                (key, token, now + self.lease_timeout),
+            )
+            conn.execute("COMMIT")
+            return token
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _release(self, key, token):
+        self._connect().execute(
+            "UPDATE shared_cache SET lease_owner = NULL, lease_expires_epoch = NULL WHERE cache_key = ? AND lease_owner = ?",
+            (key, token),
+        )
+
+    def get_or_compute(self, key, ttl, compute, wait_timeout=None):
+        """
+        Trả về giá trị còn hạn của `key`, hoặc tính lại bằng `compute()` (single-flight).
+
+        Args:
+            key (str): Khóa cache.
+            ttl (float): Thời gian sống (giây) của giá trị mới.
+            compute (callable): Hàm không tham số tạo giá trị mới (phải pickle được).
+            wait_timeout (float): Thời gian tối đa chờ tiến trình khác khi chưa có giá trị cũ.
+                Mặc định bằng lease_timeout; hết thời gian thì tự tính.
+
+        Returns:
+            Giá trị đã cache hoặc vừa tính.
+        """
+        value, fresh = self.get(key, allow_stale=True)
+        if fresh:
+            metrics.inc("cache_requests_total", cache="shared", key=key, result="hit")
+            return value
+        metrics.inc("cache_requests_total", cache="shared", key=key, result="miss")
+
+        wait_timeout = self.lease_timeout if wait_timeout is None else wait_timeout
+        deadline = time.monotonic() + wait_timeout
+        while True:
+            token = self._try_acquire(key)
+            if token is not None:
+                try:
+                    value = compute()
+                except Exception:
+                    self._release(key, token)
+                    raise
+                self.set(key, value, ttl)
+                return value
+
+            # Lời gọi khác đang làm mới: phục vụ giá trị cũ nếu có, nếu không thì chờ.
+            current, fresh = self.get(key, allow_stale=True)
+            if fresh or current is not None:
+                return current
+            if time.monotonic() >= deadline:
+                logger.warning(f"Timed out waiting for shared cache key '{key}', computing locally")
+                return compute()
+            time.sleep(POLL_INTERVAL)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """Trả về SharedCache dùng chung của tiến trình."""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = SharedCache()
+    return _shared_cache
@@ -1,63 +1,943 @@
-import pandas as pd
-import sqlite3
 import os
-from datetime import datetime
+import sqlite3
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from gold_tracker import metrics
+from gold_tracker.analytics import STATS_SCHEMA, update_stats, rebuild_stats
+from gold_tracker.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_DIR, DAY_SECONDS, RUN_COLUMNS, SnapshotArchive
+from gold_tracker.connection_pool import ConnectionPool
+
+# Đường dẫn database; đặt GOLD_DB_FILE để dùng chung file giữa collector và dashboard.
+DB_FILE = os.getenv("GOLD_DB_FILE", "gold_data.db")
+
+# Các PRAGMA áp dụng cho mỗi kết nối mới.
+# WAL cho phép đọc song song với ghi; synchronous=NORMAL là đủ an toàn khi dùng WAL.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+# Số kết nối rảnh tối đa được giữ lại cho các thread sau (xem StorageEngine).
+DB_POOL_SIZE = int(os.getenv("GOLD_DB_POOL_SIZE", "8"))
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS gold_prices
+             (timestamp TEXT PRIMARY KEY,
+              global_price_usd REAL,
+              exchange_rate REAL,
+              sjc_sell_price REAL,
+              sjc_buy_price REAL,
+              converted_price REAL,
+              gap REAL,
+              ts_epoch INTEGER,
+              valid_until_epoch INTEGER,
+              run_samples INTEGER)'''
+
+# Snapshot trùng giá với dòng mới nhất chỉ kéo dài valid_until_epoch của dòng đó và tăng
+# run_samples (run-length), nhưng mỗi chuỗi giá không đổi dài tối đa chừng này giây để lịch sử
+# vẫn có điểm định kỳ. Các hàm đọc tách chuỗi lại thành từng lần thu thập (analytics.run_epochs).
+SNAPSHOT_MAX_RUN_SECONDS = int(os.getenv("SNAPSHOT_MAX_RUN_SECONDS", "3600"))
+
+# Dòng mới nhất, thời điểm cuối của chuỗi và các giá dùng để phát hiện snapshot không đổi
+# (cùng thứ tự với _snapshot_row[1:5]).
+LAST_STATE_SQL = '''SELECT timestamp, ts_epoch, COALESCE(valid_until_epoch, ts_epoch),
+                           global_price_usd, exchange_rate, sjc_sell_price, sjc_buy_price
+                    FROM gold_prices ORDER BY ts_epoch DESC, timestamp DESC LIMIT 1'''
+
+EXTEND_RUN_SQL = '''UPDATE gold_prices SET valid_until_epoch = ?, run_samples = COALESCE(run_samples, 1) + ?
+                    WHERE timestamp = ?'''
+
+# Báo cáo AI được lưu riêng (nén zlib) để bảng lịch sử chỉ chứa số liệu.
+# news_rowid: rowid lớn nhất của bảng news lúc chọn tin cho prompt (xem get_news_since_last_report),
+# tức các tiêu đề đã được xét cho báo cáo; NULL với báo cáo tạo lại cho snapshot cũ (backfill).
+REPORTS_SCHEMA = '''CREATE TABLE IF NOT EXISTS ai_reports
+                     (snapshot_ts TEXT PRIMARY KEY REFERENCES gold_prices(timestamp),
+                      report BLOB NOT NULL,
+                      news_rowid INTEGER)'''
+
+# Tiêu đề tin tức đã thấy, khóa theo URL bài viết; first_seen là lúc tiêu đề xuất hiện lần đầu.
+NEWS_SCHEMA = '''CREATE TABLE IF NOT EXISTS news
+                  (url TEXT PRIMARY KEY,
+                   title TEXT NOT NULL,
+                   first_seen TEXT NOT NULL,
+                   first_seen_epoch INTEGER NOT NULL)'''
+
+# Cấu hình mà các tiến trình đọc cùng database cần biết, ví dụ chu kỳ của collector đang chạy.
+META_SCHEMA = '''CREATE TABLE IF NOT EXISTS meta
+                  (key TEXT PRIMARY KEY,
+                   value TEXT NOT NULL)'''
+
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_gold_prices_ts_epoch ON gold_prices(ts_epoch)",
+    "CREATE INDEX IF NOT EXISTS idx_news_first_seen ON news(first_seen_epoch)",
+    "CREATE INDEX IF NOT EXISTS idx_ai_reports_news_rowid ON ai_reports(news_rowid)",
+)
+
+INSERT_SQL = '''INSERT INTO gold_prices
+                (timestamp, global_price_usd, exchange_rate, sjc_sell_price, sjc_buy_price, converted_price, gap, ts_epoch)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+
+# Như INSERT_SQL nhưng bỏ qua timestamp đã có (dùng khi backfill lịch sử).
+INSERT_IGNORE_SQL = INSERT_SQL.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+
+INSERT_REPORT_SQL = "INSERT OR REPLACE INTO ai_reports (snapshot_ts, report, news_rowid) VALUES (?, ?, ?)"
+
+# Mốc tin tức khi chọn tin cho prompt: mọi tiêu đề đã lưu tới lúc này.
+LAST_NEWS_ROWID_SQL = "SELECT MAX(rowid) FROM news"
+
+# Các cột số liệu có thể lấy qua get_history(columns=...).
+HISTORY_COLUMNS = ('global_price_usd', 'exchange_rate', 'sjc_sell_price', 'sjc_buy_price', 'converted_price', 'gap')
+
+# Các cột được tổng hợp theo bucket trong get_history(bucket=...).
+AGGREGATE_COLUMNS = ('sjc_sell_price', 'converted_price', 'gap')
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(value):
+    """
+    Chuyển datetime/ISO string/pandas.Timestamp thành số giây epoch.
+
+    Timestamp trong database là giờ địa phương không kèm múi giờ, nên được quy đổi
+    giống như `strftime('%s', ...)` của SQLite (coi như UTC).
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if hasattr(value, 'to_pydatetime'):  # pandas.Timestamp, không cần import pandas
+        value = value.to_pydatetime()
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return int((value - _EPOCH).total_seconds())
+
+
+def _bucket_seconds(bucket):
+    """Chuyển kích thước bucket (giây hoặc chuỗi như '1h', '15min', '1D') thành số giây."""
+    if isinstance(bucket, (int, float)):
+        seconds = int(bucket)
+    else:
+        import pandas as pd
+
+        seconds = int(pd.Timedelta(bucket).total_seconds())
+    if seconds <= 0:
+        raise ValueError(f"Invalid bucket size: {bucket!r}")
+    return seconds
+
+
+def _checked_columns(columns, allowed):
+    """Kiểm tra tên cột theo danh sách cho phép trước khi đưa vào câu SQL."""
+    columns = tuple(columns)
+    unknown = [col for col in columns if col not in allowed]
+    if unknown or not columns:
+        raise ValueError(f"Unknown history columns: {unknown}")
+    return columns
+
+
+def _aggregate_sql(columns=AGGREGATE_COLUMNS):
+    """
+    Câu truy vấn OHLC/mean theo bucket, chạy hoàn toàn trong SQLite.
+
+    Chuỗi giá không đổi được tách lại thành từng lần thu thập bằng CTE đệ quy (cùng công thức
+    với analytics.run_epochs) trước khi gộp, nên `samples` là số snapshot và các bucket nằm
+    giữa một chuỗi không bị bỏ trống. :row_start lùi :start đủ xa để gồm cả chuỗi bắt đầu trước đó.
+    """
+    value_cols = ", ".join(columns)
+    window_cols = []
+    select_cols = []
+    for col in columns:
+        window_cols.append(f"FIRST_VALUE({col}) OVER w AS {col}_first, LAST_VALUE({col}) OVER w AS {col}_last")
+        select_cols.append(
+            f"AVG({col}) AS {col}, MAX({col}_first) AS {col}_open, MAX({col}) AS {col}_high, "
+            f"MIN({col}) AS {col}_low, MAX({col}_last) AS {col}_close"
+        )
+    return f'''WITH RECURSIVE polls(ts_epoch, first_epoch, span, n, k, {value_cols}) AS (
+                  SELECT ts_epoch, ts_epoch, COALESCE(valid_until_epoch, ts_epoch) - ts_epoch, COALESCE(run_samples, 1), 0,
+                         {value_cols}
+                  FROM gold_prices
+                  WHERE ts_epoch >= :row_start AND ts_epoch < :end
+                  UNION ALL
+                  SELECT first_epoch + (k + 1) * span / (n - 1), first_epoch, span, n, k + 1, {value_cols}
+                  FROM polls WHERE k + 1 < n)
+              SELECT bucket * :bucket AS ts_epoch, COUNT(*) AS samples, {", ".join(select_cols)}
+              FROM (SELECT ts_epoch / :bucket AS bucket, {value_cols}, {", ".join(window_cols)}
+                    FROM polls
+                    WHERE ts_epoch >= :start AND ts_epoch < :end
+                    WINDOW w AS (PARTITION BY ts_epoch / :bucket ORDER BY ts_epoch
+                                 ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING))
+              GROUP BY bucket
+              ORDER BY bucket'''
+
+
+AGGREGATE_SQL = _aggregate_sql()
+
+
+def _aggregate_frame(df, columns, bucket_seconds):
+    """
+    Giống _aggregate_sql nhưng chạy bằng pandas, dùng khi lịch sử gồm cả dữ liệu trong archive.
+
+    `df` phải đã được tách chuỗi giá không đổi (_expand_runs).
+    """
+    import pandas as pd
+
+    df = df.sort_values('ts_epoch', kind='stable')
+    grouped = df.groupby(df['ts_epoch'] // bucket_seconds, sort=True)
+    samples = grouped.size()
+    result = {'ts_epoch': samples.index * bucket_seconds, 'samples': samples.to_numpy()}
+    for col in columns:
+        agg = grouped[col].agg(['mean', 'first', 'max', 'min', 'last'])
+        result[col] = agg['mean'].to_numpy()
+        result[f'{col}_open'] = agg['first'].to_numpy()
+        result[f'{col}_high'] = agg['max'].to_numpy()
+        result[f'{col}_low'] = agg['min'].to_numpy()
+        result[f'{col}_close'] = agg['last'].to_numpy()
+    return pd.DataFrame(result)
+
+
+def _expand_runs(df, start_epoch, end_epoch):
+    """
+    Tách mỗi dòng thành các lần thu thập nó đại diện (xem analytics.run_epochs), chỉ giữ các lần
+    trong [start, end) và bỏ các cột RUN_COLUMNS. Lần thu thập thứ hai trở đi của một chuỗi có
+    'timestamp' suy ra từ epoch.
+    """
+    import numpy as np
+
+    first = df['ts_epoch'].to_numpy(dtype='int64')
+    samples = df['run_samples'].to_numpy(dtype='float64')
+    until = df['valid_until_epoch'].to_numpy(dtype='float64')
+    df = df.drop(columns=list(RUN_COLUMNS))
+    # NULL (NaN) nghĩa là dòng chỉ là một snapshot.
+    runs = (samples > 1) & (until > first)
+    if runs.any():
+        counts = np.where(runs, samples, 1).astype('int64')
+        until = np.where(runs, until, first).astype('int64')
+        index = np.repeat(np.arange(len(df)), counts)
+        k = np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)
+        epochs = first[index] + k * (until - first)[index] // np.maximum(counts[index] - 1, 1)
+        df = df.iloc[index].reset_index(drop=True)
+        df['ts_epoch'] = epochs
+        later = k > 0
+        df.loc[later, 'timestamp'] = np.datetime_as_string(epochs[later].astype('datetime64[s]'))
+    epochs = df['ts_epoch'].to_numpy()
+    inside = (epochs >= start_epoch) & (epochs < end_epoch)
+    return df if inside.all() else df[inside].reset_index(drop=True)
+
+
+def compress_report(report):
+    """Nén báo cáo Markdown để lưu vào ai_reports."""
+    return zlib.compress(report.encode('utf-8'), 6)
+
+
+def decompress_report(blob):
+    """Giải nén báo cáo đã lưu."""
+    return zlib.decompress(blob).decode('utf-8')
+
+
+def _migrate_ts_epoch(conn, columns):
+    """Thêm cột epoch có index cho database tạo trước khi có truy vấn theo khoảng thời gian."""
+    if 'ts_epoch' in columns:
+        return
+    conn.execute("ALTER TABLE gold_prices ADD COLUMN ts_epoch INTEGER")
+    conn.execute("UPDATE gold_prices SET ts_epoch = CAST(strftime('%s', timestamp) AS INTEGER)")
+
+
+def _migrate_runs(conn, columns):
+    """Thêm cột valid_until_epoch và run_samples (NULL = dòng chỉ là một snapshot)."""
+    if 'valid_until_epoch' not in columns:
+        conn.execute("ALTER TABLE gold_prices ADD COLUMN valid_until_epoch INTEGER")
+    if 'run_samples' not in columns:
+        conn.execute("ALTER TABLE gold_prices ADD COLUMN run_samples INTEGER")
+        # Chuỗi ghi trước khi có run_samples: chỉ còn biết lần thu thập đầu và cuối.
+        conn.execute("UPDATE gold_prices SET run_samples = 2 WHERE valid_until_epoch > ts_epoch")
+
+
+def _migrate_news_rowid(conn, columns):
+    """Thêm news_rowid cho bảng ai_reports cũ; báo cáo đã có coi như thấy tin tới thời điểm snapshot."""
+    if 'news_rowid' in {row[1] for row in conn.execute("PRAGMA table_info(ai_reports)")}:
+        return
+    conn.execute("ALTER TABLE ai_reports ADD COLUMN news_rowid INTEGER")
+    conn.execute('''UPDATE ai_reports SET news_rowid =
+                    (SELECT MAX(rowid) FROM news WHERE first_seen_epoch <= CAST(strftime('%s', snapshot_ts) AS INTEGER))''')
+
+
+def _migrate_reports(conn, columns):
+    """Chuyển cột ai_report cũ của gold_prices sang bảng ai_reports."""
+    if 'ai_report' not in columns:
+        return
+    rows = conn.execute("SELECT timestamp, ai_report FROM gold_prices WHERE ai_report IS NOT NULL AND ai_report != ''").fetchall()
+    conn.executemany(INSERT_REPORT_SQL, [(timestamp, compress_report(report), None) for timestamp, report in rows])
+    try:
+        conn.execute("ALTER TABLE gold_prices DROP COLUMN ai_report")
+    except sqlite3.OperationalError:
+        # SQLite < 3.35 không hỗ trợ DROP COLUMN, chỉ xóa nội dung.
+        conn.execute("UPDATE gold_prices SET ai_report = NULL")
+
+
+def _migrate_stats(conn, columns):
+    """Tính thống kê chênh lệch từ lịch sử có sẵn nếu bảng gap_stats còn trống."""
+    if conn.execute("SELECT 1 FROM gap_stats LIMIT 1").fetchone():
+        return
+    if conn.execute("SELECT 1 FROM gold_prices LIMIT 1").fetchone():
+        rebuild_stats(conn)
+
+
+# Các bước nâng cấp cho database cũ, chạy theo thứ tự khi khởi tạo schema.
+MIGRATIONS = (_migrate_ts_epoch, _migrate_runs, _migrate_news_rowid, _migrate_reports, _migrate_stats)
+
+
+def _snapshot_row(data):
+    """Chuyển dict snapshot thành tuple tham số cho INSERT."""
+    timestamp = data.get('timestamp') or datetime.now()
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return (timestamp.isoformat(),
+            data.get('global_price'),
+            data.get('exchange_rate'),
+            data.get('sjc_sell'),
+            data.get('sjc_buy'),
+            data.get('converted_price'),
+            data.get('gap'),
+            to_epoch(timestamp))
+
+
+class StorageEngine:
+    """
+    Lớp truy cập SQLite với pool kết nối nhỏ.
+
+    Mỗi thread mượn một kết nối (xem ConnectionPool) và trả lại khi kết thúc, nên các lần
+    rerun của Streamlit dùng lại kết nối đã mở (PRAGMA, cache trang) thay vì mở kết nối mới.
+    Schema chỉ được tạo một lần cho mỗi engine.
+    """
+
+    def __init__(self, db_file=DB_FILE, archive_dir=ARCHIVE_DIR, pool_size=DB_POOL_SIZE):
+        self.db_file = db_file
+        self.archive = SnapshotArchive(archive_dir)
+        self._pool = ConnectionPool(self._open, pool_size)
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    @property
+    def connections_opened(self):
+        """Số kết nối đã mở từ khi tạo engine."""
+        return self._pool.opened
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _thread_connection(self):
+        return self._pool.connection()
+
+    def connect(self):
+        """Trả về kết nối của thread hiện tại, tạo mới nếu chưa có."""
+        if not self._schema_ready:
+            self.init_schema()
+        return self._thread_connection()
+
+    def init_schema(self):
+        """Tạo bảng nếu chưa tồn tại. Chỉ chạy một lần cho mỗi engine."""
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn = self._thread_connection()
+            with conn:
+                conn.execute(SCHEMA)
+                conn.execute(REPORTS_SCHEMA)
+                conn.execute(STATS_SCHEMA)
+                conn.execute(NEWS_SCHEMA)
+                conn.execute(META_SCHEMA)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(gold_prices)")}
+                for migrate in MIGRATIONS:
+                    migrate(conn, columns)
+                for statement in INDEXES:
+                    conn.execute(statement)
+            self._schema_ready = True
+
+    def save_snapshot(self, data, extend_unchanged=True):
+        """Lưu một snapshot dữ liệu."""
+        self.save_many([data], extend_unchanged=extend_unchanged)
+
+    @metrics.timed("db_seconds", op="save_many")
+    def save_many(self, snapshots, extend_unchanged=True):
+        """
+        Lưu nhiều snapshot trong một transaction.
+
+        Với extend_unchanged, snapshot có cùng giá thế giới, tỷ giá và giá mua/bán SJC với dòng
+        mới nhất (và không kèm báo cáo) không tạo dòng mới: dòng đó được kéo dài valid_until_epoch
+        và tăng run_samples, tối đa SNAPSHOT_MAX_RUN_SECONDS kể từ đầu chuỗi. Thống kê chênh lệch
+        vẫn tính mọi snapshot, kể cả snapshot được gộp, giống khi tính lại bằng rebuild_stats.
+
+        Args:
+            snapshots (iterable): Các dict snapshot (cùng khóa với save_snapshot).
+                Khóa 'timestamp' (datetime hoặc ISO string) là tùy chọn.
+                'ai_report' không rỗng được nén và lưu vào bảng ai_reports, cùng 'news_rowid' (xem save_reports).
+            extend_unchanged (bool): Gộp snapshot không đổi vào dòng trước.
+
+        Returns:
+            int: Số snapshot đã lưu (ghi dòng mới hoặc gộp vào dòng trước).
+        """
+        items = sorted(((_snapshot_row(data), data) for data in snapshots), key=lambda item: item[0][-1])
+        if not items:
+            return 0
+        rows = []
+        reports = []
+        observations = []
+        extended = {}
+        merged = 0
+        conn = self.connect()
+        with conn:
+            # sqlite3 chỉ tự mở transaction trước lệnh ghi; BEGIN IMMEDIATE giữ khóa ghi từ lúc đọc
+            # dòng mới nhất, để collector và writer của dashboard không cùng gộp vào một dòng đã cũ.
+            conn.execute("BEGIN IMMEDIATE")
+            last = conn.execute(LAST_STATE_SQL).fetchone() if extend_unchanged else None
+            for row, data in items:
+                observations.append((row[-1], data))
+                if (last is not None and not data.get('ai_report') and row[1:5] == last[3:]
+                        and last[2] < row[-1] <= last[1] + SNAPSHOT_MAX_RUN_SECONDS):
+                    # Dòng last[0] giờ kéo dài tới snapshot này và đại diện thêm một lần thu thập.
+                    extended[last[0]] = (row[-1], extended.get(last[0], (None, 0))[1] + 1)
+                    last = last[:2] + (row[-1],) + last[3:]
+                    merged += 1
+                    continue
+                rows.append(row)
+                if data.get('ai_report'):
+                    reports.append((row[0], compress_report(data['ai_report']), data.get('news_rowid')))
+                if extend_unchanged:
+                    last = (row[0], row[-1], row[-1]) + row[1:5]
+            if rows:
+                conn.executemany(INSERT_SQL, rows)
+            if extended:
+                conn.executemany(EXTEND_RUN_SQL, [(until, count, ts) for ts, (until, count) in extended.items()])
+            if reports:
+                conn.executemany(INSERT_REPORT_SQL, reports)
+            # Thống kê chênh lệch được cập nhật O(1) cho mỗi snapshot, trong cùng transaction.
+            if observations:
+                update_stats(conn, observations)
+        metrics.inc("snapshots_total", len(rows), result="inserted")
+        metrics.inc("snapshots_total", merged, result="extended")
+        return len(items)
+
+    def save_backfill(self, snapshots):
+        """
+        Chèn các snapshot lịch sử vào giữa lịch sử đã lưu trong một transaction.
+
+        Không gộp chuỗi giá không đổi và bỏ qua timestamp đã có. update_stats chỉ cộng dồn
+        theo thứ tự thời gian nên thống kê chênh lệch được tính lại toàn bộ (rebuild_stats).
+
+        Args:
+            snapshots (iterable): Các dict snapshot có khóa 'timestamp' (cùng khóa với save_snapshot).
+
+        Returns:
+            int: Số dòng đã chèn.
+        """
+        rows = sorted((_snapshot_row(data) for data in snapshots), key=lambda row: row[-1])
+        if not rows:
+            return 0
+        conn = self.connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany(INSERT_IGNORE_SQL, rows)
+            inserted = conn.total_changes - before
+            if inserted:
+                rebuild_stats(conn, self._archived_observations())
+        metrics.inc("snapshots_total", inserted, result="backfilled")
+        return inserted
+
+    @metrics.timed("db_seconds", op="get_gap_stats")
+    def get_gap_stats(self):
+        """
+        Đọc thống kê chênh lệch đã được tính sẵn.
+
+        Returns:
+            dict: {metric: {'count', 'last', 'mean', 'std', 'ewma', 'ewm_std', 'zscore',
+            'min', 'max', 'p10', 'p50', 'p90', 'updated_epoch'}} cho 'gap' và 'sjc_spread'.
+        """
+        cursor = self.connect().execute(
+            "SELECT metric, count, last, mean, std, ewma, ewm_std, zscore, min, max, p10, p50, p90, updated_epoch FROM gap_stats"
+        )
+        names = [col[0] for col in cursor.description]
+        return {row[0]: dict(zip(names[1:], row[1:])) for row in cursor.fetchall()}
+
+    @metrics.timed("db_seconds", op="save_report")
+    def save_report(self, snapshot_ts, report, news_rowid=None):
+        """Gắn báo cáo AI vừa tạo vào một snapshot đã lưu (news_rowid: xem save_reports)."""
+        self.save_reports([(snapshot_ts, report, news_rowid)])
+
+    @metrics.timed("db_seconds", op="get_latest_snapshot")
+    def get_latest_snapshot(self):
+        """
+        Lấy snapshot mới nhất.
+
+        Returns:
+            dict: Cùng khóa với dict truyền vào save_snapshot ('timestamp' là datetime) và
+            'valid_until' (datetime), hoặc None nếu database trống.
+        """
+        row = self.connect().execute(
+            '''SELECT timestamp, global_price_usd, exchange_rate, sjc_sell_price, sjc_buy_price, converted_price, gap,
+                      COALESCE(valid_until_epoch, ts_epoch)
+               FROM gold_prices ORDER BY ts_epoch DESC, timestamp DESC LIMIT 1'''
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ('timestamp', 'global_price', 'exchange_rate', 'sjc_sell', 'sjc_buy', 'converted_price', 'gap')
+        snapshot = dict(zip(keys, row))
+        snapshot['timestamp'] = datetime.fromisoformat(snapshot['timestamp'])
+        # Lần cuối các giá này được xác nhận (snapshot không đổi chỉ kéo dài dòng hiện có).
+        snapshot['valid_until'] = max(snapshot['timestamp'], _EPOCH + timedelta(seconds=row[-1]))
+        return snapshot
+
+    @metrics.timed("db_seconds", op="get_report")
+    def get_report(self, snapshot_ts):
+        """
+        Lấy báo cáo AI của một snapshot.
+
+        Args:
+            snapshot_ts: Timestamp của snapshot (ISO string, datetime hoặc pandas.Timestamp).
+
+        Returns:
+            str: Báo cáo Markdown, hoặc None nếu snapshot không có báo cáo.
+        """
+        if not isinstance(snapshot_ts, str):
+            snapshot_ts = snapshot_ts.isoformat()
+        row = self.connect().execute("SELECT report FROM ai_reports WHERE snapshot_ts = ?", (snapshot_ts,)).fetchone()
+        return decompress_report(row[0]) if row else None
+
+    @metrics.timed("db_seconds", op="save_reports")
+    def save_reports(self, reports):
+        """
+        Gắn nhiều báo cáo AI vào các snapshot đã lưu trong một transaction.
+
+        Args:
+            reports (iterable): Các bộ (snapshot_ts, báo cáo) hoặc (snapshot_ts, báo cáo, news_rowid);
+                snapshot_ts là ISO string hoặc datetime. news_rowid là mốc tin tức trả về cùng tin đã
+                đưa vào prompt (xem get_news_since_last_report); None (ví dụ báo cáo backfill) không
+                đánh dấu tin tức nào là đã gửi.
+
+        Returns:
+            int: Số báo cáo đã ghi.
+        """
+        rows = [
+            (ts if isinstance(ts, str) else ts.isoformat(), compress_report(report), news_rowid[0] if news_rowid else None)
+            for ts, report, *news_rowid in reports if report
+        ]
+        if rows:
+            conn = self.connect()
+            with conn:
+                conn.executemany(INSERT_REPORT_SQL, rows)
+        return len(rows)
+
+    @metrics.timed("db_seconds", op="get_snapshots_without_report")
+    def get_snapshots_without_report(self, limit=None):
+        """
+        Các snapshot đủ số liệu nhưng chưa có báo cáo AI, mới nhất trước.
+
+        Returns:
+            list[dict]: Cùng khóa với get_latest_snapshot.
+        """
+        sql = '''SELECT g.timestamp, g.global_price_usd, g.exchange_rate, g.sjc_sell_price, g.sjc_buy_price,
+                        g.converted_price, g.gap
+                 FROM gold_prices g LEFT JOIN ai_reports r ON r.snapshot_ts = g.timestamp
+                 WHERE r.snapshot_ts IS NULL
+                   AND g.global_price_usd IS NOT NULL AND g.exchange_rate IS NOT NULL
+                   AND g.sjc_sell_price IS NOT NULL AND g.converted_price IS NOT NULL AND g.gap IS NOT NULL
+                 ORDER BY g.ts_epoch DESC, g.timestamp DESC'''
+        params = []
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        keys = ('timestamp', 'global_price', 'exchange_rate', 'sjc_sell', 'sjc_buy', 'converted_price', 'gap')
+        snapshots = []
+        for row in self.connect().execute(sql, params):
+            snapshot = dict(zip(keys, row))
+            snapshot['timestamp'] = datetime.fromisoformat(snapshot['timestamp'])
+            snapshots.append(snapshot)
+        return snapshots
+
+    @metrics.timed("db_seconds", op="get_latest_report")
+    def get_latest_report(self):
+        """Lấy (timestamp, báo cáo) mới nhất, hoặc None nếu chưa có báo cáo nào."""
+        row = self.connect().execute("SELECT snapshot_ts, report FROM ai_reports ORDER BY snapshot_ts DESC LIMIT 1").fetchone()
+        return (row[0], decompress_report(row[1])) if row else None
+
+    @metrics.timed("db_seconds", op="ingest_news")
+    def ingest_news(self, items, seen_at=None):
+        """
+        Lưu các tiêu đề chưa thấy bao giờ (theo URL); tiêu đề đã có giữ nguyên first_seen.
+
+        Chỉ mở transaction ghi khi có tiêu đề mới, nên gọi lại với cùng trang tin gần như
+        không tốn gì.
+
+        Args:
+            items (iterable): Các cặp (title, url).
+            seen_at (datetime): Thời điểm thấy tin, mặc định là hiện tại.
+
+        Returns:
+            list: Các cặp (title, url) mới, theo thứ tự trên trang.
+        """
+        unique = {}
+        for title, url in items:
+            if url and url not in unique:
+                unique[url] = title
+        if not unique:
+            return []
+        conn = self.connect()
+        urls = list(unique)
+        placeholders = ", ".join("?" * len(urls))
+        known = {row[0] for row in conn.execute(f"SELECT url FROM news WHERE url IN ({placeholders})", urls)}
+        fresh = [(unique[url], url) for url in urls if url not in known]
+        if fresh:
+            seen_at = seen_at or datetime.now()
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO news (url, title, first_seen, first_seen_epoch) VALUES (?, ?, ?, ?)",
+                    [(url, title, seen_at.isoformat(), to_epoch(seen_at)) for title, url in fresh],
+                )
+        return fresh
+
+    @metrics.timed("db_seconds", op="get_news")
+    def get_news(self, since=None, limit=None, until=None):
+        """
+        Lấy các tiêu đề thấy lần đầu sau `since` (và không muộn hơn `until`), mới nhất trước
+        (cùng lượt thì theo thứ tự trên trang).
+
+        Returns:
+            list[dict]: {'title', 'url', 'first_seen' (datetime)}.
+        """
+        return self._news_rows("first_seen_epoch > ? AND first_seen_epoch <= ?", [
+            to_epoch(since) if since is not None else -2**62, to_epoch(until) if until is not None else 2**62,
+        ], limit)
+
+    def _news_rows(self, where, params, limit):
+        sql = f"SELECT title, url, first_seen FROM news WHERE {where} ORDER BY first_seen_epoch DESC, rowid"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [
+            {'title': title, 'url': url, 'first_seen': datetime.fromisoformat(first_seen)}
+            for title, url, first_seen in self.connect().execute(sql, params)
+        ]
+
+    def get_news_since_last_report(self, limit=None):
+        """
+        Các tiêu đề chưa có trong prompt của báo cáo AI nào (tất cả nếu chưa có báo cáo).
+
+        Mốc là news_rowid của các báo cáo đã lưu, không phải snapshot_ts: dashboard gắn báo cáo
+        vào snapshot của collector, có thể cũ hơn tin tức đã đưa vào prompt.
+
+        Returns:
+            tuple: (list[dict] như get_news, news_rowid). news_rowid là mốc của lần chọn này (None nếu
+            bảng news trống); truyền nó khi lưu báo cáo để tiêu đề collector lưu thêm trong lúc
+            tạo báo cáo vẫn được gửi ở báo cáo sau.
+        """
+        news_rowid = self.connect().execute(LAST_NEWS_ROWID_SQL).fetchone()[0]
+        items = self._news_rows("rowid > (SELECT COALESCE(MAX(news_rowid), 0) FROM ai_reports) AND rowid <= ?",
+                                [news_rowid or 0], limit)
+        return items, news_rowid
+
+    def set_meta(self, key, value):
+        """Ghi một giá trị cấu hình dùng chung (lưu dạng chuỗi)."""
+        conn = self.connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def get_meta(self, key):
+        """Đọc giá trị cấu hình dùng chung, hoặc None nếu chưa có."""
+        row = self.connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @metrics.timed("db_seconds", op="recompute_derived")
+    def recompute_derived(self):
+        """
+        Tính lại converted_price và gap cho toàn bộ bảng gold_prices và ghi đè trong một transaction.
+
+        Dùng sau khi thay đổi công thức trong calculator.py.
+
+        Returns:
+            int: Số dòng đã cập nhật.
+        """
+        import pandas as pd
+        from gold_tracker.calculator import recompute_derived
+
+        conn = self.connect()
+        archived = 0
+        if self.archive.overlaps(None, None):
+            archived = self.archive.rewrite(recompute_derived)
+        df = pd.read_sql_query(
+            "SELECT rowid AS rid, global_price_usd, exchange_rate, sjc_sell_price FROM gold_prices", conn
+        )
+        if df.empty and not archived:
+            return 0
+        df = recompute_derived(df)
+        # NaN được SQLite lưu thành NULL.
+        rows = zip(df['converted_price'].tolist(), df['gap'].tolist(), df['rid'].tolist())
+        with conn:
+            conn.executemany("UPDATE gold_prices SET converted_price = ?, gap = ? WHERE rowid = ?", rows)
+            rebuild_stats(conn, self._archived_observations())
+        return len(df) + archived
+
+    def _archived_observations(self):
+        """Các dòng (epoch, gap, sjc_sell, sjc_buy) trong archive, dùng khi tính lại thống kê."""
+        if not self.archive.overlaps(None, None):
+            return []
+        df = self.archive.read(-2**62, 2**62, columns=('gap', 'sjc_sell_price', 'sjc_buy_price') + RUN_COLUMNS)
+        df = _expand_runs(df, -2**62, 2**62)
+        return list(zip(df['ts_epoch'].tolist(), df['gap'].tolist(),
+                        df['sjc_sell_price'].tolist(), df['sjc_buy_price'].tolist()))
+
+    def archive_snapshots(self, older_than_days=ARCHIVE_AFTER_DAYS, vacuum=True):
+        """
+        Chuyển snapshot cũ sang archive dạng cột rồi xóa khỏi gold_prices và thu gọn file SQLite.
+
+        Chỉ chuyển các ngày trọn vẹn cũ hơn `older_than_days`, và không bao giờ chuyển ngày của
+        snapshot mới nhất, nên bảng gold_prices luôn còn dữ liệu cho get_latest_snapshot.
+        Báo cáo AI vẫn ở bảng ai_reports.
+
+        Args:
+            older_than_days (float): Tuổi tối thiểu (ngày) của snapshot được chuyển.
+            vacuum (bool): Chạy VACUUM sau khi xóa để trả lại dung lượng cho hệ điều hành.
+
+        Returns:
+            int: Số snapshot đã chuyển.
+        """
+        conn = self.connect()
+        newest = conn.execute("SELECT MAX(ts_epoch) FROM gold_prices").fetchone()[0]
+        if newest is None:
+            return 0
+        cutoff = to_epoch(datetime.now()) - int(older_than_days * DAY_SECONDS)
+        cutoff = min(cutoff, newest) // DAY_SECONDS * DAY_SECONDS
+        rows = conn.execute(
+            '''SELECT timestamp, global_price_usd, exchange_rate, sjc_sell_price, sjc_buy_price, converted_price, gap, ts_epoch,
+                      valid_until_epoch, run_samples
+               FROM gold_prices WHERE ts_epoch < ? ORDER BY ts_epoch''',
+            (cutoff,),
+        ).fetchall()
+        if not rows:
+            return 0
+        # Ghi archive trước khi xóa: nếu bị ngắt giữa chừng, lần chạy sau ghi lại cùng file.
+        self.archive.write(rows)
+        with conn:
+            conn.execute("DELETE FROM gold_prices WHERE ts_epoch < ?", (cutoff,))
+        if vacuum:
+            # Ở chế độ WAL, VACUUM ghi vào file WAL; checkpoint sau đó mới thu nhỏ được file.
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return len(rows)
+
+    @metrics.timed("db_seconds", op="get_history")
+    def get_history(self, limit=30, start=None, end=None, bucket=None, columns=None, expand_runs=True):
+        """
+        Lấy lịch sử snapshot theo khoảng thời gian, có thể gộp theo bucket.
+
+        Args:
+            limit (int): Số dòng tối đa (các snapshot/bucket gần nhất). None để lấy tất cả.
+            start, end: Giới hạn thời gian [start, end) — datetime, ISO string hoặc epoch.
+            bucket: Kích thước bucket (giây hoặc chuỗi như '1h', '1D'). Khi có, mỗi dòng
+                là một bucket với cột `<col>` (trung bình), `<col>_open/_high/_low/_close`
+                cho sjc_sell_price, converted_price, gap, và `samples`.
+            columns (iterable): Các cột số liệu cần lấy (trong HISTORY_COLUMNS khi không
+                gộp bucket, trong AGGREGATE_COLUMNS khi có bucket). Mặc định lấy tất cả.
+            expand_runs (bool): Khi không gộp bucket, tách mỗi chuỗi giá không đổi thành từng lần
+                thu thập (mỗi dòng một snapshot, như trước khi có run-length). False để lấy các dòng
+                đã lưu. Gộp bucket luôn tính trên từng lần thu thập.
+
+        Returns:
+            pandas.DataFrame: Sắp xếp theo thời gian tăng dần.
+
+        Snapshot đã chuyển sang archive (xem archive_snapshots) được gộp vào kết quả khi
+        khoảng thời gian yêu cầu chạm tới chúng.
+        """
+        import pandas as pd
+
+        conn = self.connect()
+        start_epoch = to_epoch(start) if start is not None else -2**62
+        end_epoch = to_epoch(end) if end is not None else 2**62
+        expand = bucket is not None or expand_runs
+        # Chuỗi bắt đầu trước start vẫn có thể kéo dài vào khoảng được hỏi.
+        row_start = start_epoch - SNAPSHOT_MAX_RUN_SECONDS if expand else start_epoch
+        use_archive = self.archive.overlaps(row_start, end_epoch)
+
+        if bucket is not None:
+            selected = AGGREGATE_COLUMNS if columns is None else _checked_columns(columns, AGGREGATE_COLUMNS)
+            bucket_seconds = _bucket_seconds(bucket)
+            if use_archive:
+                # Bảng nóng nhỏ nên đọc thô rồi gộp chung với archive bằng pandas.
+                raw = self._hot_rows(conn, selected + RUN_COLUMNS, row_start, end_epoch, None)
+                raw = pd.concat([self.archive.read(row_start, end_epoch, selected + RUN_COLUMNS), raw], ignore_index=True)
+                raw = _expand_runs(raw.drop_duplicates('timestamp', keep='last'), start_epoch, end_epoch)
+                df = _aggregate_frame(raw, selected, bucket_seconds)
+                if limit is not None:
+                    df = df.tail(int(limit))
+            else:
+                sql = AGGREGATE_SQL if columns is None else _aggregate_sql(selected)
+                params = {'bucket': bucket_seconds, 'start': start_epoch, 'end': end_epoch, 'row_start': row_start}
+                if limit is not None:
+                    # Giữ `limit` bucket gần nhất.
+                    sql = f"SELECT * FROM ({sql}) ORDER BY ts_epoch DESC LIMIT :limit"
+                    params['limit'] = int(limit)
+                df = pd.read_sql_query(sql, conn, params=params)
+            if not df.empty:
+                df.insert(0, 'timestamp', pd.to_datetime(df['ts_epoch'], unit='s'))
+        else:
+            selected = HISTORY_COLUMNS if columns is None else _checked_columns(columns, HISTORY_COLUMNS)
+            read_columns = selected + RUN_COLUMNS if expand_runs else selected
+            df = self._hot_rows(conn, read_columns, row_start, end_epoch, limit)
+            if use_archive and (limit is None or len(df) < limit):
+                archived = self.archive.read(row_start, end_epoch, read_columns, limit=limit)
+                df = pd.concat([archived, df], ignore_index=True).drop_duplicates('timestamp', keep='last')
+            if expand_runs:
+                df = _expand_runs(df, start_epoch, end_epoch)
+            if limit is not None and len(df) > limit:
+                df = df.sort_values('ts_epoch', kind='stable').tail(int(limit))
+            if not df.empty:
+                df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+
+        if not df.empty:
+            df = df.sort_values(by='timestamp', ascending=True).reset_index(drop=True)
+
+        return df
+
+    @staticmethod
+    def _hot_rows(conn, columns, start_epoch, end_epoch, limit):
+        """Đọc các dòng trong bảng gold_prices (mới nhất trước), 'timestamp' giữ nguyên dạng chuỗi."""
+        import pandas as pd
+
+        sql = (f"SELECT timestamp, ts_epoch, {', '.join(columns)} FROM gold_prices "
+               "WHERE ts_epoch >= ? AND ts_epoch < ? ORDER BY ts_epoch DESC, timestamp DESC")
+        params = [start_epoch, end_epoch]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return pd.read_sql_query(sql, conn, params=params)
+
+    def close(self):
+        """Đóng kết nối của thread hiện tại và các kết nối rảnh trong pool."""
+        self._pool.close()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Trả về StorageEngine dùng chung cho tiến trình."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = StorageEngine()
+    return _engine
 
-DB_FILE = "gold_data.db"
 
 def init_db():
     """Khởi tạo SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS gold_prices
-                 (timestamp TEXT PRIMARY KEY,
-                  global_price_usd REAL,
-                  exchange_rate REAL,
-                  sjc_sell_price REAL,
-                  sjc_buy_price REAL,
-                  converted_price REAL,
-                  gap REAL,
-                  ai_report TEXT)''')
-    conn.commit()
-    conn.close()
+    get_engine().init_schema()
+
 
 def save_snapshot(data):
     """Lưu snapshot dữ liệu vào database."""
-    init_db()
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    timestamp = datetime.now().isoformat()
-    
-    try:
-        c.execute('''INSERT INTO gold_prices 
-                     (timestamp, global_price_usd, exchange_rate, sjc_sell_price, sjc_buy_price, converted_price, gap, ai_report)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                  (timestamp, 
-                   data.get('global_price'), 
-                   data.get('exchange_rate'), 
-                   data.get('sjc_sell'), 
-                   data.get('sjc_buy'), 
-                   data.get('converted_price'), 
-                   data.get('gap'),
-                   data.get('ai_report', "")))
-        conn.commit()
+    try:
+        get_engine().save_snapshot(data)
+    except Exception as e:
+        metrics.inc("db_errors_total", op="save_snapshot")
+        print(f"Error saving to DB: {e}")
+
+
+def save_many(snapshots):
+    """Lưu nhiều snapshot trong một transaction."""
+    try:
+        return get_engine().save_many(snapshots)
+    except Exception as e:
+        metrics.inc("db_errors_total", op="save_many")
+        print(f"Error saving to DB: {e}")
+        return 0
+
+
+def get_history(limit=30, start=None, end=None, bucket=None, columns=None, expand_runs=True):
+    """Lấy lịch sử dữ liệu. Xem StorageEngine.get_history."""
+    return get_engine().get_history(limit, start=start, end=end, bucket=bucket, columns=columns,
+                                    expand_runs=expand_runs)
+
+
+def recompute_derived():
+    """Tính lại converted_price và gap cho toàn bộ lịch sử."""
+    return get_engine().recompute_derived()
+
+
+def get_gap_stats():
+    """Lấy thống kê chênh lệch đã tính sẵn (xem StorageEngine.get_gap_stats)."""
+    try:
+        return get_engine().get_gap_stats()
+    except Exception as e:
+        metrics.inc("db_errors_total", op="get_gap_stats")
+        print(f"Error reading gap stats: {e}")
+        return {}
+
+
+def save_report(snapshot_ts, report, news_rowid=None):
+    """Gắn báo cáo AI vào snapshot đã lưu."""
+    try:
+        get_engine().save_report(snapshot_ts, report, news_rowid)
     except Exception as e:
+        metrics.inc("db_errors_total", op="save_report")
         print(f"Error saving to DB: {e}")
-    finally:
-        conn.close()
-
-def get_history(limit=30):
-    """Lấy lịch sử dữ liệu."""
-    if not os.path.exists(DB_FILE):
-        return pd.DataFrame()
-        
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query(f"SELECT * FROM gold_prices ORDER BY timestamp DESC LIMIT {limit}", conn)
-    conn.close()
-    
-    if not df.empty:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.sort_values(by='timestamp', ascending=True)
-    
-    return df
+
+
+def archive_snapshots(older_than_days=ARCHIVE_AFTER_DAYS, vacuum=True):
+    """Chuyển snapshot cũ sang archive dạng cột (xem StorageEngine.archive_snapshots)."""
+    return get_engine().archive_snapshots(older_than_days, vacuum=vacuum)
+
+
+def ingest_news(items):
+    """Lưu các tiêu đề tin tức chưa thấy; trả về danh sách (title, url) mới."""
+    try:
+        fresh = get_engine().ingest_news(items)
+        metrics.inc("news_ingested_total", len(fresh))
+        return fresh
+    except Exception as e:
+        metrics.inc("db_errors_total", op="ingest_news")
+        print(f"Error saving news: {e}")
+        return []
+
+
+def get_news(since=None, limit=None, until=None):
+    """Tiêu đề tin tức đã lưu, mới nhất trước (xem StorageEngine.get_news)."""
+    try:
+        return get_engine().get_news(since, limit, until)
+    except Exception as e:
+        metrics.inc("db_errors_total", op="get_news")
+        print(f"Error reading news: {e}")
+        return []
+
+
+def get_news_since_last_report(limit=None):
+    """Tiêu đề tin tức chưa gửi và mốc tin tức (xem StorageEngine.get_news_since_last_report)."""
+    try:
+        return get_engine().get_news_since_last_report(limit)
+    except Exception as e:
+        metrics.inc("db_errors_total", op="get_news")
+        print(f"Error reading news: {e}")
+        return [], None
+
+
+def get_latest_snapshot():
+    """Lấy snapshot mới nhất, hoặc None."""
+    return get_engine().get_latest_snapshot()
+
+
+def get_report(snapshot_ts):
+    """Lấy báo cáo AI của một snapshot (tải khi cần)."""
+    return get_engine().get_report(snapshot_ts)
+
+
+def get_latest_report():
+    """Lấy (timestamp, báo cáo) AI mới nhất."""
+    return get_engine().get_latest_report()
@@ -0,0 +1,165 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from gold_tracker import metrics
+from gold_tracker.storage import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Sau khi nhận một yêu cầu ghi, writer chờ thêm tối đa chừng này giây để gom các yêu cầu tiếp theo.
+WRITE_BEHIND_DELAY = float(os.getenv("WRITE_BEHIND_DELAY", "0.5"))
+
+# Số yêu cầu tối đa trong một transaction.
+WRITE_BEHIND_MAX_BATCH = 500
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Hàng đợi ghi snapshot/báo cáo vào SQLite bằng một thread nền.
+
+    Người gọi (ví dụ script Streamlit) chỉ đưa dữ liệu vào hàng đợi rồi trả về ngay. Thread
+    writer gom các yêu cầu đến trong WRITE_BEHIND_DELAY giây thành một transaction: snapshot
+    trùng timestamp chỉ giữ bản cuối, snapshot được ghi trước báo cáo gắn vào chúng.
+    Dữ liệu còn trong hàng đợi được ghi khi tiến trình thoát (atexit).
+    """
+
+    def __init__(self, engine=None, delay=WRITE_BEHIND_DELAY, max_batch=WRITE_BEHIND_MAX_BATCH):
+        self._engine = engine
+        self.delay = delay
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="gold-write-behind", daemon=True)
+                    self._thread.start()
+
+    def put_snapshot(self, data):
+        """Đưa một snapshot (cùng khóa với storage.save_snapshot) vào hàng đợi."""
+        self._ensure_started()
+        # Thời điểm snapshot là lúc gọi, không phải lúc writer ghi.
+        self._queue.put(('snapshot', dict(data, timestamp=data.get('timestamp') or datetime.now())))
+
+    def put_report(self, snapshot_ts, report, news_rowid=None):
+        """
+        Đưa một báo cáo AI gắn với snapshot đã lưu (hoặc đang chờ trong hàng đợi) vào hàng đợi.
+
+        news_rowid là mốc tin tức lúc chọn tin cho prompt (xem storage.save_reports).
+        """
+        self._ensure_started()
+        self._queue.put(('report', (snapshot_ts, report, news_rowid)))
+
+    def _take_batch(self):
+        # Chờ yêu cầu đầu tiên, sau đó gom tiếp tới hết `delay` giây tính từ yêu cầu đó
+        # hoặc tới khi đủ max_batch, kể cả khi yêu cầu đến đều đặn.
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.delay
+        try:
+            while len(batch) < self.max_batch and batch[-1] is not _STOP:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            stop = batch[-1] is _STOP
+            items = [item for item in batch if item is not _STOP]
+            try:
+                if items:
+                    self._write(items)
+            except Exception as e:
+                metrics.inc("db_errors_total", op="write_behind")
+                logger.error(f"Write-behind batch of {len(items)} failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, items):
+        snapshots = {}
+        reports = []
+        for kind, payload in items:
+            if kind == 'snapshot':
+                # Cùng timestamp: bản sau thay bản trước.
+                snapshots[payload['timestamp']] = payload
+            elif payload[0] in snapshots:
+                # Báo cáo của snapshot cùng lô đi kèm snapshot, để snapshot đó có dòng riêng
+                # thay vì bị gộp vào chuỗi giá không đổi trước nó.
+                snapshots[payload[0]] = dict(snapshots[payload[0]], ai_report=payload[1], news_rowid=payload[2])
+            else:
+                reports.append(payload)
+        engine = self._engine or get_engine()
+        if snapshots:
+            engine.save_many(snapshots.values())
+        if reports:
+            engine.save_reports(reports)
+        self.batches += 1
+        self.requests += len(items)
+        metrics.inc("write_behind_batches_total")
+
+    def flush(self, timeout=None):
+        """
+        Chờ tới khi mọi yêu cầu đã đưa vào được ghi xong.
+
+        Returns:
+            bool: False nếu hết `timeout` giây mà hàng đợi chưa rỗng.
+        """
+        if self._thread is None:
+            return True
+        done = threading.Event()
+
+        def wait():
+            self._queue.join()
+            done.set()
+
+        threading.Thread(target=wait, daemon=True).start()
+        return done.wait(timeout)
+
+    def close(self, timeout=10):
+        """Ghi nốt hàng đợi và dừng thread writer."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Trả về hàng đợi ghi dùng chung cho tiến trình; được flush khi tiến trình thoát."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteBehindQueue()
+                atexit.register(_writer.close)
+    return _writer
+
+
+def save_snapshot_async(data):
+    """Như storage.save_snapshot nhưng không chờ SQLite (xem WriteBehindQueue)."""
+    get_writer().put_snapshot(data)
+
+
+def save_report_async(snapshot_ts, report, news_rowid=None):
+    """Như storage.save_report nhưng không chờ SQLite."""
+    get_writer().put_report(snapshot_ts, report, news_rowid)
@@ -2,25 +2,177 @@ import argparse
 import sys
 import os
 from dotenv import load_dotenv
-from gold_tracker.data_fetcher import get_global_gold_price, get_usd_vnd_rate, get_sjc_gold_price, fetch_gold_news
+from gold_tracker.orchestrator import fetch_all_sources, format_source_status, is_fresh
 from gold_tracker.calculator import calculate_converted_global_price, calculate_gap
-from gold_tracker.llm_analyzer import get_gold_market_analysis
-from gold_tracker.storage import save_snapshot
+from gold_tracker.storage import save_snapshot, get_gap_stats, get_history, archive_snapshots, ingest_news
+from gold_tracker.data_fetcher import format_headlines
+from gold_tracker.archive import ARCHIVE_AFTER_DAYS
+from gold_tracker.collector import COLLECT_INTERVAL, METRICS_FILE, run_collector
+from gold_tracker import metrics
 import logging
 
+# gold_tracker.llm_analyzer (LangChain) chỉ được import ở bước phân tích AI để `--no-ai`
+# và `collect` khởi động nhanh; xem benchmarks/bench_import.py.
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def generate_report(data_context, stream=False):
+    """Tạo báo cáo AI, in ra terminal và trả về nội dung báo cáo, hoặc None nếu tạo lỗi."""
+    from gold_tracker.llm_analyzer import ReportGenerationError, get_gold_market_analysis, stream_gold_market_analysis
+
+    if stream:
+        print("\n" + "="*50)
+        print("       GOLD MARKET INTELLIGENCE REPORT       ")
+        print("="*50 + "\n")
+        chunks = []
+        try:
+            for chunk in stream_gold_market_analysis(data_context):
+                chunks.append(chunk)
+                print(chunk, end="", flush=True)
+        except ReportGenerationError as e:
+            # Báo cáo dở dang không được lưu, để backfill-reports tạo lại sau.
+            print(f"\n\n❌ {e}")
+            return None
+        report = "".join(chunks)
+        print("\n\n" + "="*50)
+    else:
+        try:
+            report = get_gold_market_analysis(data_context)
+        except ReportGenerationError as e:
+            print(f"❌ {e}")
+            return None
+
+        print("\n" + "="*50)
+        print("       GOLD MARKET INTELLIGENCE REPORT       ")
+        print("="*50 + "\n")
+        print(report)
+        print("\n" + "="*50)
+
+    return report
+
+def run_backtest(workers=None, lag=1, top=10):
+    """Chạy lưới chiến lược mặc định trên toàn bộ lịch sử và in các chiến lược tốt nhất."""
+    from gold_tracker import backtest
+
+    market = backtest.load_market(get_history(limit=None, columns=backtest.HISTORY_COLUMNS, expand_runs=True))
+    if len(market['ask']) < 2:
+        print("❌ Not enough saved snapshots to backtest. Run `python main.py collect` first.")
+        sys.exit(1)
+    strategies = backtest.default_grid(market)
+    results, rate = backtest.run_grid(market, strategies, workers=workers, lag=lag)
+    results.sort(key=lambda r: r['total_return'], reverse=True)
+
+    print(f"📈 {len(strategies)} strategies on {len(market['ask']):,} snapshots: {rate:,.0f} strategies/sec")
+    print(f"   Buy and hold: {backtest.buy_and_hold(market):+.2%}")
+    print(f"{'strategy':28}{'return':>9}{'trades':>8}{'win':>7}{'exposure':>10}{'max dd':>9}")
+    for r in results[:top]:
+        s = r['strategy']
+        name = f"{s.kind} {s.entry:g}/{s.exit:g}" + (f" w={s.window}" if s.kind == 'zscore' else "")
+        win = f"{r['win_rate']:.0%}" if r['win_rate'] is not None else "-"
+        print(f"{name:28}{r['total_return']:>+9.2%}{r['trades']:>8}{win:>7}{r['exposure']:>10.0%}{r['max_drawdown']:>9.2%}")
+
+def run_backfill(limit=None, concurrency=None, rate=None, retries=None, batch_size=None):
+    """Tạo báo cáo AI hàng loạt cho các snapshot chưa có báo cáo và in thông lượng."""
+    from gold_tracker import llm_analyzer
+    from gold_tracker.backfill import BACKFILL_BATCH_SIZE, backfill_reports
+
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key or "your_openrouter_api_key_here" in api_key:
+        print("❌ OPENROUTER_API_KEY not found or invalid in .env file.")
+        sys.exit(1)
+    concurrency = concurrency or llm_analyzer.BACKFILL_CONCURRENCY
+    rate = rate or llm_analyzer.BACKFILL_REQUESTS_PER_SECOND
+    chain = llm_analyzer.get_batch_chain(
+        api_key, llm_analyzer._get_model_name(), requests_per_second=rate,
+        retries=llm_analyzer.BACKFILL_RETRIES if retries is None else retries,
+    )
+    print(f"🧠 Backfilling AI reports ({concurrency} concurrent, ≤ {rate:g} requests/s)...")
+    stats = backfill_reports(limit=limit, concurrency=concurrency, chain=chain,
+                             batch_size=batch_size or BACKFILL_BATCH_SIZE)
+    if not stats['selected']:
+        print("✅ Every saved snapshot already has a report.")
+        return
+    print(f"✅ Saved {stats['saved']}/{stats['selected']} reports in {stats['seconds']:.1f}s "
+          f"({stats['reports_per_minute']:.1f} reports/min), {stats['failed']} failed.")
+
+def run_backfill_market(period="5d", interval="5m", max_gap=None):
+    """Ghi nến intraday của vàng thế giới và tỷ giá vào các khoảng lịch sử chưa có snapshot."""
+    from gold_tracker.backfill import BACKFILL_MAX_GAP, backfill_market
+
+    print(f"📥 Downloading {interval} bars for the last {period}...")
+    stats = backfill_market(period=period, interval=interval,
+                            max_gap=BACKFILL_MAX_GAP if max_gap is None else max_gap)
+    if not stats['bars']:
+        print("❌ No market data downloaded.")
+        sys.exit(1)
+    print(f"✅ Saved {stats['saved']} of {stats['bars']} bars ({stats['covered']} already covered, "
+          f"{stats['skipped']} outside a fillable gap).")
+
 def main():
     parser = argparse.ArgumentParser(description="Vietnam Gold Price Tracker & AI Forecaster")
     parser.add_argument("--mock", action="store_true", help="Use mock data for testing")
+    parser.add_argument("--stream", action="store_true", help="Print the AI report as it is generated")
+    parser.add_argument("--no-ai", action="store_true", help="Skip the AI report (no LangChain import, no API key needed)")
+    parser.add_argument("--metrics", action="store_true", help="Print per-stage timings in Prometheus text format at the end")
+    subparsers = parser.add_subparsers(dest="command")
+    collect_parser = subparsers.add_parser("collect", help="Poll market data on a schedule and save snapshots (no AI)")
+    collect_parser.add_argument("--interval", type=float, default=COLLECT_INTERVAL, help=f"Seconds between polls (default COLLECT_INTERVAL={COLLECT_INTERVAL}); saved in the database so the dashboard knows when data is stale")
+    collect_parser.add_argument("--once", action="store_true", help="Collect a single snapshot and exit")
+    collect_parser.add_argument("--metrics-file", default=METRICS_FILE, help="Write Prometheus metrics to this file after each poll")
+    collect_parser.add_argument("--archive", action="store_true", help="Once a day, move old snapshots to the columnar archive")
+    archive_parser = subparsers.add_parser("archive", help="Move old snapshots from SQLite to the columnar archive and compact the database")
+    archive_parser.add_argument("--older-than-days", type=float, default=ARCHIVE_AFTER_DAYS, help=f"Archive snapshots older than this (default {ARCHIVE_AFTER_DAYS})")
+    archive_parser.add_argument("--no-vacuum", action="store_true", help="Skip VACUUM after deleting archived rows")
+    backtest_parser = subparsers.add_parser("backtest", help="Backtest gap threshold and z-score strategies on the saved history")
+    backtest_parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count, 1 = no pool)")
+    backtest_parser.add_argument("--lag", type=int, default=1, help="Snapshots between a signal and its fill (default 1)")
+    backtest_parser.add_argument("--top", type=int, default=10, help="Number of best strategies to print")
+    backfill_parser = subparsers.add_parser("backfill-reports", help="Generate AI reports for saved snapshots that have none")
+    backfill_parser.add_argument("--limit", type=int, default=None, help="Newest N snapshots only (default: all)")
+    backfill_parser.add_argument("--concurrency", type=int, default=None, help="Concurrent LLM requests")
+    backfill_parser.add_argument("--rate", type=float, default=None, help="Max LLM requests per second (token bucket)")
+    backfill_parser.add_argument("--retries", type=int, default=None, help="Retries per report with exponential backoff")
+    backfill_parser.add_argument("--batch-size", type=int, default=None, help="Reports per database transaction")
+    market_parser = subparsers.add_parser("backfill-market", help="Fill gaps in the saved history with intraday world gold and USD/VND bars")
+    market_parser.add_argument("--period", default="5d", help="How far back to download, yfinance syntax (default 5d)")
+    market_parser.add_argument("--interval", default="5m", choices=("1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h"),
+                               help="Bar size (default 5m)")
+    market_parser.add_argument("--max-gap", type=int, default=None,
+                               help="Only fill gaps between saved snapshots up to this many seconds long")
     args = parser.parse_args()
 
     load_dotenv()
+
+    if args.command == "collect":
+        run_collector(interval=args.interval, iterations=1 if args.once else None, metrics_file=args.metrics_file,
+                      archive=args.archive)
+        return
+
+    if args.command == "archive":
+        moved = archive_snapshots(args.older_than_days, vacuum=not args.no_vacuum)
+        print(f"📦 Archived {moved} snapshot(s) older than {args.older_than_days:g} days.")
+        return
+
+    if args.command == "backtest":
+        run_backtest(workers=args.workers, lag=args.lag, top=args.top)
+        return
+
+    if args.command == "backfill-reports":
+        run_backfill(limit=args.limit, concurrency=args.concurrency, rate=args.rate, retries=args.retries,
+                     batch_size=args.batch_size)
+        return
+
+    if args.command == "backfill-market":
+        run_backfill_market(period=args.period, interval=args.interval, max_gap=args.max_gap)
+        return
+
+    if args.metrics:
+        metrics.enable()
     
     api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key or "your_openrouter_api_key_here" in api_key:
+    if not args.no_ai and (not api_key or "your_openrouter_api_key_here" in api_key):
         print("⚠️  WARNING: OPENROUTER_API_KEY not found or invalid in .env file.")
         print("   AI Analysis will fail. Please set your API key in .env.")
         print("   Get a key from: https://openrouter.ai/keys\n")
@@ -35,30 +187,40 @@ def main():
         sjc_data = {'buy': 78000000, 'sell': 80000000}
         news = "- Gold prices hit record high.\n- Fed likely to cut rates."
         print("Using MOCK data.")
+        fresh = True
     else:
-        global_price = get_global_gold_price()
-        exchange_rate = get_usd_vnd_rate()
-        sjc_data = get_sjc_gold_price()
-        news = fetch_gold_news()
-
-    # Handle missing data
-    if global_price is None:
-        print("❌ Failed to fetch Global Gold Price. Using fallback (2600 USD/oz).")
-        global_price = 2600.0 # Approximate current price
-    else:
-        print(f"✅ Giá vàng quốc tế: ${global_price:.2f}/lượng")
+        result = fetch_all_sources()
+        market = result['values']['market'] or {}
+        global_price = market.get('global_price')
+        exchange_rate = market.get('exchange_rate')
+        sjc_data = result['values']['sjc_data']
+        headlines = result['values']['news']
+        news = None
+        if headlines:
+            # Lệnh chạy một lần cũng ghi database như collector, nên lưu luôn các tiêu đề mới.
+            ingest_news(headlines)
+            news = format_headlines(headlines)
+        print(f"⏱️  {format_source_status(result)}")
+        fresh = is_fresh(result, ('market', 'sjc_data'))
+        for name, info in result['sources'].items():
+            if info['status'] == 'stale':
+                print(f"⚠️  {name}: source unavailable, using last known value from {info['as_of']:%Y-%m-%d %H:%M}.")
 
-    if exchange_rate is None:
-        print("❌ Failed to fetch USD/VND Rate. Using fallback (25,400 VND).")
-        exchange_rate = 25400.0
-    else:
-        print(f"✅ USD/VND Rate: {exchange_rate:,.0f} VND")
+    # Handle missing data: không có dữ liệu thật nào để dùng thì dừng, không đoán giá.
+    if global_price is None or exchange_rate is None:
+        print("❌ Failed to fetch Global Gold Price / USD/VND Rate and no previous data is available.")
+        sys.exit(1)
+    print(f"✅ Giá vàng quốc tế: ${global_price:.2f}/lượng")
+    print(f"✅ USD/VND Rate: {exchange_rate:,.0f} VND")
 
     if sjc_data is None:
-        print("❌ Failed to fetch SJC Price. Using fallback (Sell: 85,000,000 VND).")
-        sjc_data = {'buy': 83000000, 'sell': 85000000}
-    else:
-        print(f"✅ Giá vàng bán ra của SJC: {sjc_data['sell']:,.0f} VND/lượng")
+        print("❌ Failed to fetch SJC Price and no previous data is available.")
+        sys.exit(1)
+    print(f"✅ Giá vàng bán ra của SJC: {sjc_data['sell']:,.0f} VND/lượng")
+
+    if news is None:
+        print("❌ Failed to fetch news.")
+        news = "Không có tin tức vàng/kinh tế mới nhất được lấy."
 
     # 2. Calculate
     converted_price = calculate_converted_global_price(global_price, exchange_rate)
@@ -68,37 +230,47 @@ def main():
     print(f"📉 Chênh lệnh: {gap:.2f} Triệu VND/lượng")
     
     # 3. AI Analysis
-    print("\n🧠 Generating AI Analysis (this may take a few seconds)...")
-    
-    data_context = {
-        "global_price": global_price,
-        "exchange_rate": exchange_rate,
-        "converted_price": converted_price,
-        "sjc_price": sjc_data['sell'],
-        "gap": gap,
-        "news": news
-    }
-
-    report = get_gold_market_analysis(data_context)
-    
-    print("\n" + "="*50)
-    print("       GOLD MARKET INTELLIGENCE REPORT       ")
-    print("="*50 + "\n")
-    print(report)
-    print("\n" + "="*50)
+    news_rowid = None
+    if args.no_ai:
+        print("\n⏭️  AI analysis skipped (--no-ai).")
+        report = None
+    else:
+        print("\n🧠 Generating AI Analysis (this may take a few seconds)...")
+        if not args.mock:
+            # Prompt chỉ nhận tiêu đề chưa gửi trong báo cáo trước (vừa được lưu ở trên).
+            from gold_tracker.llm_analyzer import select_news
+            news, news_rowid = select_news(fallback=news)
+        data_context = {
+            "global_price": global_price,
+            "exchange_rate": exchange_rate,
+            "converted_price": converted_price,
+            "sjc_price": sjc_data['sell'],
+            "gap": gap,
+            "news": news,
+            "news_rowid": news_rowid,
+            "gap_stats": get_gap_stats()
+        }
+        report = generate_report(data_context, stream=args.stream)
 
     # 4. Save to DB
-    print("💾 Saving snapshot to database...")
-    save_snapshot({
-        "global_price": global_price,
-        "exchange_rate": exchange_rate,
-        "sjc_sell": sjc_data['sell'],
-        "sjc_buy": sjc_data['buy'],
-        "converted_price": converted_price,
-        "gap": gap,
-        "ai_report": report
-    })
-    print("✅ Data saved.")
+    if not fresh:
+        print("⚠️  Some prices are stale; snapshot not saved.")
+    else:
+        print("💾 Saving snapshot to database...")
+        save_snapshot({
+            "global_price": global_price,
+            "exchange_rate": exchange_rate,
+            "sjc_sell": sjc_data['sell'],
+            "sjc_buy": sjc_data['buy'],
+            "converted_price": converted_price,
+            "gap": gap,
+            "ai_report": report,
+            "news_rowid": news_rowid,
+        })
+        print("✅ Data saved.")
+
+    if args.metrics:
+        print("\n" + metrics.render_prometheus(), end="")
 
 if __name__ == "__main__":
     main()